@@ -1,16 +1,24 @@
 import { defineTool, createMcpServer } from './index.js';
 import WebSocket from 'ws';
 
+type Pending = { resolve: (value: any) => void; reject: (reason: any) => void; timer: ReturnType<typeof setTimeout>; chunks: any[] };
+
 class RagWsClient {
     url: string;
     ws: any;
     ready: boolean;
     queue: Array<() => void>;
-    constructor(url: string) {
+    nextId: number;
+    pending: Map<number, Pending>;
+    timeoutMs: number;
+    constructor(url: string, timeoutMs = 30000) {
         this.url = url;
         this.ws = null;
         this.ready = false;
         this.queue = [];
+        this.nextId = 1;
+        this.pending = new Map();
+        this.timeoutMs = timeoutMs;
         this.connect();
     }
     connect() {
@@ -20,23 +28,50 @@ class RagWsClient {
             this.queue.forEach(fn => fn());
             this.queue = [];
         });
-        this.ws.on('close', () => { this.ready = false; });
+        // 按 id 分发应答：同一连接上可以有多个请求同时在途，服务端可乱序返回
+        this.ws.on('message', (msg: string) => {
+            let res: any;
+            try { res = JSON.parse(msg); } catch { return; }
+            const entry = this.pending.get(res.id);
+            if (!entry) return;
+            // 流式工具先发送若干 chunk 帧，最后以 end 帧结束，这里收齐后一次性返回
+            if (res.chunk !== undefined) { entry.chunks.push(res.chunk); return; }
+            this.pending.delete(res.id);
+            clearTimeout(entry.timer);
+            if (res.error !== undefined) {
+                // 服务端排队已满时带 busy 与建议的重试间隔 retry_after（秒）
+                const err: any = new Error(res.error);
+                if (res.busy) { err.busy = true; err.retryAfter = res.retry_after; }
+                entry.reject(err);
+            }
+            else if (res.end) entry.resolve(entry.chunks);
+            else entry.resolve(res.result);
+        });
+        this.ws.on('close', () => { this.ready = false; this.failAll(new Error('WebSocket closed')); });
         this.ws.on('error', () => { this.ready = false; });
     }
+    failAll(err: Error) {
+        this.pending.forEach(entry => { clearTimeout(entry.timer); entry.reject(err); });
+        this.pending.clear();
+    }
     call(func: string, params: Record<string, any>) {
         return new Promise((resolve, reject) => {
+            const id = this.nextId++;
             const send = () => {
-                this.ws.once('message', (msg: string) => {
-                    try {
-                        const res = JSON.parse(msg);
-                        resolve(res.result);
-                    } catch (e) { reject(e); }
-                });
-                // 发送 { func, params } 格式，兼容服务端
-                this.ws.send(JSON.stringify({ func, params }));
+                const timer = setTimeout(() => {
+                    this.pending.delete(id);
+                    reject(new Error(`${func} timed out after ${this.timeoutMs}ms`));
+                }, this.timeoutMs);
+                this.pending.set(id, { resolve, reject, timer, chunks: [] });
+                // 发送 { id, func, params, deadline_ms } 格式，应答带回相同 id；超时后服务端不再执行该请求
+                this.ws.send(JSON.stringify({ id, func, params, deadline_ms: this.timeoutMs }));
             };
             if (this.ready) send();
-            else this.queue.push(send);
+            else {
+                // 连接已断开时重新连接，open 后发送排队的请求
+                if (!this.ws || this.ws.readyState === WebSocket.CLOSED) this.connect();
+                this.queue.push(send);
+            }
         });
     }
 }
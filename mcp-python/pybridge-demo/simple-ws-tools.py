@@ -1,7 +1,7 @@
 import json
 from fastapi import FastAPI, WebSocket
 import uvicorn
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validate_call
 from typing import Optional, Union, List, NamedTuple
 import requests
 import logging
@@ -72,6 +72,8 @@ def get_city_weather_by_city_name(city_code: str) -> Optional[CityWeather]:
     except Exception as e:
         return None
 
+# ws-tools-client.py 从命令行传入的 city_code 是字符串，按注解转换成 int
+@validate_call
 async def weather(city_code: int) -> str:
     city_weather = get_city_weather_by_city_name(str(city_code))
     return str(city_weather)
@@ -0,0 +1,145 @@
+import asyncio
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+# 当前请求的截止时间（事件循环时间）；下游 WsToolClient 调用会把剩余时间继续传下去
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('ws_deadline', default=None)
+
+
+class BusyError(RuntimeError):
+    """排队已满，请求被直接拒绝；retry_after 为建议的重试间隔（秒）。"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def current_deadline() -> Optional[float]:
+    return _deadline.get()
+
+
+def remaining_seconds() -> Optional[float]:
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - asyncio.get_running_loop().time()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]):
+    """在代码块内把当前截止时间收紧到 deadline（只会收紧，不会放宽上游请求的截止时间）。"""
+    current = _deadline.get()
+    if deadline is None or (current is not None and current <= deadline):
+        yield current
+        return
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+class _Limiter:
+    """单个并发上限：信号量 + 执行耗时的指数滑动平均（用于估算 retry_after）。"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.waiting = 0
+        self.avg_latency = 0.0
+
+    def record(self, elapsed: float):
+        self.avg_latency = elapsed if not self.avg_latency else 0.8 * self.avg_latency + 0.2 * elapsed
+
+    def retry_after(self) -> float:
+        # 排在前面的请求按并发上限分批完成的大致时间
+        return max(0.05, self.avg_latency * (self.waiting + 1) / self.limit)
+
+
+class AdmissionController:
+    """工具调用的准入控制：全局与单工具并发上限、有界等待队列、截止时间。
+
+    有空闲槽位时直接执行；否则进入等待队列，队列已满时立即以 BusyError 拒绝，
+    等到截止时间仍未轮到时以 DeadlineExceeded 结束，不再执行。
+    """
+
+    def __init__(self, global_limit: int, queue_size: int):
+        self.global_limiter = _Limiter(global_limit)
+        self.queue_size = queue_size
+        self.waiting = 0
+        self.rejected = 0
+        self._tools: Dict[str, _Limiter] = {}
+
+    def _tool_limiter(self, tool: str, limit: Optional[int]) -> Optional[_Limiter]:
+        if not limit:
+            return None
+        limiter = self._tools.get(tool)
+        if limiter is None:
+            limiter = self._tools[tool] = _Limiter(limit)
+        return limiter
+
+    @asynccontextmanager
+    async def admit(self, tool: str, limit: Optional[int] = None, deadline: Optional[float] = None):
+        loop = asyncio.get_running_loop()
+        limiters = [lim for lim in (self._tool_limiter(tool, limit), self.global_limiter) if lim is not None]
+        if deadline is not None and deadline <= loop.time():
+            raise DeadlineExceeded(f"{tool} 到达时已超过截止时间，未执行")
+        if any(lim.semaphore.locked() for lim in limiters) and self.waiting >= self.queue_size:
+            self.rejected += 1
+            retry_after = max(lim.retry_after() for lim in limiters)
+            raise BusyError(f"服务繁忙，{tool} 排队已满 ({self.waiting}/{self.queue_size})", round(retry_after, 3))
+        acquired = []
+        self.waiting += 1
+        try:
+            # 先占单工具槽位再占全局槽位，避免重型工具排队时占着全局槽位
+            async with asyncio.timeout_at(deadline):
+                for lim in limiters:
+                    lim.waiting += 1
+                    try:
+                        await lim.semaphore.acquire()
+                    finally:
+                        lim.waiting -= 1
+                    acquired.append(lim)
+        except TimeoutError:
+            for lim in acquired:
+                lim.semaphore.release()
+            raise DeadlineExceeded(f"{tool} 排队超过截止时间，已放弃执行") from None
+        except BaseException:
+            for lim in acquired:
+                lim.semaphore.release()
+            raise
+        finally:
+            self.waiting -= 1
+        token = _deadline.set(deadline)
+        start = loop.time()
+        try:
+            # 执行阶段同样受截止时间约束，超时后取消，调用方已不再等待结果
+            async with asyncio.timeout_at(deadline) as timeout:
+                yield
+        except TimeoutError:
+            if timeout.expired():
+                raise DeadlineExceeded(f"{tool} 执行超过截止时间，已取消") from None
+            raise
+        finally:
+            _deadline.reset(token)
+            elapsed = loop.time() - start
+            for lim in acquired:
+                lim.record(elapsed)
+                lim.semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "global_limit": self.global_limiter.limit,
+            "queue_size": self.queue_size,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "tools": {
+                name: {"limit": lim.limit, "waiting": lim.waiting, "avg_latency_ms": round(lim.avg_latency * 1000, 2)}
+                for name, lim in self._tools.items()
+            },
+        }
@@ -0,0 +1,4 @@
+"""RAG 服务基准测试：合成语料、负载生成（进程内 / WebSocket）、结果保存与对比。
+
+在 mcp-python/rag 目录下运行 ``python -m bench --help``。
+"""
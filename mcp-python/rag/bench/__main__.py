@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Dict, List
+
+RAG_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, RAG_DIR)
+
+from bench import corpus
+from bench.loadgen import DEFAULT_MIX, HOT_QUERIES, build_ops, parse_mix, report, run_ops
+from bench.targets import SERVICES
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger("bench")
+
+DEFAULT_URIS = {
+    'vector_service': 'ws://127.0.0.1:9100/ws',
+    'rag_service': 'ws://127.0.0.1:9200/ws',
+    'url_assistant': 'ws://127.0.0.1:9101/ws',
+}
+
+
+def configure_inprocess_env(args) -> str:
+    """进程内模式：在 import 服务模块之前设置环境变量。返回本次使用的向量存储目录。"""
+    if not args.real_model:
+        # 确定性哈希向量，不下载模型，结果可复现
+        os.environ["RAG_EMBEDDING_BACKEND"] = "stub"
+    store_dir = args.store_dir or tempfile.mkdtemp(prefix="rag-bench-")
+    os.environ["RAG_VECTOR_STORE_DIR"] = store_dir
+    # 服务自身的 INFO 日志（每批导入一条）会干扰结果，除非显式指定
+    os.environ.setdefault("WS_LOG_LEVEL", "WARNING")
+    return store_dir
+
+
+def load_docs(args):
+    if args.corpus:
+        for i, doc in enumerate(corpus.read_jsonl(args.corpus, args.docs)):
+            doc_id = doc.get("id") or corpus.doc_id(i)
+            yield {**doc, "id": doc_id, "metadata": {**doc.get("metadata", {}), "doc_id": doc_id}}
+    else:
+        yield from corpus.generate_docs(args.docs, args.seed)
+
+
+async def ingest(target, args) -> Dict:
+    """分批写入语料，返回导入耗时和速率；按需在导入后重建索引。"""
+    start = time.perf_counter()
+    count = 0
+    batch = []
+    for doc in load_docs(args):
+        batch.append(doc)
+        if len(batch) >= args.ingest_batch:
+            await _add_batch(target, batch, args.store)
+            count += len(batch)
+            batch = []
+            if count % (args.ingest_batch * 20) == 0:
+                logger.info(f"已导入 {count} 篇")
+    if batch:
+        await _add_batch(target, batch, args.store)
+        count += len(batch)
+    elapsed = time.perf_counter() - start
+    result = {"docs": count, "seconds": round(elapsed, 3), "docs_per_sec": round(count / elapsed, 1) if elapsed else None}
+    if args.index_kind:
+        rebuilt = await target.ingest('rag_rebuild_index', store=args.store, kind=args.index_kind)
+        if 'error' in rebuilt:
+            raise RuntimeError(f"重建索引失败: {rebuilt['error']}")
+        result["index"] = rebuilt
+    return result
+
+
+async def _add_batch(target, docs, store: str):
+    result = await target.ingest('rag_add_batch', docs=docs, store=store)
+    if 'error' in result:
+        raise RuntimeError(f"导入失败: {result['error']}")
+
+
+def environment(args) -> Dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAG_DIR, capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": commit,
+        "embedding": os.environ.get("RAG_EMBEDDING_BACKEND", "hf"),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+async def run(args) -> Dict:
+    from bench.targets import InProcessTarget, WsTarget
+    mix = parse_mix(args.mix)
+    if args.service == 'url_assistant':
+        # query_url 固定检索 url store
+        args.store = 'url'
+    if args.mode == 'ws':
+        if args.service == 'url_assistant' and not args.no_ingest:
+            raise SystemExit("WebSocket 模式下 url_assistant 检索线上 url store，不能导入合成语料，请加 --no-ingest")
+        target = WsTarget(args.service, args.uri or DEFAULT_URIS[args.service], args.connections,
+                          args.ingest_uri or DEFAULT_URIS['vector_service'], args.encoding)
+    else:
+        target = InProcessTarget(args.service)
+
+    await target.start()
+    try:
+        ingest_result = None if args.no_ingest else await ingest(target, args)
+        if ingest_result:
+            logger.info(f"导入完成: {ingest_result}")
+        if args.corpus:
+            docs = list(load_docs(args))
+            queries = corpus.generate_queries(args.requests + args.warmup + HOT_QUERIES, len(docs), args.seed,
+                                              doc_at=docs.__getitem__)
+        else:
+            queries = corpus.generate_queries(args.requests + args.warmup + HOT_QUERIES, args.docs, args.seed)
+        common = dict(store=args.store, top_k=args.top_k, score_threshold=args.score_threshold,
+                      add_batch=args.add_batch, seed=args.seed, mode=args.retrieval_mode)
+        if args.warmup:
+            warmup_ops = build_ops(args.service, mix, args.warmup, queries[-args.warmup:],
+                                   add_start=args.docs + 10_000_000, **common)
+            await run_ops(target, warmup_ops, args.concurrency)
+        ops = build_ops(args.service, mix, args.requests, queries[:-args.warmup or None],
+                        add_start=args.docs, **common)
+        samples, elapsed = await run_ops(target, ops, args.concurrency)
+        server_metrics = await target.server_metrics()
+        if args.mode == 'ws' and ingest_result and not args.keep_store:
+            # 合成语料不留在线上服务里
+            await target.ingest('rag_drop_store', store=args.store, delete_files=True)
+    finally:
+        await target.close()
+
+    config = {k: v for k, v in vars(args).items() if k not in ('command', 'func')}
+    return {
+        "config": config,
+        "env": environment(args),
+        "ingest": ingest_result,
+        **report(samples, elapsed),
+        "server_metrics": server_metrics,
+    }
+
+
+def print_summary(result: Dict):
+    print(f"{'kind':<10}{'count':>8}{'errors':>8}{'rps':>10}{'p50_ms':>10}{'p95_ms':>10}{'p99_ms':>10}{'hit_rate':>10}")
+    rows = [("overall", result["overall"])] + list(result["by_kind"].items())
+    for kind, row in rows:
+        print(f"{kind:<10}{row['count']:>8}{row['errors']:>8}{_fmt(row['throughput_rps']):>10}{_fmt(row['p50_ms']):>10}"
+              f"{_fmt(row['p95_ms']):>10}{_fmt(row['p99_ms']):>10}{_fmt(row['hit_rate']):>10}")
+    for error in result.get("error_samples", []):
+        print(f"error: {error}")
+
+
+def _fmt(value) -> str:
+    return "-" if value is None else f"{value:g}"
+
+
+def cmd_run(args):
+    store_dir = configure_inprocess_env(args) if args.mode == 'inprocess' else None
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        if store_dir and not args.store_dir:
+            shutil.rmtree(store_dir, ignore_errors=True)
+    print_summary(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        logger.info(f"结果已保存: {args.output}")
+
+
+def cmd_corpus(args):
+    count = corpus.write_jsonl(args.output, corpus.generate_docs(args.docs, args.seed))
+    logger.info(f"已生成 {count} 篇文档: {args.output}")
+
+
+def cmd_compare(args):
+    """以第一个结果为基准，逐项列出吞吐与延迟分位数及相对变化。"""
+    runs: List[Dict] = []
+    for path in args.results:
+        with open(path, 'r', encoding='utf-8') as f:
+            runs.append(json.load(f))
+    base = runs[0]
+    metrics = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "hit_rate")
+    kinds = ["overall"] + [k for k in base["by_kind"] if k != "overall"]
+    print(f"{'run':<32}{'kind':<10}" + "".join(f"{m:>20}" for m in metrics))
+    for path, result in zip(args.results, runs):
+        for kind in kinds:
+            row = result["overall"] if kind == "overall" else result["by_kind"].get(kind)
+            base_row = base["overall"] if kind == "overall" else base["by_kind"].get(kind)
+            if row is None:
+                continue
+            cells = []
+            for m in metrics:
+                value, ref = row.get(m), (base_row or {}).get(m)
+                cell = _fmt(value)
+                if result is not base and value is not None and ref:
+                    cell += f" ({(value - ref) / ref * 100:+.1f}%)"
+                cells.append(f"{cell:>20}")
+            print(f"{os.path.basename(path)[:31]:<32}{kind:<10}" + "".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench", description="RAG 服务基准测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="导入语料并压测指定服务")
+    p.add_argument("--service", choices=SERVICES, default="vector_service")
+    p.add_argument("--mode", choices=("inprocess", "ws"), default="inprocess",
+                   help="inprocess：本进程内直接调用（默认使用 stub 向量，离线可跑）；ws：连接已运行的服务")
+    p.add_argument("--uri", help="ws 模式下被测服务地址，默认按服务取本机端口")
+    p.add_argument("--ingest-uri", help="ws 模式下导入语料所用的 vector_service 地址")
+    p.add_argument("--encoding", choices=("json", "msgpack"), default="json")
+    p.add_argument("--connections", type=int, default=1, help="ws 模式下的连接数，请求轮流使用")
+    p.add_argument("--concurrency", type=int, default=8, help="同时在途的请求数（闭环）")
+    p.add_argument("--requests", type=int, default=1000)
+    p.add_argument("--warmup", type=int, default=50, help="正式计时前的预热请求数")
+    p.add_argument("--mix", default=DEFAULT_MIX, help="请求组合，如 query=0.7,repeat=0.2,add=0.1")
+    p.add_argument("--docs", type=int, default=10_000, help="语料规模")
+    p.add_argument("--corpus", help="从 JSONL 文件读取语料（默认按 --seed 合成）")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--store", default=corpus.BENCH_STORE)
+    p.add_argument("--no-ingest", action="store_true", help="不导入语料，直接压测已有 store")
+    p.add_argument("--keep-store", action="store_true", help="ws 模式下结束后保留导入的 store（默认删除）")
+    p.add_argument("--ingest-batch", type=int, default=1000)
+    p.add_argument("--index-kind", help="导入后以该类型重建索引（flat / ivf_flat / ivf_pq / hnsw / pca_rescore / trunc_rescore / auto）")
+    p.add_argument("--top-k", type=int, default=5)
+    p.add_argument("--score-threshold", type=float)
+    p.add_argument("--retrieval-mode", choices=("dense", "lexical", "hybrid"),
+                   help="vector_service / rag_service 的检索方式（默认 dense）")
+    p.add_argument("--add-batch", type=int, default=32, help="add 请求每次写入的文档数")
+    p.add_argument("--real-model", action="store_true", help="进程内模式使用真实 embedding 模型")
+    p.add_argument("--store-dir", help="进程内模式的向量存储目录（默认临时目录，结束后删除）")
+    p.add_argument("--output", help="结果保存为 JSON 文件")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("corpus", help="生成合成语料 JSONL")
+    p.add_argument("--docs", type=int, default=10_000)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--output", required=True)
+    p.set_defaults(func=cmd_corpus)
+
+    p = sub.add_parser("compare", help="对比多次运行的结果 JSON（第一个为基准）")
+    p.add_argument("results", nargs="+")
+    p.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
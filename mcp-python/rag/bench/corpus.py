@@ -0,0 +1,84 @@
+import json
+import random
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+# 合成语料：仿照 data/url.json 的页面描述，用业务模块、对象、操作等词随机组合成中文文档。
+# 第 i 篇文档只由 (seed, i) 决定，百万级语料也不需要落盘即可复现；查询从某篇文档中截取片段生成，
+# 带有目标文档 id，可统计检索命中率。
+
+MODULES = ['客户', '联系人', '商机', '订单', '合同', '回款', '发票', '产品', '库存', '采购', '供应商', '员工',
+           '部门', '审批', '报表', '工单', '知识库', '营销活动', '线索', '费用', '项目', '任务', '日程', '公告']
+OBJECTS = ['列表', '详情', '设置', '统计', '明细', '模板', '分组', '标签', '权限', '日志', '看板', '导入记录']
+ACTIONS = ['查看', '新建', '编辑', '删除', '导出', '导入', '审批', '分配', '转移', '归档', '搜索', '筛选', '打印']
+QUALIFIERS = ['全部', '我负责的', '本部门', '待处理', '已完成', '最近30天', '本季度', '重点', '共享给我的', '已关闭']
+FILLERS = ['页面', '可以', '用于', '支持', '按照', '并且', '以及', '相关', '信息', '管理', '功能', '入口']
+
+BENCH_STORE = 'bench'
+
+
+class Query(NamedTuple):
+    text: str
+    # 生成该查询的文档 id，用于统计命中率
+    target: str
+
+
+def doc_id(i: int) -> str:
+    return f"doc-{i}"
+
+
+def make_doc(i: int, seed: int = 0) -> Dict:
+    rng = random.Random(f"{seed}:{i}")
+    module, obj = rng.choice(MODULES), rng.choice(OBJECTS)
+    title = f"{rng.choice(QUALIFIERS)}{module}{obj}"
+    words = [title, rng.choice(FILLERS)]
+    for _ in range(rng.randint(3, 8)):
+        words.append(rng.choice((rng.choice(ACTIONS) + rng.choice(MODULES), rng.choice(FILLERS),
+                                 rng.choice(QUALIFIERS) + rng.choice(OBJECTS))))
+    # 编号保证文档两两不同
+    words.append(f"编号{i}")
+    return {
+        "id": doc_id(i),
+        "content": "".join(words),
+        "metadata": {"doc_id": doc_id(i), "title": title, "url": f"/bench/{module}/{i}"},
+    }
+
+
+def generate_docs(n: int, seed: int = 0, start: int = 0) -> Iterator[Dict]:
+    for i in range(start, start + n):
+        yield make_doc(i, seed)
+
+
+def make_query(doc: Dict, rng: random.Random) -> Query:
+    """从文档中截取一段作为查询（去掉编号，模拟用户只记得大概描述）。"""
+    content = doc["content"]
+    if "编号" in content:
+        content = content[:content.rfind("编号")]
+    length = min(len(content), rng.randint(6, 16))
+    start = rng.randint(0, len(content) - length)
+    return Query(content[start:start + length], doc["id"])
+
+
+def generate_queries(n: int, corpus_size: int, seed: int = 0,
+                     doc_at: Optional[Callable[[int], Dict]] = None) -> List[Query]:
+    """生成 n 条查询；doc_at(i) 返回第 i 篇文档，默认为合成语料（从文件读入的语料需传入）。"""
+    doc_at = doc_at or (lambda i: make_doc(i, seed))
+    rng = random.Random(f"queries:{seed}")
+    return [make_query(doc_at(rng.randrange(corpus_size)), rng) for _ in range(n)]
+
+
+def write_jsonl(path: str, docs: Iterator[Dict]) -> int:
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for doc in docs:
+            f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def read_jsonl(path: str, limit: Optional[int] = None) -> Iterator[Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for n, line in enumerate(f):
+            if limit is not None and n >= limit:
+                return
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,146 @@
+import math
+import time
+import random
+import asyncio
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from bench.corpus import Query, generate_docs
+from bench.targets import QUERY_TOOLS, query_params, result_items
+
+# 负载生成：按查询组合（mix）生成确定的请求序列，由 concurrency 个协程闭环执行（每个协程收到应答后再发下一个），
+# 记录每个请求的耗时、是否出错及是否命中目标文档。
+#
+# 请求类型：
+#   query   从语料生成的查询，基本不重复（结果缓存命中率低）
+#   repeat  从少量热点查询中重复抽取（反映缓存命中时的延迟）
+#   add     批量写入新文档（仅 vector_service），与查询并发时可观察读写互相影响
+OP_KINDS = ('query', 'repeat', 'add')
+DEFAULT_MIX = 'query=1'
+HOT_QUERIES = 50
+
+
+class Op(NamedTuple):
+    kind: str
+    func: str
+    params: Dict
+    # 期望出现在结果中的文档 id；add 请求为 None
+    target: Optional[str] = None
+
+
+class Sample(NamedTuple):
+    kind: str
+    seconds: float
+    ok: bool
+    hit: Optional[bool]
+    error: Optional[str] = None
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """'query=0.7,repeat=0.2,add=0.1' -> 归一化后的权重。"""
+    mix = {}
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        kind, _, weight = part.partition('=')
+        if kind not in OP_KINDS:
+            raise ValueError(f"未知请求类型: {kind}，可选 {', '.join(OP_KINDS)}")
+        mix[kind] = float(weight or 1)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError(f"请求组合权重之和必须大于 0: {spec}")
+    return {kind: weight / total for kind, weight in mix.items()}
+
+
+def build_ops(service: str, mix: Dict[str, float], count: int, queries: List[Query], store: str, top_k: int,
+              score_threshold: Optional[float] = None, add_batch: int = 32, add_start: int = 0,
+              seed: int = 0, mode: Optional[str] = None) -> List[Op]:
+    if 'add' in mix and service != 'vector_service':
+        raise ValueError("add 请求只适用于 vector_service")
+    rng = random.Random(f"ops:{seed}")
+    hot = queries[:HOT_QUERIES]
+    kinds, weights = zip(*mix.items())
+    func = QUERY_TOOLS[service]
+    ops = []
+    fresh = iter(queries)
+    next_doc = add_start
+    for kind in rng.choices(kinds, weights, k=count):
+        if kind == 'add':
+            docs = list(generate_docs(add_batch, seed, start=next_doc))
+            next_doc += add_batch
+            ops.append(Op(kind, 'rag_add_batch', {"docs": docs, "store": store}))
+            continue
+        query = rng.choice(hot) if kind == 'repeat' else next(fresh, None) or rng.choice(queries)
+        ops.append(Op(kind, func, query_params(service, query.text, store, top_k, score_threshold, mode), query.target))
+    return ops
+
+
+async def execute(target, op: Op) -> Sample:
+    start = time.perf_counter()
+    try:
+        result = await target.call(op.func, **op.params)
+        if op.kind == 'add':
+            if isinstance(result, dict) and 'error' in result:
+                raise RuntimeError(result['error'])
+            return Sample(op.kind, time.perf_counter() - start, True, None)
+        items = result_items(target.service, result)
+        elapsed = time.perf_counter() - start
+        hit = any((item.get('metadata') or {}).get('doc_id') == op.target for item in items)
+        return Sample(op.kind, elapsed, True, hit)
+    except Exception as e:
+        return Sample(op.kind, time.perf_counter() - start, False, None, f"{type(e).__name__}: {e}")
+
+
+async def run_ops(target, ops: List[Op], concurrency: int) -> Tuple[List[Sample], float]:
+    """以 concurrency 个协程闭环执行 ops，返回各请求的样本与总耗时（秒）。"""
+    samples: List[Sample] = []
+    position = iter(range(len(ops)))
+
+    async def worker():
+        for i in position:
+            samples.append(await execute(target, ops[i]))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return samples, time.perf_counter() - start
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩法百分位；values 需已排序。"""
+    if not values:
+        return None
+    rank = max(1, math.ceil(q * len(values)))
+    return values[rank - 1]
+
+
+def summarize(samples: List[Sample], elapsed: float) -> Dict:
+    latencies = sorted(s.seconds for s in samples if s.ok)
+    hits = [s.hit for s in samples if s.hit is not None]
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        "count": len(samples),
+        "errors": sum(1 for s in samples if not s.ok),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed > 0 else None,
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1]) if latencies else None,
+        "hit_rate": round(sum(hits) / len(hits), 4) if hits else None,
+    }
+
+
+def report(samples: List[Sample], elapsed: float) -> Dict:
+    by_kind = {}
+    for kind in OP_KINDS:
+        subset = [s for s in samples if s.kind == kind]
+        if subset:
+            by_kind[kind] = summarize(subset, elapsed)
+    errors = [s.error for s in samples if s.error]
+    return {
+        "elapsed_sec": round(elapsed, 3),
+        "overall": summarize(samples, elapsed),
+        "by_kind": by_kind,
+        # 只保留前几条错误信息便于排查
+        "error_samples": list(dict.fromkeys(errors))[:5],
+    }
@@ -0,0 +1,109 @@
+import itertools
+import contextlib
+from typing import Any, Dict, List, Optional
+
+# 被测服务：vector_service / rag_service / url_assistant，两种驱动方式：
+# - InProcessTarget：在本进程内 import 服务模块并运行其 lifespan，直接 await 工具函数，不含网络与编解码开销
+# - WsTarget：连接已运行的服务，多条 WebSocket 连接轮流发送请求，包含完整的网络链路
+
+SERVICES = ('vector_service', 'rag_service', 'url_assistant')
+
+# 每个服务的查询工具名及参数构造
+QUERY_TOOLS = {
+    'vector_service': 'rag_query',
+    'rag_service': 'retrieve',
+    'url_assistant': 'query_url',
+}
+
+
+def query_params(service: str, text: str, store: str, top_k: int, score_threshold: Optional[float],
+                 mode: Optional[str] = None) -> Dict:
+    if service == 'vector_service':
+        params = {"query": text, "store": store, "top_k": top_k}
+    elif service == 'rag_service':
+        params = {"question": text, "store": store, "top_k": top_k}
+    else:
+        # query_url 固定查 url store，top_k 固定为 1
+        params = {"natural_language_input": text}
+    if score_threshold is not None:
+        params["score_threshold"] = score_threshold
+    if mode is not None and service != 'url_assistant':
+        params["mode"] = mode
+    return params
+
+
+def result_items(service: str, result: Any) -> List[Dict]:
+    """把各服务的查询返回值统一为结果列表；返回 {"error": ...} 时抛出异常计入错误数。"""
+    if isinstance(result, dict):
+        if 'error' in result:
+            raise RuntimeError(result['error'])
+        return result.get('results', [])
+    items = result or []
+    for item in items:
+        if isinstance(item, dict) and 'error' in item:
+            raise RuntimeError(item['error'])
+    return items
+
+
+class InProcessTarget:
+    def __init__(self, service: str):
+        self.service = service
+        self._stack = contextlib.AsyncExitStack()
+        self.module = None
+        self.vector_service = None
+
+    async def start(self):
+        module = __import__(self.service)
+        await self._stack.enter_async_context(module.app.router.lifespan_context(module.app))
+        self.module = module
+        # 导入语料始终经由 vector_service（rag_service / url_assistant 在本进程内也使用它）
+        self.vector_service = __import__('vector_service')
+
+    async def call(self, func: str, **params):
+        return await getattr(self.module, func)(**params)
+
+    async def ingest(self, func: str, **params):
+        return await getattr(self.vector_service, func)(**params)
+
+    async def server_metrics(self) -> Optional[Dict]:
+        # 进程内直接调用不经过 ws_endpoint，没有服务端指标
+        return None
+
+    async def close(self):
+        await self._stack.aclose()
+
+
+class WsTarget:
+    def __init__(self, service: str, uri: str, connections: int, ingest_uri: str, encoding: str = 'json'):
+        from ws_client import WsToolClient
+        self.service = service
+        self.clients = [WsToolClient(uri, timeout=120, encoding=encoding) for _ in range(connections)]
+        self._ingest_client = WsToolClient(ingest_uri, timeout=600, encoding=encoding)
+        self._next = itertools.cycle(self.clients)
+
+    async def start(self):
+        # 预先建立全部连接，握手不计入请求耗时
+        for client in self.clients:
+            await client.connect()
+
+    async def call(self, func: str, **params):
+        return await next(self._next).call(func, **params)
+
+    async def ingest(self, func: str, **params):
+        return await self._ingest_client.call(func, **params)
+
+    async def server_metrics(self) -> Optional[Dict]:
+        """被测服务及 vector_service 的 metrics 工具输出（各阶段耗时分布），失败时返回 None。"""
+        metrics = {}
+        for name, client in ((self.service, self.clients[0]), ('vector_service', self._ingest_client)):
+            if name in metrics:
+                continue
+            try:
+                metrics[name] = await client.call('metrics')
+            except Exception:
+                metrics[name] = None
+        return metrics
+
+    async def close(self):
+        for client in self.clients + [self._ingest_client]:
+            await client.close()
@@ -0,0 +1,337 @@
+import os
+import time
+import zlib
+import logging
+import threading
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# 设置 huggingface 镜像环境变量
+os.environ.setdefault("HF_ENDPOINT", "https://hf-mirror.com")
+
+# embedding 批大小（同时用于批量导入时的分批）
+EMBED_BATCH_SIZE = 32
+MODEL_NAME = "BAAI/bge-large-zh"  # 可根据需要修改模型名
+EMBED_DIM = 1024  # bge-large-zh 输出维度，更换模型时同步修改
+# 单条文本的最大 token 数（bge 的位置编码上限），超出部分截断
+MAX_SEQ_LENGTH = 512
+# 批量导入按 token 预算组批：先统计各文本的 token 数，按长度排序后装批，每批 padding 后的 token 数（批内最长 × 条数）
+# 不超过该值，避免短标题和长段落混在一批时大部分算力耗在 padding 上。0 表示按固定条数分批
+EMBED_TOKEN_BUDGET = int(os.environ.get("RAG_EMBED_TOKEN_BUDGET", EMBED_BATCH_SIZE * MAX_SEQ_LENGTH))
+# 按 token 预算组批时单批条数上限：短文本批次过大时激活内存和单次调用耗时随之增长
+EMBED_MAX_BATCH = int(os.environ.get("RAG_EMBED_MAX_BATCH", 256))
+# embedding 实现（同一个 MODEL_NAME 的不同推理方式，向量一致性用 scripts/verify_embedding.py 校验）：
+#   hf         默认，sentence-transformers + PyTorch fp32
+#   hf_int8    同上，Linear 层做 PyTorch 动态 int8 量化
+#   onnx       导出的 ONNX 图，onnxruntime 推理
+#   onnx_int8  ONNX 图再做 onnxruntime 动态 int8 量化
+#   stub       确定性哈希向量，不需要下载模型，供基准测试和离线联调
+EMBEDDING_BACKENDS = ('hf', 'hf_int8', 'onnx', 'onnx_int8', 'stub')
+EMBEDDING_BACKEND = os.environ.get("RAG_EMBEDDING_BACKEND", "hf")
+# 推理的 intra-op 线程数，0 表示使用框架默认值（物理核数）。RAG_EXECUTOR=process 时每个 worker 进程各用这么多线程，
+# 应设为 核数 / worker 数，避免线程超订
+EMBED_THREADS = int(os.environ.get("RAG_EMBED_THREADS", 0))
+# ONNX 图与 tokenizer 所在目录，不存在时首次加载会从 MODEL_NAME 导出（需要 torch + transformers）
+ONNX_MODEL_DIR = os.environ.get("RAG_ONNX_MODEL_DIR",
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'onnx'))
+ONNX_FILE = 'model.onnx'
+ONNX_INT8_FILE = 'model.int8.onnx'
+
+
+class StubEmbeddings(Embeddings):
+    """确定性的离线 embedding：把字和相邻两字哈希到 EMBED_DIM 维（带符号）后归一化。
+
+    相同文本总得到相同向量，字面重合越多相似度越高；没有语义能力，只用于压测和联调。
+    """
+
+    # 与 bge 一样提供 query_instruction，embed_queries 可走批量路径
+    query_instruction = ""
+
+    def __init__(self, dim: int = EMBED_DIM):
+        self.dim = dim
+
+    def _embed(self, text: str) -> np.ndarray:
+        grams = list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+        hashes = np.fromiter((zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint32, count=len(grams))
+        vec = np.zeros(self.dim, dtype=np.float32)
+        # 最高位决定符号，使不相关文本的内积期望为 0
+        signs = np.where(hashes >> 31, 1.0, -1.0).astype(np.float32)
+        np.add.at(vec, hashes % self.dim, signs)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text).tolist()
+
+
+def export_onnx(model_dir: str = ONNX_MODEL_DIR, model_name: str = MODEL_NAME) -> str:
+    """把 model_name 导出为 ONNX 图（batch 与序列长度为动态维度），连同 tokenizer 保存到 model_dir，返回图文件路径。"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(["导出样例文本"], return_tensors='pt')
+    # 顺序与 BertModel.forward 的位置参数一致
+    names = ['input_ids', 'attention_mask', 'token_type_ids']
+    dynamic = {name: {0: 'batch', 1: 'sequence'} for name in names + ['last_hidden_state']}
+    path = os.path.join(model_dir, ONNX_FILE)
+    tmp = path + '.tmp'
+    start = time.perf_counter()
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[name] for name in names), tmp, input_names=names,
+                          output_names=['last_hidden_state'], dynamic_axes=dynamic, opset_version=17, dynamo=False)
+    os.replace(tmp, path)
+    tokenizer.save_pretrained(model_dir)
+    logger.info(f"ONNX 图导出完成: {path}, 耗时={time.perf_counter() - start:.1f}s")
+    return path
+
+
+def quantize_onnx(model_dir: str = ONNX_MODEL_DIR) -> str:
+    """对导出的 ONNX 图做动态 int8 量化（权重 int8，激活在运行时按批量化），返回量化图路径。"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    source = os.path.join(model_dir, ONNX_FILE)
+    if not os.path.exists(source):
+        export_onnx(model_dir)
+    path = os.path.join(model_dir, ONNX_INT8_FILE)
+    tmp = path + '.tmp'
+    quantize_dynamic(source, tmp, weight_type=QuantType.QInt8)
+    os.replace(tmp, path)
+    logger.info(f"ONNX 图 int8 量化完成: {path}")
+    return path
+
+
+def _bge_query_instruction(model_name: str) -> str:
+    # 与 HuggingFaceBgeEmbeddings 的默认值保持一致，保证各实现的查询向量可以互换
+    from langchain_community.embeddings.huggingface import (DEFAULT_QUERY_BGE_INSTRUCTION_EN,
+                                                            DEFAULT_QUERY_BGE_INSTRUCTION_ZH)
+    return DEFAULT_QUERY_BGE_INSTRUCTION_ZH if "-zh" in model_name else DEFAULT_QUERY_BGE_INSTRUCTION_EN
+
+
+class OnnxBgeEmbeddings(Embeddings):
+    """onnxruntime 推理的 bge：取 [CLS] 位置的隐藏状态并归一化，与 sentence-transformers 的 bge 池化配置一致。"""
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, quantized: bool = False, threads: int = EMBED_THREADS,
+                 batch_size: int = EMBED_BATCH_SIZE):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        path = os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+        if not os.path.exists(path):
+            # 进程池模式下多个 worker 可能同时导出，结果相同且经临时文件替换，只是多耗一些时间；建议预先导出
+            path = quantize_onnx(model_dir) if quantized else export_onnx(model_dir)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 单次推理只用算子内并行；并发请求由执行器的多个线程 / 进程承担
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.input_names = {item.name for item in self.session.get_inputs()}
+        self.batch_size = batch_size
+        self.query_instruction = _bge_query_instruction(MODEL_NAME)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=MAX_SEQ_LENGTH, return_tensors='np')
+        feeds = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+        cls = hidden[:, 0]
+        return cls / np.linalg.norm(cls, axis=1, keepdims=True)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            vectors.extend(self.embed_batch(texts[i:i + self.batch_size]))
+        return vectors
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """texts 作为一个批次推理，不再按 batch_size 拆分。"""
+        return self._encode([text.replace("\n", " ") for text in texts]).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([self.query_instruction + text])[0]
+
+
+def create_embeddings(backend: Optional[str] = None, threads: Optional[int] = None):
+    """backend / threads 默认取 RAG_EMBEDDING_BACKEND / RAG_EMBED_THREADS。"""
+    backend = backend or EMBEDDING_BACKEND
+    threads = EMBED_THREADS if threads is None else threads
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"未知的 embedding 实现: {backend}，可选 {', '.join(EMBEDDING_BACKENDS)}")
+    if backend == "stub":
+        return StubEmbeddings()
+    if backend in ("onnx", "onnx_int8"):
+        return OnnxBgeEmbeddings(quantized=backend == "onnx_int8", threads=threads)
+    import torch
+    if threads:
+        # 进程级设置，对该进程内所有 PyTorch 推理生效
+        torch.set_num_threads(threads)
+    from langchain_community.embeddings import HuggingFaceBgeEmbeddings
+    embeddings = HuggingFaceBgeEmbeddings(
+        model_name=MODEL_NAME,
+        model_kwargs={'device': "cpu"},
+        encode_kwargs={
+            "normalize_embeddings": True,
+            "trust_remote_code": True,
+            "batch_size": EMBED_BATCH_SIZE,
+            "device": "cpu"
+        }
+    )
+    if backend == "hf_int8":
+        # 只量化 Linear 层（BERT 推理的主要算力），embedding 与 LayerNorm 仍为 fp32
+        torch.ao.quantization.quantize_dynamic(embeddings.client, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return embeddings
+    # from langchain_modelscope import ModelScopeEmbeddings
+    # return ModelScopeEmbeddings(
+    #     model_id="BAAI/bge-m3"
+    # )
+
+
+class LazyEmbeddings(Embeddings):
+    """首次使用时才加载模型的 Embeddings 代理，同一进程内所有 store / 服务共用一份模型。"""
+
+    def __init__(self, factory=create_embeddings):
+        self._factory = factory
+        self._model = None
+        self._lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def get(self):
+        if self._model is None:
+            # 池中多个线程可能同时首次调用，只加载一次
+            with self._lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    self._model = self._factory()
+                    self.load_seconds = time.perf_counter() - start
+                    name = EMBEDDING_BACKEND if EMBEDDING_BACKEND == "stub" else f"{MODEL_NAME} ({EMBEDDING_BACKEND})"
+                    logger.info(f"embedding 模型加载完成: {name}, 耗时={self.load_seconds:.2f}s")
+        return self._model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.get().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.get().embed_query(text)
+
+    def __getattr__(self, name):
+        # query_instruction 等模型属性转发给真实模型
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+
+_shared_embeddings: Optional[LazyEmbeddings] = None
+
+
+def get_embeddings() -> LazyEmbeddings:
+    """进程内共享的 embedding 模型（惰性加载）。"""
+    global _shared_embeddings
+    if _shared_embeddings is None:
+        _shared_embeddings = LazyEmbeddings()
+    return _shared_embeddings
+
+
+def warm_up() -> float:
+    """预先加载模型并跑一次推理，返回耗时（秒）。"""
+    start = time.perf_counter()
+    get_embeddings().embed_documents(["warm up"])
+    return time.perf_counter() - start
+
+
+def _unwrap(emb):
+    return emb.get() if isinstance(emb, LazyEmbeddings) else emb
+
+
+def token_lengths(emb, texts: List[str]) -> List[int]:
+    """各文本编码后的 token 数（含 [CLS]/[SEP]，超过 MAX_SEQ_LENGTH 按截断计）。没有 tokenizer 的实现按字符数估算。"""
+    model = _unwrap(emb)
+    tokenizer = getattr(model, 'tokenizer', None) or getattr(getattr(model, 'client', None), 'tokenizer', None)
+    if tokenizer is None:
+        return [min(len(text) + 2, MAX_SEQ_LENGTH) for text in texts]
+    encoded = tokenizer(texts, truncation=True, max_length=MAX_SEQ_LENGTH)
+    return [len(ids) for ids in encoded['input_ids']]
+
+
+def plan_batches(lengths: List[int], token_budget: int, max_batch: int) -> List[List[int]]:
+    """按 token 数升序装批，每批 padding 后的 token 数不超过 token_budget、条数不超过 max_batch，返回各批文本的原始下标。
+
+    长度相近的文本落在同一批，padding 最少；单条就超过预算的文本独占一批。
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    batches, current = [], []
+    for i in order:
+        # 升序遍历，加入后批内最长即为 lengths[i]
+        if current and (len(current) >= max_batch or lengths[i] * (len(current) + 1) > token_budget):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def padding_efficiency(lengths: List[int], batches: List[List[int]]) -> float:
+    """实际 token 数占 padding 后 token 数的比例，1.0 表示没有 padding。"""
+    padded = sum(max(lengths[i] for i in batch) * len(batch) for batch in batches)
+    return sum(lengths) / padded if padded else 1.0
+
+
+def embed_batch(emb, texts: List[str]) -> List[List[float]]:
+    """把 texts 作为一个批次编码（按 token 预算组好的批不应再被模型按固定条数拆开），结果与 embed_documents 一致。"""
+    model = _unwrap(emb)
+    if hasattr(model, 'embed_batch'):
+        return model.embed_batch(texts)
+    client = getattr(model, 'client', None)
+    encode_kwargs = getattr(model, 'encode_kwargs', None)
+    if client is None or encode_kwargs is None:
+        return model.embed_documents(texts)
+    # HuggingFaceBgeEmbeddings.embed_documents 的同等调用，只是把 batch_size 换成整批
+    texts = [text.replace("\n", " ") for text in texts]
+    return client.encode(texts, **{**encode_kwargs, "batch_size": len(texts)}).tolist()
+
+
+def embed_queries(emb, texts: List[str]) -> List[List[float]]:
+    """批量计算查询向量，结果与逐条 embed_query 一致。"""
+    instruction = getattr(emb, "query_instruction", None)
+    if instruction is None:
+        return [emb.embed_query(text) for text in texts]
+    # bge 的 embed_query 只是给文本加上 query_instruction 前缀，这里一次性批量编码
+    return emb.embed_documents([instruction + text.replace("\n", " ") for text in texts])
+
+
+# 以下函数供进程池 worker 使用：每个 worker 进程在 initializer 中各自加载一份模型
+_worker_embeddings = None
+
+
+def init_worker():
+    global _worker_embeddings
+    _worker_embeddings = create_embeddings()
+
+
+def worker_embed_documents(texts: List[str]) -> List[List[float]]:
+    return _worker_embeddings.embed_documents(texts)
+
+
+def worker_embed_queries(texts: List[str]) -> List[List[float]]:
+    return embed_queries(_worker_embeddings, texts)
+
+
+def worker_embed_batch(texts: List[str]) -> List[List[float]]:
+    return embed_batch(_worker_embeddings, texts)
+
+
+def worker_token_lengths(texts: List[str]) -> List[int]:
+    return token_lengths(_worker_embeddings, texts)
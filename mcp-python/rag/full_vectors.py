@@ -0,0 +1,101 @@
+import os
+import logging
+from typing import Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 两阶段检索的全精度向量侧文件：FAISS 索引只保存降维后的向量用于第一轮候选检索，
+# 原始 float32 向量按索引位置依次存放在 vectors.f32 中，以 mmap 方式只读取候选行重新打分，
+# 不常驻进程堆内存；多个 worker 打开同一文件时经 page cache 共享。
+FULL_VECTORS_FILE = 'vectors.f32'
+
+
+class FullVectorFile:
+    """第 i 行为索引位置 i 的向量（dim 个小端 float32）。写入由调用方持 store 写锁，与读取互斥。"""
+
+    def __init__(self, path: str, dim: int, read_only: bool = False):
+        self.path = path
+        self.dim = dim
+        self.read_only = read_only
+        self.row_bytes = dim * 4
+        if not read_only and not os.path.exists(path):
+            open(path, 'ab').close()
+        self._remap()
+
+    def _remap(self):
+        # 末尾写了一半的行（崩溃残留）不计入
+        rows = os.path.getsize(self.path) // self.row_bytes
+        if rows:
+            self._map = np.memmap(self.path, dtype='<f4', mode='r', shape=(rows, self.dim))
+        else:
+            # 空文件无法 mmap
+            self._map = np.zeros((0, self.dim), dtype='<f4')
+        self._rows = rows
+
+    def __len__(self):
+        return self._rows
+
+    @property
+    def nbytes(self) -> int:
+        return self._rows * self.row_bytes
+
+    def write_at(self, start: int, vectors) -> None:
+        """从第 start 行开始写入（截掉 start 之后的旧数据），保证与索引位置对齐。"""
+        arr = np.ascontiguousarray(vectors, dtype='<f4')
+        if arr.ndim != 2 or arr.shape[1] != self.dim:
+            raise ValueError(f"向量维度应为 {self.dim}，实际为 {arr.shape}")
+        with open(self.path, 'r+b') as fp:
+            fp.truncate(start * self.row_bytes)
+            fp.seek(start * self.row_bytes)
+            fp.write(arr.tobytes())
+        self._remap()
+
+    def truncate(self, rows: int) -> None:
+        os.truncate(self.path, rows * self.row_bytes)
+        self._remap()
+
+    def flush(self) -> None:
+        """checkpoint 前调用：索引落盘时侧文件中对应的行必须已经持久化。"""
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def rows(self, positions: np.ndarray) -> np.ndarray:
+        return np.asarray(self._map[positions])
+
+    @classmethod
+    def write_all(cls, path: str, vectors) -> "FullVectorFile":
+        """整体重写（重建索引时）：先写临时文件再替换，已映射旧文件的检索不受影响。"""
+        arr = np.ascontiguousarray(vectors, dtype='<f4')
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as fp:
+            fp.write(arr.tobytes())
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp, path)
+        return cls(path, arr.shape[1])
+
+
+def rescore(full_vectors, queries: np.ndarray, candidates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """用全精度向量对第一轮候选重新打分，返回按余弦相似度降序排列的 (scores, positions)。
+
+    full_vectors 为 FullVectorFile 或 (ntotal, dim) 数组；candidates 中的 -1 为空位，结果中也以 -1 / -inf 补齐。
+    要求向量已归一化，内积即余弦相似度。
+    """
+    scores = np.full(candidates.shape, -np.inf, dtype=np.float32)
+    positions = np.full(candidates.shape, -1, dtype=np.int64)
+    read = full_vectors.rows if isinstance(full_vectors, FullVectorFile) else full_vectors.__getitem__
+    for row, (query, found) in enumerate(zip(queries, candidates)):
+        # 排序去重后按位置顺序读取 mmap，减少随机访问
+        valid = np.unique(found[found >= 0])
+        if not len(valid):
+            continue
+        sims = read(valid) @ query
+        order = np.argsort(-sims, kind='stable')
+        scores[row, :len(valid)] = sims[order]
+        positions[row, :len(valid)] = valid[order]
+    return scores, positions
@@ -0,0 +1,224 @@
+import math
+import time
+import logging
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+from full_vectors import rescore
+
+logger = logging.getLogger(__name__)
+
+# 支持的索引类型；auto 按向量数自动选择
+# pca_rescore / trunc_rescore 为两阶段检索：索引中只存 PCA 降维（或截取前若干维）后的向量做第一轮候选检索，
+# 候选再用全精度向量侧文件（见 full_vectors）重新打分；需显式指定，auto 不会选择
+TWO_STAGE_KINDS = ('pca_rescore', 'trunc_rescore')
+INDEX_KINDS = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw') + TWO_STAGE_KINDS
+# auto 的选择阈值：小库暴力检索最快也最准，中等规模用 IVF-Flat，百万级以上用 IVF-PQ 压缩内存
+AUTO_FLAT_MAX = 50_000
+AUTO_IVF_FLAT_MAX = 1_000_000
+HNSW_M = 32
+PQ_NBITS = 8
+# 两阶段检索的降维维度，及第一轮取 top_k * 倍数个候选
+DEFAULT_REDUCED_DIM = 256
+DEFAULT_RESCORE_FACTOR = 4
+
+
+def choose_kind(n: int) -> str:
+    if n < AUTO_FLAT_MAX:
+        return 'flat'
+    if n < AUTO_IVF_FLAT_MAX:
+        return 'ivf_flat'
+    return 'ivf_pq'
+
+
+def default_nlist(n: int) -> int:
+    # 经验值 4*sqrt(n)；每个聚类中心至少需要约 39 个训练点
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def default_pq_m(dim: int) -> int:
+    for m in (64, 32, 16, 8, 4, 2, 1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def factory_string(kind: str, dim: int, n: int, nlist: Optional[int] = None, pq_m: Optional[int] = None) -> str:
+    if kind == 'flat':
+        return 'Flat'
+    if kind == 'ivf_flat':
+        return f"IVF{nlist or default_nlist(n)},Flat"
+    if kind == 'ivf_pq':
+        return f"IVF{nlist or default_nlist(n)},PQ{pq_m or default_pq_m(dim)}x{PQ_NBITS}"
+    if kind == 'hnsw':
+        return f"HNSW{HNSW_M}"
+    raise ValueError(f"不支持的索引类型: {kind}，可选 {INDEX_KINDS} 或 auto")
+
+
+def _two_stage_index(kind: str, dim: int, reduced_dim: int, metric: int):
+    if not 0 < reduced_dim < dim:
+        raise ValueError(f"降维维度应在 1~{dim - 1} 之间，当前 {reduced_dim}")
+    if kind == 'pca_rescore':
+        transform = faiss.PCAMatrix(dim, reduced_dim)
+    else:
+        transform = faiss.RemapDimensionsTransform(dim, reduced_dim, False)
+    # faiss 的 Python 封装会在 IndexPreTransform 上保留 transform 与子索引的引用，不需要手动转移所有权
+    return faiss.IndexPreTransform(transform, faiss.IndexFlat(reduced_dim, metric))
+
+
+def build_index(kind: str, vectors: np.ndarray, metric: int = faiss.METRIC_INNER_PRODUCT,
+                nlist: Optional[int] = None, pq_m: Optional[int] = None, reduced_dim: Optional[int] = None):
+    """按类型创建索引，需要训练的类型（IVF 系列、PCA）用 vectors 训练。返回空索引，向量由调用方添加。"""
+    n, dim = vectors.shape
+    if kind == 'auto':
+        kind = choose_kind(n)
+    if kind == 'ivf_pq' and n < 2 ** PQ_NBITS:
+        raise ValueError(f"ivf_pq 至少需要 {2 ** PQ_NBITS} 条向量用于训练，当前 {n} 条")
+    if kind in TWO_STAGE_KINDS:
+        reduced_dim = reduced_dim or DEFAULT_REDUCED_DIM
+        if kind == 'pca_rescore' and n < reduced_dim:
+            raise ValueError(f"pca_rescore 至少需要 {reduced_dim} 条向量用于训练，当前 {n} 条")
+        spec = f"{kind}{reduced_dim}"
+        index = _two_stage_index(kind, dim, reduced_dim, metric)
+    else:
+        spec = factory_string(kind, dim, n, nlist, pq_m)
+        index = faiss.index_factory(dim, spec, metric)
+    if not index.is_trained:
+        start = time.perf_counter()
+        index.train(vectors)
+        logger.info(f"索引训练完成: {spec}, 训练样本={n}, 耗时={time.perf_counter() - start:.2f}s")
+    return index
+
+
+def is_two_stage(index) -> bool:
+    return isinstance(index, faiss.IndexPreTransform)
+
+
+def index_kind(index) -> str:
+    if is_two_stage(index):
+        transform = faiss.downcast_VectorTransform(index.chain.at(0))
+        return 'pca_rescore' if isinstance(transform, faiss.PCAMatrix) else 'trunc_rescore'
+    if isinstance(index, faiss.IndexFlat):
+        return 'flat'
+    if isinstance(index, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(index, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(index, faiss.IndexIVFFlat):
+        return 'ivf_flat'
+    return type(index).__name__
+
+
+def is_lossy(index) -> bool:
+    # PQ 编码、降维后的向量无法还原原始向量；两阶段索引的原始向量在侧文件中，其余情况重建时需要重新 embedding
+    return isinstance(index, faiss.IndexIVFPQ) or is_two_stage(index)
+
+
+def memory_bytes(index) -> int:
+    """索引常驻内存的估算（不含两阶段检索 mmap 的全精度向量）。"""
+    if is_two_stage(index):
+        inner = faiss.downcast_index(index.index)
+        return index.ntotal * inner.code_size + index.d * inner.d * 4
+    index_bytes = index.ntotal * getattr(index, 'code_size', index.d * 4)
+    if isinstance(index, faiss.IndexHNSW):
+        # HNSW 额外保存邻接表，每个向量约 2*M 个 int32 邻居
+        index_bytes += index.ntotal * index.hnsw.nb_neighbors(0) * 4
+    return index_bytes
+
+
+def search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """生成单次检索的参数对象；不修改索引本身，不同请求可以并发使用不同参数。"""
+    if nprobe and isinstance(index, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = int(nprobe)
+        return params
+    if ef_search and isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = int(ef_search)
+        return params
+    return None
+
+
+def to_similarity(index, distances: np.ndarray) -> np.ndarray:
+    """把检索返回的距离统一换算成余弦相似度（越大越相似），要求向量已归一化。
+
+    内积索引直接返回内积；旧的 L2 索引返回的是平方距离，对单位向量有 ||a-b||^2 = 2 - 2*cos。
+    """
+    if index.metric_type == faiss.METRIC_L2:
+        return 1.0 - distances / 2.0
+    return distances
+
+
+def metric_name(index) -> str:
+    return 'inner_product' if index.metric_type == faiss.METRIC_INNER_PRODUCT else 'l2'
+
+
+def describe(index) -> Dict:
+    info = {"kind": index_kind(index), "metric": metric_name(index), "ntotal": index.ntotal, "dim": index.d}
+    if isinstance(index, faiss.IndexIVF):
+        info["nlist"] = index.nlist
+        info["nprobe"] = index.nprobe
+    if isinstance(index, faiss.IndexHNSW):
+        info["ef_search"] = index.hnsw.efSearch
+    if is_two_stage(index):
+        info["reduced_dim"] = index.index.d
+    return info
+
+
+def recall_latency_report(vectors: np.ndarray, queries: np.ndarray, k: int = 10,
+                          kinds: Optional[List[str]] = None, metric: int = faiss.METRIC_INNER_PRODUCT,
+                          full_vectors=None, reduced_dim: Optional[int] = None) -> List[Dict]:
+    """以 Flat 精确检索为基准，测各索引类型在不同 nprobe/efSearch/rescore_factor 下的 recall@k、单查询延迟和内存。
+
+    两阶段索引的重打分从 full_vectors 读取全精度向量（可传入 mmap 的 FullVectorFile，默认直接用 vectors）。
+    """
+    kinds = kinds or list(INDEX_KINDS)
+    k = min(k, len(vectors))
+    exact = faiss.index_factory(vectors.shape[1], 'Flat', metric)
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    for kind in kinds:
+        try:
+            start = time.perf_counter()
+            index = build_index(kind, vectors, metric, reduced_dim=reduced_dim)
+            index.add(vectors)
+            build_sec = time.perf_counter() - start
+        except Exception as e:
+            rows.append({"kind": kind, "error": str(e)})
+            continue
+        if isinstance(index, faiss.IndexIVF):
+            settings = [{"nprobe": p} for p in (1, 4, 16, 64) if p <= index.nlist]
+        elif isinstance(index, faiss.IndexHNSW):
+            settings = [{"ef_search": ef} for ef in (16, 64, 256)]
+        elif is_two_stage(index):
+            # rescore_factor=1 即只用第一轮降维检索的结果
+            settings = [{"rescore_factor": f} for f in (1, 2, 4, 8, 16)]
+        else:
+            settings = [{}]
+        index_bytes = int(faiss.serialize_index(index).size)
+        for setting in settings:
+            factor = setting.get("rescore_factor")
+            params = search_params(index, setting.get("nprobe"), setting.get("ef_search"))
+            start = time.perf_counter()
+            if factor:
+                _, candidates = index.search(queries, min(k * factor, index.ntotal), params=params)
+                _, found = rescore(vectors if full_vectors is None else full_vectors, queries, candidates)
+                found = found[:, :k]
+            else:
+                _, found = index.search(queries, k, params=params)
+            latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            hits = sum(len(set(f[f >= 0]) & set(t[t >= 0])) for f, t in zip(found, truth))
+            rows.append({
+                "kind": index_kind(index),
+                **setting,
+                "recall_at_k": round(hits / (k * len(queries)), 4),
+                "latency_ms": round(latency_ms, 4),
+                "build_sec": round(build_sec, 3),
+                "memory_bytes": index_bytes,
+                # 两阶段索引的全精度向量在 mmap 侧文件中，不计入进程内存
+                **({"mmap_bytes": int(vectors.nbytes)} if factor else {}),
+            })
+    return rows
@@ -0,0 +1,134 @@
+import re
+import math
+import unicodedata
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 内存倒排索引 + BM25 打分，与每个 FAISS store 并存，用于缩写、业务术语等短查询的精确匹配。
+# 分词不依赖词典：中文按单字 + 相邻二字切分，英文 / 数字按连续串（小写）作为一个词。
+
+# CJK 统一表意文字（含扩展 A 与兼容区）
+_RUNS = re.compile(r'[0-9a-z]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+
+# BM25 参数：k1 控制词频饱和速度，b 控制文档长度归一化程度
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    terms = []
+    for run in _RUNS.findall(unicodedata.normalize("NFKC", text).lower()):
+        if run[0].isascii():
+            terms.append(run)
+        else:
+            terms.extend(run)
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+class LexicalIndex:
+    """倒排表：词 -> {文档槽位: 词频}。写入与检索由所属 store 的读写锁互斥。
+
+    文档 id 映射到连续的整数槽位（删除后复用），检索时把查询词的倒排表转成 numpy 数组向量化打分：
+    中文单字的倒排表往往覆盖大部分文档，逐条累加在大 store 上太慢。数组按词缓存，该词的倒排表变化时失效。
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.total_length = 0
+        self._slots: Dict[Hashable, int] = {}
+        self._ids: List[Optional[Hashable]] = []
+        self._free: List[int] = []
+        self._lengths = np.zeros(64, dtype=np.float32)
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _allocate(self, doc_id: Hashable) -> int:
+        if self._free:
+            slot = self._free.pop()
+            self._ids[slot] = doc_id
+        else:
+            slot = len(self._ids)
+            self._ids.append(doc_id)
+            if slot >= len(self._lengths):
+                self._lengths = np.concatenate([self._lengths, np.zeros(len(self._lengths), dtype=np.float32)])
+        self._slots[doc_id] = slot
+        return slot
+
+    def add(self, ids: Iterable[Hashable], texts: Iterable[str]):
+        for doc_id, text in zip(ids, texts):
+            if doc_id in self._slots:
+                raise ValueError(f"文档已在倒排索引中: {doc_id}")
+            terms = tokenize(text)
+            slot = self._allocate(doc_id)
+            self._lengths[slot] = len(terms)
+            self.total_length += len(terms)
+            for term, tf in Counter(terms).items():
+                self.postings.setdefault(term, {})[slot] = tf
+                self._arrays.pop(term, None)
+
+    def remove(self, ids: Iterable[Hashable], texts: Iterable[str]):
+        """删除文档；texts 为文档原文，用于找到其所在的倒排表。"""
+        for doc_id, text in zip(ids, texts):
+            slot = self._slots.pop(doc_id, None)
+            if slot is None:
+                continue
+            self.total_length -= int(self._lengths[slot])
+            self._lengths[slot] = 0
+            self._ids[slot] = None
+            self._free.append(slot)
+            for term in set(tokenize(text)):
+                posting = self.postings.get(term)
+                if posting is None:
+                    continue
+                posting.pop(slot, None)
+                self._arrays.pop(term, None)
+                if not posting:
+                    del self.postings[term]
+
+    def _term_arrays(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        # 并发检索（同持读锁）可能同时构建同一个词的数组，结果相同，后写入的覆盖即可
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            posting = self.postings.get(term)
+            if not posting:
+                return None
+            slots = np.fromiter(posting.keys(), dtype=np.int64, count=len(posting))
+            tfs = np.fromiter(posting.values(), dtype=np.float32, count=len(posting))
+            arrays = self._arrays[term] = (slots, tfs)
+        return arrays
+
+    def search(self, query: str, k: int) -> List[Tuple[Hashable, float]]:
+        """返回 BM25 得分最高的 k 个 (文档 id, 得分)，只包含至少命中一个词的文档。"""
+        n = len(self._slots)
+        if not n or k <= 0:
+            return []
+        avg_length = self.total_length / n or 1.0
+        scores = None
+        for term in set(tokenize(query)):
+            arrays = self._term_arrays(term)
+            if arrays is None:
+                continue
+            slots, tfs = arrays
+            idf = math.log(1 + (n - len(slots) + 0.5) / (len(slots) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[slots] / avg_length)
+            if scores is None:
+                scores = np.zeros(len(self._ids), dtype=np.float32)
+            # 同一个词的倒排表内槽位不重复，可以直接按下标累加
+            scores[slots] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+        if scores is None:
+            return []
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind='stable')]
+        return [(self._ids[slot], float(scores[slot])) for slot in matched]
+
+    def info(self) -> dict:
+        return {"docs": len(self._slots), "terms": len(self.postings)}
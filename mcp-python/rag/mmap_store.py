@@ -0,0 +1,170 @@
+import os
+import json
+import shutil
+import logging
+from collections.abc import Mapping
+from typing import Iterator, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from full_vectors import FULL_VECTORS_FILE, FullVectorFile
+from index_factory import index_kind, is_two_stage, memory_bytes
+
+logger = logging.getLogger(__name__)
+
+# 只读服务快照：多个 worker 进程以 mmap 方式打开同一份文件，通过 page cache 共享内存，启动时也无需反序列化 pickle
+#   index.faiss    faiss.write_index 原生格式，按索引类型选择 mmap 标志打开（见 _read_flags）
+#   docs.bin       按索引位置依次拼接的 UTF-8 JSON 记录 [id, content, metadata]，墓碑位置为空记录
+#   docs.offsets   n+1 个小端 uint64，第 i 条记录为 docs.bin[offsets[i]:offsets[i+1]]
+#   vectors.f32    仅两阶段索引：全精度向量侧文件（见 full_vectors）
+#   manifest.json  最后写入，记录对应的 journal seq、文档数、索引类型等
+SNAPSHOT_DIR = 'serving'
+SNAPSHOT_FILES = ('index.faiss', 'docs.bin', 'docs.offsets')
+MANIFEST = 'manifest.json'
+
+
+class MmapDocstore:
+    """按索引位置读取文档的只读 docstore，数据留在 mmap 中，只在命中时解码对应记录。"""
+
+    def __init__(self, blob_path: str, offsets_path: str):
+        self._offsets = np.memmap(offsets_path, dtype='<u8', mode='r')
+        size = int(self._offsets[-1])
+        # 空文件无法 mmap
+        self._blob = np.memmap(blob_path, dtype=np.uint8, mode='r') if size else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return int(self._blob.nbytes + self._offsets.nbytes)
+
+    def is_empty(self, position: int) -> bool:
+        return self._offsets[position] == self._offsets[position + 1]
+
+    def search(self, search: int):
+        # 与 InMemoryDocstore 一致：找不到时返回提示字符串而不是抛异常
+        if not isinstance(search, (int, np.integer)) or not 0 <= search < len(self) or self.is_empty(search):
+            return f"ID {search} not found."
+        start, end = int(self._offsets[search]), int(self._offsets[search + 1])
+        doc_id, content, metadata = json.loads(bytes(self._blob[start:end]).decode('utf-8'))
+        return Document(id=doc_id, page_content=content, metadata=metadata)
+
+
+class PositionIds(Mapping):
+    """代替 index_to_docstore_id：docstore 直接按位置寻址，位置即键，墓碑位置返回 None。"""
+
+    def __init__(self, docstore: MmapDocstore):
+        self._docstore = docstore
+
+    def __getitem__(self, position: int) -> Optional[int]:
+        if not 0 <= position < len(self._docstore):
+            raise KeyError(position)
+        return None if self._docstore.is_empty(position) else position
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self._docstore)))
+
+    def __len__(self):
+        return len(self._docstore)
+
+
+class MmapVectorStore:
+    """只读服务模式下代替 LangChain FAISS 对象，只提供检索路径用到的 index / docstore / index_to_docstore_id。"""
+
+    def __init__(self, index, docstore: MmapDocstore, full_vectors: Optional[FullVectorFile] = None,
+                 index_heap_bytes: int = 0):
+        self.index = index
+        self.docstore = docstore
+        self.index_to_docstore_id = PositionIds(docstore)
+        self.full_vectors = full_vectors
+        # 索引中未能映射、读入本进程堆内存的部分
+        self.index_heap_bytes = index_heap_bytes
+
+
+def write_snapshot(path: str, vector_store, seq: int) -> dict:
+    """把 vector_store 写成只读服务快照（阻塞调用）。先写临时目录再逐个替换，已打开旧文件的进程不受影响。"""
+    target = os.path.join(path, SNAPSHOT_DIR)
+    tmp_dir = os.path.join(path, '.serving-tmp')
+    os.makedirs(target, exist_ok=True)
+    os.makedirs(tmp_dir, exist_ok=True)
+    index = vector_store.index
+    mapping = vector_store.index_to_docstore_id
+    offsets = np.zeros(index.ntotal + 1, dtype='<u8')
+    count = 0
+    with open(os.path.join(tmp_dir, 'docs.bin'), 'wb') as fp:
+        for position in range(index.ntotal):
+            doc_id = mapping.get(position)
+            doc = vector_store.docstore.search(doc_id) if doc_id is not None else None
+            if isinstance(doc, Document):
+                fp.write(json.dumps([doc_id, doc.page_content, doc.metadata], ensure_ascii=False).encode('utf-8'))
+                count += 1
+            offsets[position + 1] = fp.tell()
+    offsets.tofile(os.path.join(tmp_dir, 'docs.offsets'))
+    faiss.write_index(index, os.path.join(tmp_dir, 'index.faiss'))
+    names = list(SNAPSHOT_FILES)
+    full_vectors = getattr(vector_store, 'full_vectors', None)
+    if full_vectors is not None:
+        tmp_vectors = os.path.join(tmp_dir, FULL_VECTORS_FILE)
+        shutil.copyfile(full_vectors.path, tmp_vectors)
+        os.truncate(tmp_vectors, index.ntotal * full_vectors.row_bytes)
+        names.append(FULL_VECTORS_FILE)
+    elif os.path.exists(os.path.join(target, FULL_VECTORS_FILE)):
+        os.remove(os.path.join(target, FULL_VECTORS_FILE))
+    for name in names:
+        os.replace(os.path.join(tmp_dir, name), os.path.join(target, name))
+    manifest = {"seq": seq, "count": count, "ntotal": index.ntotal, "dim": index.d, "doc_bytes": int(offsets[-1]),
+                "kind": index_kind(index)}
+    tmp_manifest = os.path.join(tmp_dir, MANIFEST)
+    with open(tmp_manifest, 'w', encoding='utf-8') as fp:
+        json.dump(manifest, fp)
+    os.replace(tmp_manifest, os.path.join(target, MANIFEST))
+    return manifest
+
+
+def has_snapshot(path: str) -> bool:
+    return os.path.exists(os.path.join(path, SNAPSHOT_DIR, MANIFEST))
+
+
+def _read_flags(kind: Optional[str]) -> int:
+    # IO_FLAG_MMAP 只映射 IVF 的倒排表；Flat、HNSW 的向量存储和两阶段索引的内层 Flat 都是 IndexFlatCodes，
+    # 需要 IO_FLAG_MMAP_IFC 才会映射（HNSW 的邻接表随之映射），否则整体拷贝到堆内存。
+    # 旧快照的 manifest 没有 kind，按 IndexFlatCodes 处理
+    if kind in ('ivf_flat', 'ivf_pq'):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+
+def _heap_bytes(index) -> int:
+    """以 mmap 方式打开后仍在堆内存中的部分：IVF 的聚类中心、HNSW 每个向量的层级与邻接表偏移。"""
+    if isinstance(index, faiss.IndexIVF):
+        return index.nlist * index.d * 4
+    if isinstance(index, faiss.IndexHNSW):
+        return index.ntotal * (4 + 8)
+    return 0
+
+
+def load_snapshot(path: str) -> Tuple[MmapVectorStore, dict]:
+    """以 mmap 方式打开只读服务快照，返回 (vector_store, manifest)。"""
+    target = os.path.join(path, SNAPSHOT_DIR)
+    with open(os.path.join(target, MANIFEST), encoding='utf-8') as fp:
+        manifest = json.load(fp)
+    index_path = os.path.join(target, 'index.faiss')
+    try:
+        index = faiss.read_index(index_path, _read_flags(manifest.get("kind")))
+        heap_bytes = _heap_bytes(index)
+    except RuntimeError as e:
+        # 个别索引类型不支持 mmap，退回普通读取
+        logger.warning(f"索引不支持 mmap 打开，改为读入内存: {index_path}, {e}")
+        index = faiss.read_index(index_path)
+        heap_bytes = memory_bytes(index)
+    docstore = MmapDocstore(os.path.join(target, 'docs.bin'), os.path.join(target, 'docs.offsets'))
+    full_vectors = None
+    vectors_path = os.path.join(target, FULL_VECTORS_FILE)
+    if is_two_stage(index):
+        if os.path.exists(vectors_path):
+            full_vectors = FullVectorFile(vectors_path, index.d, read_only=True)
+        else:
+            logger.warning(f"两阶段索引的服务快照缺少全精度向量文件，检索只能使用降维向量的分数: {vectors_path}")
+    return MmapVectorStore(index, docstore, full_vectors, heap_bytes), manifest
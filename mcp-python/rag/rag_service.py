@@ -1,19 +1,68 @@
+import os
 import json
 import logging
+import argparse
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket
 import uvicorn
-from typing import List, Dict, Any
-from ws_tools import ws_tool, ws_endpoint
-from vector_service import rag_query
+from typing import List, Dict, Any, Optional
+from ws_tools import add_metrics_route, ws_tool, ws_endpoint
+from ws_client import WsToolPool
+from ws_logging import preview, setup_logging
 
-app = FastAPI()
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s %(message)s',
-)
+# 日志经队列由后台线程写出，级别 / 格式 / 抽样率见 ws_logging
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# 默认在本进程内加载 vector_service（含 embedding 模型）；--no-model（或 RAG_NO_MODEL=1）时不加载模型，
+# 经持久连接池转发到独立运行的 vector_service，多个代理服务共用一个 vector_service 进程
+VECTOR_SERVICE_URI = os.environ.get("RAG_VECTOR_SERVICE_URI", "ws://127.0.0.1:9100/ws")
+NO_MODEL = os.environ.get("RAG_NO_MODEL", "0") != "0"
+_remote: Optional[WsToolPool] = None
+
+def use_remote_vector_service(uri: str = VECTOR_SERVICE_URI):
+    global _remote
+    if _remote is not None and _remote.uri == uri:
+        return
+    _remote = WsToolPool(uri)
+    logger.info(f"no-model 模式：检索转发到 {uri}")
+
+if NO_MODEL:
+    use_remote_vector_service()
+
+async def rag_query(query: str, **kwargs) -> dict:
+    if _remote is not None:
+        return await _remote.call('rag_query', query=query, **kwargs)
+    # 延迟导入：只有本地检索时才加载 faiss / 向量库，导入时也还不会加载模型
+    import vector_service
+    return await vector_service.rag_query(query, **kwargs)
+
+async def rag_query_stream(query: str, **kwargs):
+    if _remote is not None:
+        async for item in _remote.stream('rag_query_stream', query=query, **kwargs):
+            yield item
+        return
+    import vector_service
+    async for item in vector_service.rag_query_stream(query, **kwargs):
+        yield item
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if _remote is not None:
+        await _remote.start()
+        try:
+            yield
+        finally:
+            await _remote.close()
+        return
+    # 本地模式沿用 vector_service 的启动预热与退出 checkpoint
+    import vector_service
+    async with vector_service.lifespan(app):
+        yield
+
+app = FastAPI(lifespan=lifespan)
+add_metrics_route(app)
+
 class Document:
     def __init__(self, id: str, content: str):
         self.id = id
@@ -21,18 +70,46 @@ class Document:
     def to_dict(self):
         return {"id": self.id, "content": self.content}
 
+# mode：dense 向量检索（默认）/ lexical BM25 词法检索（不经过模型）/ hybrid 两者 RRF 融合
 @ws_tool('retrieve')
-async def retrieve(question: str, top_k: int = 5, store: str = 'url') -> List[Dict]:
-    logger.info(f"RAGService 检索: question={question}, top_k={top_k}")
-    # 使用真正的向量模糊检索
-    result = await rag_query(question, store=store, top_k=top_k)
-    # rag_query 返回的是 {'results': [...]}
+async def retrieve(question: str, top_k: int = 5, store: str = 'url',
+                   score_threshold: Optional[float] = None, mode: str = 'dense') -> List[Dict]:
+    logger.debug("RAGService 检索: question=%s, top_k=%s, score_threshold=%s, mode=%s",
+                 preview(question), top_k, score_threshold, mode)
+    result = await rag_query(question, store=store, top_k=top_k, score_threshold=score_threshold, mode=mode)
+    # rag_query 返回的是 {'results': [{content, metadata, score}, ...]}
     return result.get('results', [])
 
+# 流式检索：逐条返回结果，客户端可以边收边渲染
+@ws_tool('retrieve_stream')
+async def retrieve_stream(question: str, top_k: int = 5, store: str = 'url',
+                          score_threshold: Optional[float] = None, mode: str = 'dense'):
+    logger.debug("RAGService 流式检索: question=%s, top_k=%s, score_threshold=%s, mode=%s",
+                 preview(question), top_k, score_threshold, mode)
+    async for item in rag_query_stream(question, store=store, top_k=top_k, score_threshold=score_threshold,
+                                       mode=mode):
+        yield item
+
+# 转发模式下到 vector_service 的连接池状态
+@ws_tool('vector_service_pool')
+async def vector_service_pool() -> dict:
+    if _remote is None:
+        return {"mode": "local"}
+    return {"mode": "remote", **_remote.stats()}
+
 @app.websocket("/ws")
 async def ws_main(ws: WebSocket):
     await ws_endpoint(ws, logger)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="RAGService WebSocket 服务")
+    parser.add_argument("--no-model", action="store_true", help="不在本进程加载模型，检索转发到 vector_service")
+    parser.add_argument("--vector-service", default=VECTOR_SERVICE_URI, help="--no-model 时 vector_service 的地址")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.no_model:
+        use_remote_vector_service(args.vector_service)
     logger.info("Starting RAGService WebSocket server on 127.0.0.1:9200")
-    uvicorn.run(app, host="0.0.0.0", port=9200)
+    uvicorn.run(app, host="0.0.0.0", port=9200, log_config=None)
@@ -0,0 +1,118 @@
+import os
+import re
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+from typing import Dict, List
+
+# embedding 实现基准：各实现（及 intra-op 线程数）的模型加载耗时、批量编码吞吐（条/秒）和单条查询延迟。
+# 吞吐分别按固定条数分批（按到达顺序每 EMBED_BATCH_SIZE 条一批）和按 token 预算分批测量
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from embedding_model import (EMBED_BATCH_SIZE, EMBED_MAX_BATCH, EMBED_TOKEN_BUDGET, EMBEDDING_BACKENDS, MAX_SEQ_LENGTH,
+                             create_embeddings, embed_batch, embed_queries, padding_efficiency, plan_batches,
+                             token_lengths)
+from verify_embedding import load_corpus
+
+RAG_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def mixed_corpus(seed: int = 0) -> List[str]:
+    """长短混合的语料：url.json 的页面标题 + 仓库内 markdown 文档的段落，打乱顺序模拟批量导入。"""
+    texts = load_corpus()
+    for name in sorted(os.listdir(RAG_DIR)):
+        if name.endswith('.md'):
+            with open(os.path.join(RAG_DIR, name), 'r', encoding='utf-8') as f:
+                texts.extend(p.strip() for p in re.split(r'\n\s*\n', f.read()) if p.strip())
+    random.Random(seed).shuffle(texts)
+    return texts
+
+
+def fixed_batches(n: int, batch_size: int) -> List[List[int]]:
+    return [list(range(start, min(start + batch_size, n))) for start in range(0, n, batch_size)]
+
+
+def throughput(embeddings, texts: List[str], batches: List[List[int]]) -> float:
+    start = time.perf_counter()
+    for batch in batches:
+        embed_batch(embeddings, [texts[i] for i in batch])
+    return len(texts) / (time.perf_counter() - start)
+
+
+def bench_backend(backend: str, threads: int, texts: List[str], queries: List[str], token_budget: int) -> Dict:
+    start = time.perf_counter()
+    embeddings = create_embeddings(backend, threads=threads)
+    # 首次推理包含图优化 / 内存分配等一次性开销，不计入
+    embeddings.embed_documents(texts[:EMBED_BATCH_SIZE])
+    load_sec = time.perf_counter() - start
+
+    fixed = fixed_batches(len(texts), EMBED_BATCH_SIZE)
+    fixed_rate = throughput(embeddings, texts, fixed)
+    # 按 token 预算分批的吞吐计入统计 token 数与装批的耗时
+    start = time.perf_counter()
+    lengths = token_lengths(embeddings, texts)
+    bucketed = plan_batches(lengths, token_budget, EMBED_MAX_BATCH)
+    plan_sec = time.perf_counter() - start
+    bucketed_rate = len(texts) / (len(texts) / throughput(embeddings, texts, bucketed) + plan_sec)
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        embed_queries(embeddings, [query])
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "backend": backend,
+        "threads": threads or "default",
+        "load_sec": round(load_sec, 2),
+        "fixed_docs_per_sec": round(fixed_rate, 1),
+        "bucketed_docs_per_sec": round(bucketed_rate, 1),
+        "fixed_padding_efficiency": round(padding_efficiency(lengths, fixed), 3),
+        "bucketed_padding_efficiency": round(padding_efficiency(lengths, bucketed), 3),
+        "query_p50_ms": round(statistics.median(latencies), 2),
+        "query_p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比各 embedding 实现的编码吞吐与单条查询延迟")
+    parser.add_argument("--corpus", help="语料文件，格式见 verify_embedding.py；默认为 url.json 标题与仓库 markdown 段落的混合语料")
+    parser.add_argument("--backends", nargs="+", default=["hf", "hf_int8", "onnx", "onnx_int8"], choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--threads", nargs="+", type=int, default=[0], help="intra-op 线程数，0 为框架默认值")
+    parser.add_argument("--docs", type=int, default=512, help="吞吐测试的文本条数（语料不足时循环使用）")
+    parser.add_argument("--queries", type=int, default=100, help="延迟测试的单条查询次数")
+    parser.add_argument("--token-budget", type=int, default=EMBED_TOKEN_BUDGET or EMBED_BATCH_SIZE * MAX_SEQ_LENGTH,
+                        help="按 token 预算分批时每批 padding 后的 token 数上限")
+    parser.add_argument("--output", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else mixed_corpus()
+    texts = (corpus * (args.docs // len(corpus) + 1))[:args.docs]
+    queries = (corpus * (args.queries // len(corpus) + 1))[:args.queries]
+    rows = []
+    print(f"{'backend':<12}{'threads':>8}{'load_sec':>10}{'fixed/s':>10}{'bucket/s':>10}{'fixed_eff':>10}{'bucket_eff':>11}"
+          f"{'p50_ms':>10}{'p95_ms':>10}")
+    for backend in args.backends:
+        for threads in args.threads:
+            try:
+                row = bench_backend(backend, threads, texts, queries, args.token_budget)
+            except Exception as e:
+                row = {"backend": backend, "threads": threads or "default", "error": str(e)}
+                print(f"{backend:<12}{row['threads']:>8}  error: {e}")
+            else:
+                print(f"{backend:<12}{row['threads']:>8}{row['load_sec']:>10}{row['fixed_docs_per_sec']:>10}"
+                      f"{row['bucketed_docs_per_sec']:>10}{row['fixed_padding_efficiency']:>10}"
+                      f"{row['bucketed_padding_efficiency']:>11}{row['query_p50_ms']:>10}{row['query_p95_ms']:>10}")
+            rows.append(row)
+            # 释放上一个模型，避免多份权重同时驻留
+            gc.collect()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
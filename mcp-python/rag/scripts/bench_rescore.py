@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 两阶段检索基准：对比 Flat 与 pca_rescore / trunc_rescore 在不同 rescore_factor 下的 recall@k、单查询延迟和内存。
+# 全精度向量写入临时文件后以 mmap 方式读取，与线上重打分路径一致
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from embedding_model import EMBED_DIM
+from full_vectors import FullVectorFile
+from index_factory import DEFAULT_REDUCED_DIM, TWO_STAGE_KINDS, recall_latency_report
+
+
+def synthetic_vectors(n: int, dim: int, intrinsic_dim: int, seed: int = 0) -> np.ndarray:
+    # 真实 embedding 的方差集中在少数主方向上：在 intrinsic_dim 维子空间中生成带聚类结构的向量，再叠加少量各向噪声
+    rng = np.random.default_rng(seed)
+    basis = np.linalg.qr(rng.standard_normal((dim, intrinsic_dim)))[0].T.astype(np.float32)
+    centers = rng.standard_normal((max(1, n // 100), intrinsic_dim)).astype(np.float32)
+    latent = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.standard_normal((n, intrinsic_dim)).astype(np.float32)
+    vectors = latent @ basis + 0.02 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def run(vectors: np.ndarray, queries: int, k: int, kinds: List[str], reduced_dim: Optional[int]) -> List[Dict]:
+    rng = np.random.default_rng(1)
+    sample = vectors[rng.choice(len(vectors), min(queries, len(vectors)), replace=False)]
+    with tempfile.TemporaryDirectory() as tmp:
+        full_vectors = FullVectorFile.write_all(os.path.join(tmp, 'vectors.f32'), vectors)
+        return recall_latency_report(vectors, sample, k, kinds, full_vectors=full_vectors, reduced_dim=reduced_dim)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比 Flat 与两阶段（降维检索 + 全精度重打分）索引的召回率、延迟和内存")
+    parser.add_argument("--input", help="向量文件（.npy，形状 n x dim）；不指定时使用合成向量")
+    parser.add_argument("--vectors", type=int, default=100_000, help="合成向量数")
+    parser.add_argument("--dim", type=int, default=EMBED_DIM, help="合成向量维度")
+    parser.add_argument("--intrinsic-dim", type=int, default=128, help="合成向量方差集中的子空间维度")
+    parser.add_argument("--reduced-dim", type=int, default=DEFAULT_REDUCED_DIM, help="第一轮检索的向量维度")
+    parser.add_argument("--kinds", nargs="+", default=["flat", *TWO_STAGE_KINDS])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--output", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    if args.input:
+        vectors = np.load(args.input).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    else:
+        vectors = synthetic_vectors(args.vectors, args.dim, args.intrinsic_dim)
+    print(f"向量 {len(vectors)} 条, 维度 {vectors.shape[1]}, 降维到 {args.reduced_dim}", file=sys.stderr)
+    rows = run(vectors, args.queries, args.k, args.kinds, args.reduced_dim)
+    print(f"{'kind':<15}{'setting':<20}{'recall':>8}{'latency_ms':>12}{'index_mb':>10}{'mmap_mb':>10}")
+    for row in rows:
+        if "error" in row:
+            print(f"{row['kind']:<15}{'error: ' + row['error']}")
+            continue
+        setting = f"rescore_factor={row['rescore_factor']}" if "rescore_factor" in row else "-"
+        print(f"{row['kind']:<15}{setting:<20}{row['recall_at_k']:>8}{row['latency_ms']:>12}"
+              f"{row['memory_bytes'] / 2 ** 20:>10.1f}{row.get('mmap_bytes', 0) / 2 ** 20:>10.1f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
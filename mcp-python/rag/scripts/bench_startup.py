@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import subprocess
+import asyncio
+from typing import Dict, List
+
+# 启动耗时基准：每次在全新子进程中测 import 模块 -> lifespan 启动完成（ready）-> 首个查询返回 的耗时与峰值内存
+RAG_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger(__name__)
+
+TARGETS = ('vector_service', 'rag_service', 'url_assistant')
+
+
+async def first_query(module, target: str, query: str):
+    if target == 'vector_service':
+        return await module.rag_query(query, top_k=1)
+    if target == 'rag_service':
+        return await module.retrieve(query, top_k=1)
+    return await module.query_url(query)
+
+
+async def measure(target: str, no_model: bool, query: str) -> Dict:
+    start = time.perf_counter()
+    module = __import__(target)
+    import_sec = time.perf_counter() - start
+    if no_model:
+        import rag_service
+        rag_service.use_remote_vector_service()
+    async with module.app.router.lifespan_context(module.app):
+        ready_sec = time.perf_counter() - start
+        query_start = time.perf_counter()
+        await first_query(module, target, query)
+        first_query_sec = time.perf_counter() - query_start
+    embedding_model = sys.modules.get('embedding_model')
+    return {
+        "target": target,
+        "no_model": no_model,
+        "warmup": os.environ.get("RAG_WARMUP", "1") != "0",
+        "import_sec": round(import_sec, 3),
+        "ready_sec": round(ready_sec, 3),
+        "first_query_sec": round(first_query_sec, 3),
+        "model_loaded": bool(embedding_model and embedding_model.get_embeddings().loaded),
+        # Linux 上 ru_maxrss 单位为 KB
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_child(target: str, no_model: bool, warmup: bool, query: str) -> Dict:
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', target, '--query', query]
+    if no_model:
+        cmd.append('--no-model')
+    env = {**os.environ, "RAG_WARMUP": "1" if warmup else "0", "PYTHONPATH": RAG_DIR}
+    proc = subprocess.run(cmd, cwd=RAG_DIR, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"target": target, "no_model": no_model, "error": proc.stderr.strip().splitlines()[-1:]}
+    # 子进程最后一行输出为结果 JSON，其余为日志
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量各服务从 import 到可服务（ready）以及首个查询的耗时")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--runs", type=int, default=1, help="每种配置重复次数")
+    parser.add_argument("--no-model", action="store_true",
+                        help="rag_service / url_assistant 以转发模式启动（需要 vector_service 已在运行）")
+    parser.add_argument("--no-warmup", action="store_true", help="启动时不预热模型，模型在首个查询时加载")
+    parser.add_argument("--query", default="联系人列表页")
+    parser.add_argument("--output", help="结果另存为 JSON 文件")
+    parser.add_argument("--child", choices=TARGETS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, RAG_DIR)
+        result = asyncio.run(measure(args.child, args.no_model, args.query))
+        print(json.dumps(result, ensure_ascii=False))
+        return
+
+    rows: List[Dict] = []
+    for target in args.targets:
+        no_model = args.no_model and target != 'vector_service'
+        for run in range(args.runs):
+            row = run_child(target, no_model, not args.no_warmup, args.query)
+            row["run"] = run
+            logger.info(json.dumps(row, ensure_ascii=False))
+            rows.append(row)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    print(json.dumps(rows, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from typing import Dict, List
+
+import numpy as np
+
+# 线上编码基准：对比典型查询 / 导入 / 向量载荷在 JSON 与 msgpack（向量为原始 float32 字节）下的字节数和编解码耗时
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from embedding_model import EMBED_DIM
+from ws_codec import JsonCodec, MsgpackCodec, msgpack
+
+URL_JSON_PATH = os.path.join(os.path.dirname(__file__), '../data/url.json')
+
+
+def build_payloads(batch: int, seed: int = 0) -> Dict[str, dict]:
+    with open(URL_JSON_PATH, 'r', encoding='utf-8') as f:
+        items = json.load(f)
+    docs = [{"content": item['desc'], "metadata": item} for item in (items * (batch // len(items) + 1))[:batch]]
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((batch, EMBED_DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return {
+        "query_request": {"id": 1, "func": "rag_query", "params": {"query": "联系人列表页", "store": "url", "top_k": 5}},
+        "query_response": {"id": 1, "result": {"results": [
+            {"content": doc["content"], "metadata": doc["metadata"], "score": 0.8123} for doc in docs[:5]
+        ]}},
+        "ingest_request": {"id": 2, "func": "rag_add_batch", "params": {"docs": docs, "store": "url"}},
+        "embed_response": {"id": 3, "result": {"dim": EMBED_DIM, "vectors": vectors[:32]}},
+        "ingest_with_vectors": {"id": 4, "func": "rag_add_batch", "params": {"docs": docs, "store": "url", "vectors": vectors}},
+    }
+
+
+def timed(fn, arg, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+
+def run(batch: int, repeat: int) -> List[Dict]:
+    codecs = [("json", JsonCodec)] + ([("msgpack", MsgpackCodec)] if msgpack is not None else [])
+    rows = []
+    for name, payload in build_payloads(batch).items():
+        for codec_name, codec in codecs:
+            data = codec.dumps(payload)
+            size = len(data.encode('utf-8')) if isinstance(data, str) else len(data)
+            rows.append({
+                "payload": name,
+                "codec": codec_name,
+                "bytes": size,
+                "encode_us": round(timed(codec.dumps, payload, repeat), 1),
+                "decode_us": round(timed(codec.loads, data, repeat), 1),
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比 JSON 与 msgpack 线上编码的字节数和编解码 CPU 耗时")
+    parser.add_argument("--batch", type=int, default=256, help="导入类载荷的文档数")
+    parser.add_argument("--repeat", type=int, default=20, help="每项重复次数，取中位数")
+    parser.add_argument("--output", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    if msgpack is None:
+        print("未安装 msgpack，只测 JSON", file=sys.stderr)
+    rows = run(args.batch, args.repeat)
+    print(f"{'payload':<22}{'codec':<9}{'bytes':>12}{'encode_us':>12}{'decode_us':>12}")
+    for row in rows:
+        print(f"{row['payload']:<22}{row['codec']:<9}{row['bytes']:>12}{row['encode_us']:>12}{row['decode_us']:>12}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from typing import Dict
+
+import numpy as np
+
+# 服务快照内存检查：两个 worker 进程同时以 mmap 方式打开同一份快照并执行检索，
+# 统计各自匿名内存（RssAnon，即进程私有的堆内存）的增长。索引与文档应只占共享的文件页（RssFile），
+# 匿名内存增长超过 load_snapshot 报告的未映射部分（HNSW 邻接图、IVF 聚类中心）加上容差时退出码为 1
+RAG_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(RAG_DIR)
+# 解码文档、检索临时缓冲等的容差
+SLACK_BYTES = 16 * 2 ** 20
+
+
+def rss() -> Dict[str, int]:
+    values = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('RssAnon', 'RssFile'):
+                values[key] = int(value.split()[0]) * 1024
+    return values
+
+
+def child(path: str, queries: int):
+    import faiss
+    from mmap_store import load_snapshot
+    before = rss()
+    vector_store, manifest = load_snapshot(path)
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((queries, vector_store.index.d)).astype(np.float32)
+    _, indices = vector_store.index.search(matrix, 10)
+    for position in indices.ravel():
+        if position >= 0:
+            vector_store.docstore.search(position)
+    after = rss()
+    print(json.dumps({
+        "kind": manifest.get("kind"),
+        "anon_delta": after["RssAnon"] - before["RssAnon"],
+        "file_delta": after["RssFile"] - before["RssFile"],
+        "heap_bytes": vector_store.index_heap_bytes,
+    }), flush=True)
+    # 等父进程启动第二个 worker 后再退出，保证两个进程同时持有映射
+    sys.stdin.read()
+
+
+def build_store(path: str, kind: str, n: int, dim: int):
+    from index_factory import build_index
+    from mmap_store import write_snapshot
+    from store_registry import _new_vector_store
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = build_index(kind, vectors)
+    vector_store = _new_vector_store(None, index)
+    vector_store.add_embeddings(text_embeddings=[(f"文档 {i}", v) for i, v in enumerate(vectors)],
+                                metadatas=[{"i": i} for i in range(n)])
+    return write_snapshot(path, vector_store, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查多个 worker 打开同一服务快照时，索引不会复制到各自的堆内存")
+    parser.add_argument("--store-path", help="已导出服务快照的 store 目录；不指定时生成合成快照")
+    parser.add_argument("--kind", default="flat", help="合成快照的索引类型")
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.queries)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.store_path
+        if path is None:
+            path = tmp
+            manifest = build_store(path, args.kind, args.vectors, args.dim)
+            print(f"合成快照: kind={manifest['kind']}, ntotal={manifest['ntotal']}, dim={manifest['dim']}", file=sys.stderr)
+        cmd = [sys.executable, os.path.abspath(__file__), '--child', path, '--queries', str(args.queries)]
+        workers = [subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True) for _ in range(2)]
+        results = [json.loads(worker.stdout.readline()) for worker in workers]
+        for worker in workers:
+            worker.communicate('')
+    failed = False
+    for i, result in enumerate(results, 1):
+        limit = result["heap_bytes"] + SLACK_BYTES
+        ok = result["anon_delta"] <= limit
+        failed |= not ok
+        print(f"worker {i}: kind={result['kind']}, 堆内存增长 {result['anon_delta'] / 2 ** 20:.1f} MB "
+              f"(上限 {limit / 2 ** 20:.1f} MB), 文件页 {result['file_delta'] / 2 ** 20:.1f} MB "
+              f"{'OK' if ok else '超出'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,112 @@
 import os
 import sys
 import json
+import time
 import logging
-from typing import List, Dict
+import argparse
+from typing import List, Dict, Optional
 from tqdm import tqdm
 import asyncio
 
 # 动态添加父目录到sys.path，确保可以import vector_service
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from vector_service import rag_add
+from vector_service import rag_add, add_documents_batch, sync_documents, checkpoint, EMBED_BATCH_SIZE
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 logger = logging.getLogger(__name__)
 
 URL_JSON_PATH = os.path.join(os.path.dirname(__file__), '../data/url.json')
+# 增量同步时写入 metadata 的来源标记，只有带该标记的文档会因从 url.json 中移除而被删除
+SYNC_SOURCE = 'url.json'
+# 旧版脚本以随机 id 导入、没有来源标记的文档按这些 metadata 字段认领，首次同步时替换为稳定 id 的新文档
+LEGACY_KEYS = ["uri", "ap"]
 
 def load_url_data(json_path: str) -> List[Dict]:
     with open(json_path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-async def main():
-    logger.info(f"加载 url.json: {URL_JSON_PATH}")
-    url_data = load_url_data(URL_JSON_PATH)
-    logger.info(f"共加载 {len(url_data)} 条 url 数据")
+def doc_id(item: Dict) -> str:
+    # 由 uri / ap 派生稳定 id，重复运行不会产生重复文档
+    ap = item.get("ap", "")
+    return f"url:{item['uri']}#{ap}" if ap else f"url:{item['uri']}"
 
-    for item in tqdm(url_data, desc="导入到本地向量服务"):
-        doc = {
-            "content": item['desc'],
-            "metadata": {
-                "uri": item["uri"],
-                "ap": item.get("ap", ""),
-                "desc": item["desc"]
-            }
+def to_doc(item: Dict) -> Dict:
+    return {
+        "id": doc_id(item),
+        "content": item['desc'],
+        "metadata": {
+            "uri": item["uri"],
+            "ap": item.get("ap", ""),
+            "desc": item["desc"]
         }
+    }
+
+async def import_single(url_data: List[Dict]):
+    # 逐条导入：每条都会重写一次索引文件，仅用于兼容/对比
+    for item in tqdm(url_data, desc="导入到本地向量服务"):
         try:
-            result = await rag_add(doc, store="url")
+            result = await rag_add(to_doc(item), store="url")
             logger.info(f"已添加: {item['desc']} - {result}")
         except Exception as e:
             logger.error(f"添加失败: {item['desc']} - {e}")
 
+async def import_bulk(url_data: List[Dict], batch_size: Optional[int]):
+    # 批量导入：分批 embedding，一次写入索引
+    docs = [to_doc(item) for item in url_data]
+    start = time.perf_counter()
+    try:
+        with tqdm(total=len(docs), desc="批量导入到本地向量服务", unit="doc") as bar:
+            ids = await add_documents_batch(docs, batch_size=batch_size, progress=bar.update)
+    except ValueError as e:
+        # store 中已有相同 id 的文档（embedding 前检查）：bulk 只用于空 store
+        logger.error(f"批量导入失败: {e}；url store 已有数据时请使用 --mode sync 增量同步")
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+    rate = len(ids) / elapsed if elapsed > 0 else 0.0
+    logger.info(f"批量导入完成: {len(ids)} 条, 耗时 {elapsed:.2f}s, 吞吐 {rate:.1f} docs/s")
+
+async def import_sync(url_data: List[Dict], batch_size: Optional[int], prune_unmanaged: bool, dry_run: bool):
+    # 增量同步：按 id 与内容哈希比对 store，只 embedding 新增 / 变化的条目，删除 url.json 中已移除的条目
+    docs = [to_doc(item) for item in url_data]
+    start = time.perf_counter()
+    with tqdm(desc="增量同步到本地向量服务", unit="doc") as bar:
+        result = await sync_documents(docs, store="url", source=SYNC_SOURCE, batch_size=batch_size,
+                                      prune_unmanaged=prune_unmanaged, dry_run=dry_run, progress=bar.update,
+                                      legacy_keys=LEGACY_KEYS)
+    elapsed = time.perf_counter() - start
+    logger.info(f"增量同步{'（dry run）' if dry_run else ''}完成: 新增 {result['added']}, 更新 {result['updated']}, "
+                f"删除 {result['deleted']}, 迁移旧数据 {result['migrated']}, 未变 {result['unchanged']}, 耗时 {elapsed:.2f}s")
+    if dry_run:
+        for key in ("added_ids", "updated_ids", "deleted_ids", "migrated_ids"):
+            if result[key]:
+                logger.info(f"{key}: {result[key]}")
+
+async def main():
+    parser = argparse.ArgumentParser(description="将 data/url.json 导入向量存储")
+    parser.add_argument("--mode", choices=["sync", "bulk", "single"], default="sync",
+                        help="sync: 增量同步（默认）；bulk: 全量批量导入（仅用于空 store）；single: 逐条调用 rag_add")
+    parser.add_argument("--batch-size", type=int,
+                        help="embedding 每批条数上限：按 token 预算分批时默认 RAG_EMBED_MAX_BATCH，"
+                             f"RAG_EMBED_TOKEN_BUDGET=0（按固定条数分批）时默认 {EMBED_BATCH_SIZE}")
+    parser.add_argument("--dry-run", action="store_true", help="sync 模式下只列出差异，不写入")
+    parser.add_argument("--prune-unmanaged", action="store_true",
+                        help="sync 模式下同时删除 url store 中其余没有来源标记的文档（uri/ap 与 url.json 条目相同的旧数据默认即被替换）")
+    args = parser.parse_args()
+
+    logger.info(f"加载 url.json: {URL_JSON_PATH}")
+    url_data = load_url_data(URL_JSON_PATH)
+    logger.info(f"共加载 {len(url_data)} 条 url 数据")
+
+    if args.mode == "sync":
+        await import_sync(url_data, args.batch_size, args.prune_unmanaged, args.dry_run)
+        if args.dry_run:
+            return
+    elif args.mode == "bulk":
+        await import_bulk(url_data, args.batch_size)
+    else:
+        await import_single(url_data)
+    # 脚本独立运行、没有后台 checkpoint 任务，结束前整体落盘一次
+    await checkpoint()
+
 if __name__ == "__main__":
     asyncio.run(main())
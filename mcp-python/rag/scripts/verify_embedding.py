@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import argparse
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# embedding 实现一致性校验：用 fp32（hf）作基准，逐条比较其他实现在同一语料上的向量余弦相似度，
+# 以及以语料为候选集时查询 top-k 结果与基准的重合率。低于阈值时退出码为 1，可放在切换 RAG_EMBEDDING_BACKEND 前执行
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from embedding_model import EMBEDDING_BACKENDS, create_embeddings, embed_queries
+
+URL_JSON_PATH = os.path.join(os.path.dirname(__file__), '../data/url.json')
+
+
+def load_corpus(path: Optional[str] = None) -> List[str]:
+    """默认取 url.json 的页面描述；也可指定 .txt（每行一条）、.json（字符串或带 content/desc 的对象列表）或 .jsonl。"""
+    path = path or URL_JSON_PATH
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.txt'):
+            items = f.read().splitlines()
+        elif path.endswith('.jsonl'):
+            items = [json.loads(line) for line in f if line.strip()]
+        else:
+            items = json.load(f)
+    texts = [item if isinstance(item, str) else item.get("content") or item.get("desc", "") for item in items]
+    return [text for text in texts if text.strip()]
+
+
+def cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def topk_agreement(base_docs, base_queries, docs, queries, k: int) -> float:
+    """两种实现各自检索自己的向量，top-k 结果集合的平均重合率。"""
+    k = min(k, len(base_docs))
+    expected = np.argsort(-(base_queries @ base_docs.T), axis=1)[:, :k]
+    found = np.argsort(-(queries @ docs.T), axis=1)[:, :k]
+    return float(np.mean([len(set(e) & set(f)) / k for e, f in zip(expected, found)]))
+
+
+def summarize(cosines: np.ndarray) -> Dict:
+    return {
+        "mean": round(float(cosines.mean()), 6),
+        "p01": round(float(np.percentile(cosines, 1)), 6),
+        "min": round(float(cosines.min()), 6),
+    }
+
+
+def encode(backend: str, texts: List[str], queries: List[str]):
+    embeddings = create_embeddings(backend)
+    docs = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    query_vectors = np.asarray(embed_queries(embeddings, queries), dtype=np.float32)
+    return docs, query_vectors
+
+
+def run(texts: List[str], queries: List[str], backends: List[str], k: int) -> List[Dict]:
+    base_docs, base_queries = encode("hf", texts, queries)
+    rows = []
+    for backend in backends:
+        try:
+            docs, query_vectors = encode(backend, texts, queries)
+        except Exception as e:
+            rows.append({"backend": backend, "error": str(e)})
+            continue
+        rows.append({
+            "backend": backend,
+            "doc_cosine": summarize(cosine_rows(base_docs, docs)),
+            "query_cosine": summarize(cosine_rows(base_queries, query_vectors)),
+            f"top{k}_agreement": round(topk_agreement(base_docs, base_queries, docs, query_vectors, k), 4),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="校验各 embedding 实现与 fp32 基准的向量一致性")
+    parser.add_argument("--corpus", help="语料文件，默认 data/url.json")
+    parser.add_argument("--queries", help="查询文件（格式同语料），默认以语料文本作为查询")
+    parser.add_argument("--backends", nargs="+", default=["hf_int8", "onnx", "onnx_int8"],
+                        choices=[b for b in EMBEDDING_BACKENDS if b not in ("hf", "stub")])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="文档与查询向量余弦相似度 p01 的下限")
+    parser.add_argument("--min-agreement", type=float, default=0.9, help="top-k 结果重合率的下限")
+    parser.add_argument("--output", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus)
+    queries = load_corpus(args.queries) if args.queries else texts
+    print(f"语料 {len(texts)} 条, 查询 {len(queries)} 条", file=sys.stderr)
+    rows = run(texts, queries, args.backends, args.k)
+    failed = []
+    print(f"{'backend':<12}{'doc_mean':>10}{'doc_p01':>10}{'doc_min':>10}{'query_p01':>11}{'agreement':>11}")
+    for row in rows:
+        if "error" in row:
+            print(f"{row['backend']:<12}error: {row['error']}")
+            failed.append(row["backend"])
+            continue
+        doc, query = row["doc_cosine"], row["query_cosine"]
+        agreement = row[f"top{args.k}_agreement"]
+        print(f"{row['backend']:<12}{doc['mean']:>10}{doc['p01']:>10}{doc['min']:>10}{query['p01']:>11}{agreement:>11}")
+        if min(doc["p01"], query["p01"]) < args.min_cosine or agreement < args.min_agreement:
+            failed.append(row["backend"])
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    if failed:
+        print(f"未通过: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,19 @@ import json
 import logging
 from fastapi import FastAPI, WebSocket
 import uvicorn
-from ws_tools import ws_tool, ws_endpoint
+from ws_tools import add_metrics_route, ws_tool, ws_endpoint
+from ws_logging import preview, setup_logging
 
 app = FastAPI()
+add_metrics_route(app)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s %(message)s',
-)
+# 日志经队列由后台线程写出，级别 / 格式 / 抽样率见 ws_logging
+setup_logging()
 logger = logging.getLogger(__name__)
 
 @ws_tool('sql_query')
 async def sql_query(sql: str) -> dict:
-    logger.info(f"SQL 查询: {sql}")
+    logger.debug("SQL 查询: %s", preview(sql))
     # 示例：实际应接入数据库
     return {"result": f"执行结果 for SQL: {sql}"}
 
@@ -24,4 +24,4 @@ async def ws_main(ws: WebSocket):
 
 if __name__ == "__main__":
     logger.info("Starting SQLService WebSocket server on 127.0.0.1:9300")
-    uvicorn.run(app, host="0.0.0.0", port=9300)
+    uvicorn.run(app, host="0.0.0.0", port=9300, log_config=None)
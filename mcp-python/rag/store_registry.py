@@ -0,0 +1,632 @@
+import os
+import re
+import json
+import time
+import shutil
+import asyncio
+import logging
+import itertools
+import threading
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from full_vectors import FULL_VECTORS_FILE, FullVectorFile
+from index_factory import build_index, describe, is_lossy, is_two_stage, memory_bytes, metric_name
+from lexical_index import LexicalIndex
+from mmap_store import has_snapshot, load_snapshot, write_snapshot
+from vector_journal import MutationJournal, decode_vectors, read_checkpoint_seq, write_checkpoint_seq
+
+logger = logging.getLogger(__name__)
+
+_STORE_NAME = re.compile(r'^[A-Za-z0-9_\-]+$')
+INDEX_FILES = ('index.faiss', 'index.pkl')
+STATE_FILES = INDEX_FILES + ('journal.log', 'checkpoint.json')
+
+# 版本号全局递增：store 被卸载后重新加载也不会与旧版本号重复
+_versions = itertools.count(1)
+
+
+class ReadWriteLock:
+    """写优先的 asyncio 读写锁。release_* 为同步方法，可在 future 回调里调用。
+
+    checkpoint、重建等长时间持读锁的操作以 background=True 获取：持有期间等待中的写者本来就无法进入，
+    新的读者不再为它排队，避免一次变更请求让该 store 的所有查询等到落盘结束。
+    """
+
+    def __init__(self):
+        self._readers = 0
+        self._background_readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+        self._waiters: List[asyncio.Future] = []
+
+    async def _wait(self):
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await fut
+        finally:
+            if fut in self._waiters:
+                self._waiters.remove(fut)
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(None)
+
+    async def acquire_read(self, background: bool = False):
+        while self._writer or (self._writers_waiting and not self._background_readers):
+            await self._wait()
+        self._readers += 1
+        if background:
+            self._background_readers += 1
+            # 放行因等待中的写者而排队的读者
+            self._wake()
+
+    def release_read(self, background: bool = False):
+        self._readers -= 1
+        if background:
+            self._background_readers -= 1
+        if self._readers == 0:
+            self._wake()
+
+    async def acquire_write(self):
+        self._writers_waiting += 1
+        try:
+            while self._writer or self._readers:
+                await self._wait()
+        except BaseException:
+            self._writers_waiting -= 1
+            self._wake()
+            raise
+        self._writers_waiting -= 1
+        self._writer = True
+
+    def release_write(self):
+        self._writer = False
+        self._wake()
+
+    @asynccontextmanager
+    async def write(self):
+        await self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+def _doc_bytes(doc: Document) -> int:
+    # 只估算文本和元数据的 UTF-8 大小，不含 Python 对象开销
+    return len(doc.page_content.encode('utf-8')) + len(json.dumps(doc.metadata, ensure_ascii=False).encode('utf-8'))
+
+
+def _new_vector_store(embeddings, index) -> FAISS:
+    # distance_strategy 只影响 LangChain 自带的检索方法，保持与索引度量一致
+    strategy = (DistanceStrategy.MAX_INNER_PRODUCT if index.metric_type == faiss.METRIC_INNER_PRODUCT
+                else DistanceStrategy.EUCLIDEAN_DISTANCE)
+    return FAISS(embeddings, index, InMemoryDocstore(), {}, distance_strategy=strategy)
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for name in os.listdir(path):
+        full = os.path.join(path, name)
+        if os.path.isfile(full):
+            total += os.path.getsize(full)
+    return total
+
+
+class VectorStoreHandle:
+    """单个 store：FAISS 索引、journal、读写锁和版本号，数据在 vector-store/<name>/ 下。"""
+
+    def __init__(self, name: str, path: str, embeddings, journal_fsync: bool = True,
+                 index_kind: str = 'auto', metric: int = faiss.METRIC_INNER_PRODUCT,
+                 read_only: bool = False, export_serving: bool = False):
+        self.name = name
+        self.path = path
+        self.embeddings = embeddings
+        # 新建 store 时使用的索引类型与度量
+        self.index_kind = index_kind
+        self.metric = metric
+        # read_only：以 mmap 打开只读服务快照，拒绝一切变更；export_serving：每次 checkpoint 同时导出服务快照
+        self.read_only = read_only
+        self.export_serving = export_serving
+        self.vector_store: Optional[FAISS] = None
+        # 非 Flat 索引不支持按位置压缩删除，删除时只在 index_to_docstore_id 中置 None（墓碑），重建时清理
+        self.tombstones = 0
+        self.journal = MutationJournal(os.path.join(path, 'journal.log'), fsync=journal_fsync)
+        # 检索与 checkpoint 持读锁，变更持写锁
+        self.lock = ReadWriteLock()
+        # 防止手动与后台 checkpoint 同时写文件
+        self.checkpoint_lock = asyncio.Lock()
+        self.last_checkpoint = time.monotonic()
+        # 每次增删改更新，查询结果缓存键中带版本号
+        self.version = next(_versions)
+        self.doc_bytes = 0
+        self.last_used = time.monotonic()
+        # BM25 倒排索引，首次词法检索时由 docstore 构建，之后随增删同步更新；从未词法检索的 store 不占内存
+        self.lexical: Optional[LexicalIndex] = None
+        self._lexical_build_lock = threading.Lock()
+
+    @property
+    def checkpoint_meta_path(self) -> str:
+        return os.path.join(self.path, 'checkpoint.json')
+
+    @property
+    def full_vectors_path(self) -> str:
+        return os.path.join(self.path, FULL_VECTORS_FILE)
+
+    @property
+    def full_vectors(self) -> Optional[FullVectorFile]:
+        # 侧文件挂在 vector_store 上：重建索引时与索引一起替换，检索取到的索引与侧文件始终配套
+        return getattr(self.vector_store, 'full_vectors', None)
+
+    @property
+    def count(self) -> int:
+        # 有效文档数（不含墓碑）
+        return self.vector_store.index.ntotal - self.tombstones if self.vector_store is not None else 0
+
+    def load(self):
+        """加载最近一次 checkpoint 并回放 journal（阻塞调用）。"""
+        if self.read_only:
+            self._load_snapshot()
+            return
+        os.makedirs(self.path, exist_ok=True)
+        if os.path.exists(os.path.join(self.path, 'index.faiss')):
+            self.vector_store = FAISS.load_local(
+                folder_path=self.path,
+                embeddings=self.embeddings,
+                allow_dangerous_deserialization=True
+            )
+            self._migrate_metric()
+            self._attach_full_vectors(self.vector_store)
+        checkpoint_seq = read_checkpoint_seq(self.checkpoint_meta_path)
+        replayed = 0
+        for record in self.journal.replay(after_seq=checkpoint_seq):
+            # 回放需幂等：checkpoint 已写完但 journal 未清空时崩溃，记录可能已包含在 checkpoint 中
+            present = [doc_id for doc_id in record["ids"] + record.get("deleted", []) if self.has_doc(doc_id)]
+            if present:
+                self.apply_delete(present)
+            if record["op"] == "add":
+                vectors = decode_vectors(record["vectors"], record["dim"])
+                self.apply_add(record["texts"], vectors, record["metadatas"], record["ids"])
+            replayed += 1
+        self.journal.open(start_seq=checkpoint_seq)
+        if self.vector_store is not None:
+            self.doc_bytes = sum(_doc_bytes(doc) for doc in self.vector_store.docstore._dict.values())
+            self.tombstones = sum(1 for doc_id in self.vector_store.index_to_docstore_id.values() if doc_id is None)
+        logger.info(f"store 加载完成: {self.name}, 文档数={self.count}, 回放 journal {replayed} 条")
+
+    def _migrate_metric(self):
+        """旧版本用 L2 建的 Flat 索引按位置原样转成内积索引，位置与 docstore 映射不变。
+
+        其它类型的索引需要重新训练，保留原度量（检索分数照样换算成余弦相似度），可用 rag_rebuild_index 迁移。
+        """
+        index = self.vector_store.index
+        if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            # load_local 不保存 distance_strategy，按索引度量补上
+            self.vector_store.distance_strategy = DistanceStrategy.MAX_INNER_PRODUCT
+        if index.metric_type == self.metric:
+            return
+        if isinstance(index, faiss.IndexFlat) and self.metric == faiss.METRIC_INNER_PRODUCT:
+            converted = faiss.IndexFlatIP(index.d)
+            if index.ntotal:
+                converted.add(index.reconstruct_n(0, index.ntotal))
+            self.vector_store.index = converted
+            self.vector_store.distance_strategy = DistanceStrategy.MAX_INNER_PRODUCT
+            logger.info(f"已将 Flat 索引从 L2 转为内积: store={self.name}, 向量数={converted.ntotal}")
+        else:
+            logger.warning(f"store={self.name} 的索引度量为 {metric_name(index)}，可调用 rag_rebuild_index 迁移到内积索引")
+
+    def _attach_full_vectors(self, vector_store):
+        """两阶段索引：打开与索引位置对齐的全精度向量侧文件。"""
+        vector_store.full_vectors = None
+        index = vector_store.index
+        if not is_two_stage(index):
+            return
+        full_vectors = FullVectorFile(self.full_vectors_path, index.d)
+        if len(full_vectors) < index.ntotal:
+            logger.error(f"store={self.name} 的全精度向量文件只有 {len(full_vectors)} 行，少于索引的 {index.ntotal} 条，"
+                         f"检索只能使用降维向量的分数；请调用 rag_rebuild_index 重建")
+            return
+        if len(full_vectors) > index.ntotal:
+            # 上次 checkpoint 之后写入的行，回放 journal 时会重新写入
+            full_vectors.truncate(index.ntotal)
+        vector_store.full_vectors = full_vectors
+
+    def _load_snapshot(self):
+        # 只读模式不回放 journal：快照之后的变更需由写进程重新导出快照后才可见
+        if not has_snapshot(self.path):
+            logger.warning(f"store={self.name} 没有只读服务快照，按空库处理；请在写进程中调用 rag_export_serving")
+            return
+        self.vector_store, manifest = load_snapshot(self.path)
+        newer = next(iter(self.journal.replay(after_seq=manifest["seq"])), None)
+        if read_checkpoint_seq(self.checkpoint_meta_path) > manifest["seq"] or newer is not None:
+            logger.warning(f"store={self.name} 的服务快照落后于最新 checkpoint/journal，快照 seq={manifest['seq']}")
+        self.journal.last_seq = manifest["seq"]
+        self.tombstones = manifest["ntotal"] - manifest["count"]
+        logger.info(f"只读快照加载完成(mmap): {self.name}, 文档数={self.count}, seq={manifest['seq']}")
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"store={self.name} 处于只读服务模式，不支持变更")
+
+    def has_doc(self, doc_id: str) -> bool:
+        return self.vector_store is not None and isinstance(self.vector_store.docstore.search(doc_id), Document)
+
+    def bump_version(self):
+        self.version = next(_versions)
+
+    def apply_add(self, texts: List[str], vectors, metadatas: List[dict], ids: List[str]):
+        # FAISS.add_embeddings 会先写索引再检查 id 冲突，冲突时索引里会残留孤立向量，这里提前检查
+        self._check_writable()
+        existing = [doc_id for doc_id in ids if self.has_doc(doc_id)]
+        if existing:
+            raise ValueError(f"Tried to add ids that already exist: {set(existing)}")
+        # 在改动索引之前计算，metadata 无法序列化时不会留下写了一半的文档
+        added_bytes = sum(_doc_bytes(Document(page_content=t, metadata=m)) for t, m in zip(texts, metadatas))
+        if self.vector_store is None:
+            # 首批数据决定索引类型（auto 时按数量选择），需要训练的索引也用这批数据训练
+            index = build_index(self.index_kind, np.asarray(vectors, dtype=np.float32), self.metric)
+            self.vector_store = _new_vector_store(self.embeddings, index)
+            self._attach_full_vectors(self.vector_store)
+        full_vectors = self.full_vectors
+        if full_vectors is not None:
+            # 从当前 ntotal 处写入，覆盖之前失败写入的残留，保证与索引位置对齐
+            full_vectors.write_at(self.vector_store.index.ntotal, vectors)
+        self.vector_store.add_embeddings(text_embeddings=list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        if self.lexical is not None:
+            self.lexical.add(ids, texts)
+        self.doc_bytes += added_bytes
+
+    def apply_delete(self, ids: List[str]):
+        self._check_writable()
+        removed = [self.vector_store.docstore.search(doc_id) for doc_id in ids]
+        if isinstance(self.vector_store.index, faiss.IndexFlat):
+            self.vector_store.delete(ids=ids)
+        else:
+            missing = [doc_id for doc_id, doc in zip(ids, removed) if not isinstance(doc, Document)]
+            if missing:
+                raise ValueError(f"Some specified ids do not exist in the current store. Ids not found: {set(missing)}")
+            targets = set(ids)
+            mapping = self.vector_store.index_to_docstore_id
+            for position, doc_id in mapping.items():
+                if doc_id in targets:
+                    mapping[position] = None
+            self.vector_store.docstore.delete(ids)
+            self.tombstones += len(targets)
+        if self.lexical is not None:
+            present = [(doc_id, doc.page_content) for doc_id, doc in zip(ids, removed) if isinstance(doc, Document)]
+            self.lexical.remove([doc_id for doc_id, _ in present], [text for _, text in present])
+        self.doc_bytes -= sum(_doc_bytes(doc) for doc in removed if isinstance(doc, Document))
+
+    def _delete_restorable(self, doc_id: str) -> Callable[[], None]:
+        """删除单个文档，返回把它原样恢复的函数。"""
+        vector_store = self.vector_store
+        doc = vector_store.docstore.search(doc_id) if vector_store is not None else None
+        if not isinstance(doc, Document):
+            raise ValueError(f"Some specified ids do not exist in the current store. Ids not found: {{{doc_id!r}}}")
+        mapping = vector_store.index_to_docstore_id
+        positions = [position for position, mapped in mapping.items() if mapped == doc_id]
+        if isinstance(vector_store.index, faiss.IndexFlat):
+            # Flat 删除会压缩索引，恢复时按原向量重新写入（位置变到末尾）
+            vector = vector_store.index.reconstruct(positions[0])
+            self.apply_delete([doc_id])
+
+            def restore():
+                self.apply_add([doc.page_content], [vector], [doc.metadata], [doc_id])
+        else:
+            self.apply_delete([doc_id])
+
+            def restore():
+                # 墓碑删除只改了映射和 docstore，向量仍在原位置
+                for position in positions:
+                    mapping[position] = doc_id
+                vector_store.docstore.add({doc_id: doc})
+                self.tombstones -= 1
+                if self.lexical is not None:
+                    self.lexical.add([doc_id], [doc.page_content])
+                self.doc_bytes += _doc_bytes(doc)
+        return restore
+
+    def apply_update(self, doc_id: str, text: str, vector, metadata: dict) -> Callable[[], None]:
+        """先删后增地替换单个文档；新增失败时恢复原文档后抛出异常，内存中不会丢文档。
+
+        返回撤销整个替换的函数，调用方写 journal 失败时调用，保持内存状态与 journal 一致。
+        """
+        restore = self._delete_restorable(doc_id)
+        try:
+            self.apply_add([text], [vector], [metadata], [doc_id])
+        except Exception:
+            if self.has_doc(doc_id):
+                self.apply_delete([doc_id])
+            restore()
+            raise
+
+        def undo():
+            self.apply_delete([doc_id])
+            restore()
+        return undo
+
+    def export_documents(self):
+        """导出所有有效文档及其向量（阻塞调用）。PQ 等有损索引无法还原向量，vectors 返回 None。"""
+        vector_store = self.vector_store
+        positions, ids, texts, metadatas = [], [], [], []
+        for position, doc_id in sorted(vector_store.index_to_docstore_id.items()):
+            if doc_id is None:
+                continue
+            doc = vector_store.docstore.search(doc_id)
+            positions.append(position)
+            ids.append(doc_id)
+            texts.append(doc.page_content)
+            metadatas.append(doc.metadata)
+        vectors = None
+        index = vector_store.index
+        full_vectors = getattr(vector_store, 'full_vectors', None)
+        if full_vectors is not None:
+            vectors = full_vectors.rows(np.asarray(positions, dtype=np.int64))
+        elif not is_lossy(index) and index.ntotal:
+            if isinstance(index, faiss.IndexIVF):
+                index.make_direct_map()
+            vectors = index.reconstruct_n(0, index.ntotal)[positions]
+        return ids, texts, metadatas, vectors
+
+    def lexical_index(self) -> LexicalIndex:
+        """返回 BM25 倒排索引，未构建时由 docstore 构建（阻塞调用，需在读锁内）。"""
+        with self._lexical_build_lock:
+            if self.lexical is None:
+                start = time.perf_counter()
+                index = LexicalIndex()
+                if self.vector_store is not None:
+                    docstore = self.vector_store.docstore
+                    for doc_id in self.vector_store.index_to_docstore_id.values():
+                        doc = docstore.search(doc_id) if doc_id is not None else None
+                        if isinstance(doc, Document):
+                            index.add([doc_id], [doc.page_content])
+                self.lexical = index
+                logger.info(f"倒排索引构建完成: store={self.name}, {index.info()}, "
+                            f"耗时={time.perf_counter() - start:.2f}s")
+            return self.lexical
+
+    def lexical_search(self, query: str, k: int) -> List[tuple]:
+        """BM25 检索，返回 (docstore id, 得分) 列表（阻塞调用，需在读锁内）。"""
+        return self.lexical_index().search(query, k)
+
+    def manifest(self) -> Dict[str, dict]:
+        """有效文档 id -> metadata（不复制，调用方只读），增量同步据此比对源数据。"""
+        if self.vector_store is None:
+            return {}
+        docstore = self.vector_store.docstore
+        manifest = {}
+        for doc_id in self.vector_store.index_to_docstore_id.values():
+            if doc_id is None:
+                continue
+            doc = docstore.search(doc_id)
+            if isinstance(doc, Document):
+                manifest[doc_id] = doc.metadata
+        return manifest
+
+    async def rebuild(self, kind: str, embed_documents: Callable[[List[str]], Awaitable[List[List[float]]]],
+                      nlist: Optional[int] = None, pq_m: Optional[int] = None,
+                      reduced_dim: Optional[int] = None) -> dict:
+        """按新的索引类型重建（迁移）整个 store，顺带清理墓碑，完成后立即 checkpoint。
+
+        重建期间持读锁：查询继续使用旧索引，变更等待重建完成。
+        embed_documents 在索引无法还原原始向量时对全部文档重新 embedding，应自行分批（单次执行器调用有超时）。
+        """
+        self._check_writable()
+        async with self.checkpoint_lock:
+            await self.lock.acquire_read(background=True)
+            try:
+                start = time.perf_counter()
+                ids, texts, metadatas, vectors = await asyncio.to_thread(self.export_documents)
+                if not ids:
+                    raise ValueError("store 中没有文档，无法重建索引")
+                if vectors is None:
+                    logger.info(f"当前索引无法还原原始向量，重新 embedding {len(texts)} 条文档: store={self.name}")
+                    vectors = np.asarray(await embed_documents(texts), dtype=np.float32)
+
+                def build():
+                    index = build_index(kind, vectors, self.metric, nlist=nlist, pq_m=pq_m, reduced_dim=reduced_dim)
+                    vector_store = _new_vector_store(self.embeddings, index)
+                    vector_store.add_embeddings(text_embeddings=list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+                    vector_store.full_vectors = None
+                    if is_two_stage(index):
+                        # 替换文件而不是原地改写，进行中的检索仍读旧文件
+                        vector_store.full_vectors = FullVectorFile.write_all(self.full_vectors_path, vectors)
+                    elif os.path.exists(self.full_vectors_path):
+                        os.remove(self.full_vectors_path)
+                    return vector_store
+
+                # 查询在开始时取 handle.vector_store 的引用，这里直接替换对象不影响进行中的检索
+                self.vector_store = await asyncio.to_thread(build)
+                self.tombstones = 0
+                self.bump_version()
+                seq = self.journal.last_seq
+                await asyncio.to_thread(self._write_checkpoint, seq)
+                self.journal.reset()
+                self.last_checkpoint = time.monotonic()
+                elapsed = time.perf_counter() - start
+                logger.info(f"索引重建完成: store={self.name}, {describe(self.vector_store.index)}, 耗时={elapsed:.2f}s")
+                return {**describe(self.vector_store.index), "elapsed_sec": round(elapsed, 3)}
+            finally:
+                self.lock.release_read(background=True)
+
+    def _write_checkpoint(self, seq: int):
+        # 先写临时目录再替换，避免落盘中途崩溃留下半个索引文件
+        tmp_dir = os.path.join(self.path, '.checkpoint-tmp')
+        if self.full_vectors is not None:
+            self.full_vectors.flush()
+        self.vector_store.save_local(tmp_dir)
+        for name in INDEX_FILES:
+            os.replace(os.path.join(tmp_dir, name), os.path.join(self.path, name))
+        write_checkpoint_seq(self.checkpoint_meta_path, seq)
+        if self.export_serving:
+            write_snapshot(self.path, self.vector_store, seq)
+
+    async def checkpoint(self) -> int:
+        """把当前索引整体落盘并清空 journal，返回 checkpoint 对应的 seq。"""
+        if self.read_only:
+            return self.journal.last_seq
+        async with self.checkpoint_lock:
+            # 持读锁落盘：查询照常进行（不为等待中的变更排队），变更等待 checkpoint 完成
+            await self.lock.acquire_read(background=True)
+            try:
+                seq = self.journal.last_seq
+                if self.vector_store is not None and self.journal.size_bytes > 0:
+                    start = time.perf_counter()
+                    await asyncio.to_thread(self._write_checkpoint, seq)
+                    self.journal.reset()
+                    logger.info(f"checkpoint 完成: store={self.name}, seq={seq}, 耗时={time.perf_counter() - start:.2f}s")
+                self.last_checkpoint = time.monotonic()
+            finally:
+                self.lock.release_read(background=True)
+        return seq
+
+    async def export_snapshot(self) -> dict:
+        """导出只读服务快照，供 RAG_SERVING_MODE=mmap 的 worker 进程加载。"""
+        self._check_writable()
+        async with self.checkpoint_lock:
+            await self.lock.acquire_read(background=True)
+            try:
+                if self.vector_store is None:
+                    raise ValueError("store 中没有文档，无法导出服务快照")
+                start = time.perf_counter()
+                manifest = await asyncio.to_thread(write_snapshot, self.path, self.vector_store, self.journal.last_seq)
+                logger.info(f"服务快照导出完成: store={self.name}, 耗时={time.perf_counter() - start:.2f}s")
+                return manifest
+            finally:
+                self.lock.release_read(background=True)
+
+    def close(self):
+        self.journal.close()
+        self.vector_store = None
+        self.lexical = None
+
+    def memory_info(self) -> dict:
+        index_bytes = memory_bytes(self.vector_store.index) if self.vector_store is not None else 0
+        # 两阶段索引的全精度向量以 mmap 方式读取，只有被访问的页进入 page cache
+        full_bytes = self.full_vectors.nbytes if self.full_vectors is not None else 0
+        if self.read_only:
+            # mmap 的文件页由所有 worker 共享，不计入进程堆内存；未能映射的部分（HNSW 邻接图等）按堆内存计
+            heap_bytes = getattr(self.vector_store, 'index_heap_bytes', 0)
+            mapped = index_bytes - heap_bytes + full_bytes
+            if self.vector_store is not None:
+                mapped += self.vector_store.docstore.nbytes
+            return {"index_bytes": heap_bytes, "doc_bytes": 0, "total_bytes": heap_bytes, "mmap_bytes": mapped}
+        info = {
+            "index_bytes": index_bytes,
+            "doc_bytes": self.doc_bytes,
+            "total_bytes": index_bytes + self.doc_bytes,
+        }
+        if full_bytes:
+            info["mmap_bytes"] = full_bytes
+        return info
+
+    def info(self) -> dict:
+        return {
+            "store": self.name,
+            "loaded": True,
+            "count": self.count,
+            "tombstones": self.tombstones,
+            "index": describe(self.vector_store.index) if self.vector_store is not None else None,
+            "version": self.version,
+            "read_only": self.read_only,
+            "journal_bytes": self.journal.size_bytes,
+            "lexical": self.lexical.info() if self.lexical is not None else None,
+            "memory": self.memory_info(),
+        }
+
+
+class StoreRegistry:
+    """按 store 名称各自维护一个 FAISS 索引，首次使用时才从磁盘加载。"""
+
+    def __init__(self, root: str, embeddings, journal_fsync: bool = True,
+                 index_kind: str = 'auto', metric: int = faiss.METRIC_INNER_PRODUCT,
+                 read_only: bool = False, export_serving: bool = False):
+        self.root = root
+        self.embeddings = embeddings
+        self.journal_fsync = journal_fsync
+        self.index_kind = index_kind
+        self.metric = metric
+        self.read_only = read_only
+        self.export_serving = export_serving
+        self._stores: Dict[str, VectorStoreHandle] = {}
+        self._load_lock = asyncio.Lock()
+        if not read_only:
+            os.makedirs(root, exist_ok=True)
+
+    def store_path(self, name: str) -> str:
+        if not _STORE_NAME.match(name or ''):
+            raise ValueError(f"非法的 store 名称: {name!r}")
+        return os.path.join(self.root, name)
+
+    def loaded(self) -> List[VectorStoreHandle]:
+        return list(self._stores.values())
+
+    def on_disk(self) -> List[str]:
+        return sorted(
+            name for name in os.listdir(self.root)
+            if _STORE_NAME.match(name) and os.path.isdir(os.path.join(self.root, name))
+        )
+
+    async def get(self, name: str, create: bool = True) -> Optional[VectorStoreHandle]:
+        handle = self._stores.get(name)
+        if handle is None:
+            path = self.store_path(name)
+            if (not create or self.read_only) and not os.path.isdir(path):
+                return None
+            async with self._load_lock:
+                handle = self._stores.get(name)
+                if handle is None:
+                    handle = VectorStoreHandle(name, path, self.embeddings, self.journal_fsync,
+                                               index_kind=self.index_kind, metric=self.metric,
+                                               read_only=self.read_only, export_serving=self.export_serving)
+                    await asyncio.to_thread(handle.load)
+                    self._stores[name] = handle
+        handle.last_used = time.monotonic()
+        return handle
+
+    async def drop(self, name: str, delete_files: bool = False) -> bool:
+        """卸载 store 释放内存（先 checkpoint）；delete_files=True 时同时删除磁盘数据。"""
+        path = self.store_path(name)
+        if delete_files and self.read_only:
+            raise RuntimeError("只读服务模式下不能删除 store 数据")
+        existed = os.path.isdir(path) or name in self._stores
+        handle = self._stores.get(name)
+        if handle is not None:
+            if not delete_files:
+                await handle.checkpoint()
+            self._stores.pop(name, None)
+            # 等待仍在进行的检索结束
+            async with handle.lock.write():
+                handle.close()
+        if delete_files and os.path.isdir(path):
+            await asyncio.to_thread(shutil.rmtree, path)
+        return existed
+
+    def list_stores(self) -> List[dict]:
+        infos = {handle.name: handle.info() for handle in self._stores.values()}
+        for name in self.on_disk():
+            if name not in infos:
+                infos[name] = {"store": name, "loaded": False, "disk_bytes": _dir_bytes(os.path.join(self.root, name))}
+        return [infos[name] for name in sorted(infos)]
+
+
+def migrate_legacy_layout(root: str, default_store: str):
+    """旧版本把唯一的索引直接放在 vector-store/ 下，迁移到 vector-store/<default_store>/。"""
+    legacy = [name for name in STATE_FILES if os.path.exists(os.path.join(root, name))]
+    target = os.path.join(root, default_store)
+    if not legacy or os.path.exists(os.path.join(target, 'index.faiss')):
+        return
+    os.makedirs(target, exist_ok=True)
+    for name in legacy:
+        os.replace(os.path.join(root, name), os.path.join(target, name))
+    logger.info(f"已将旧版向量存储迁移到: {target}")
@@ -4,33 +4,82 @@ import logging
 import requests
 from fastapi import FastAPI, WebSocket
 import uvicorn
-from typing import List, Dict, Any
-from ws_tools import ws_tool, ws_endpoint
+from typing import List, Dict, Any, Optional
+from ws_tools import add_metrics_route, ws_tool, ws_endpoint
+from ws_logging import preview, setup_logging
+import ws_metrics
+from url_matcher import UrlMatcher
 
-app = FastAPI()
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s %(message)s',
-)
+# 日志经队列由后台线程写出，级别 / 格式 / 抽样率见 ws_logging
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # 如果 ragservice 可直接 import，则直接调用其方法；如需微服务可改为 ws/HTTP 远程调用
 from rag_service import retrieve  # 假设 rag_service.py 在同目录或包下
 # 注意：Python 文件名不能有中划线，应为 rag_service.py
+import rag_service
+
+# 与 rag_service 相同：本地模式在启动时预热模型，--no-model 模式转发到 vector_service
+app = FastAPI(lifespan=rag_service.lifespan)
+add_metrics_route(app)
+
+# query_url 的相似度阈值（余弦相似度），低于阈值视为没有匹配的 URL，返回空列表。
+# 默认不过滤，始终返回最相近的页面（与引入阈值之前一致）；由调用方根据结果中的 score 判断，
+# 或按语料上实测的分数分布设置 URL_SCORE_THRESHOLD（bge-large-zh v1 的相似度大多在 0.6~1 之间）
+_threshold = os.environ.get("URL_SCORE_THRESHOLD")
+URL_SCORE_THRESHOLD = float(_threshold) if _threshold else None
+
+# 精确意图快速通道：输入中出现唯一页面的名称 / 别名时直接由目录自动机返回，不走向量检索
+URL_EXACT_MATCH = os.environ.get("URL_EXACT_MATCH", "1") != "0"
+URL_CATALOGUE_PATH = os.environ.get("URL_CATALOGUE_PATH", os.path.join(os.path.dirname(__file__), 'data', 'url.json'))
+
+def load_url_matcher() -> Optional[UrlMatcher]:
+    if not URL_EXACT_MATCH:
+        return None
+    try:
+        return UrlMatcher.from_file(URL_CATALOGUE_PATH)
+    except Exception as e:
+        logger.warning(f"加载 URL 目录失败，query_url 只使用向量检索: {URL_CATALOGUE_PATH}, {e}")
+        return None
+
+url_matcher = load_url_matcher()
+
+# term_match 的短输入（缩写、业务术语）走 BM25 词法检索，不经过 embedding 模型；没有词法命中时再退回向量检索
+TERM_LEXICAL_MAX_CHARS = int(os.environ.get("TERM_LEXICAL_MAX_CHARS", 8))
+# 较长的输入用 hybrid（词法 + 向量 RRF 融合），兼顾精确词与语义
+TERM_MATCH_MODE = os.environ.get("TERM_MATCH_MODE", "hybrid")
 
 async def rag_term_match_tool(text: str, top_k: int = 3):
-    # 示例实现：直接调用 retrieve，或自定义 term 匹配逻辑
-    # 这里假设 retrieve 支持 term 检索
-    return await retrieve(text, top_k=top_k, store="term")
+    if len(text.strip()) <= TERM_LEXICAL_MAX_CHARS:
+        result = await retrieve(text, top_k=top_k, store="term", mode="lexical")
+        if result:
+            return result
+        return await retrieve(text, top_k=top_k, store="term", mode="dense")
+    return await retrieve(text, top_k=top_k, store="term", mode=TERM_MATCH_MODE)
 
+# 每条结果带 route 字段说明由哪条路径返回：exact（目录自动机）或 vector（向量检索）；
+# 两条路径的次数与耗时也记在 metrics 工具中 query_url 的 exact_match / vector_search 阶段下
 @ws_tool('query_url')
-async def query_url(natural_language_input: str) -> List[Dict]:
-    logger.info(f"query_url called with input: {natural_language_input}")
+async def query_url(natural_language_input: str, score_threshold: Optional[float] = None) -> List[Dict]:
+    logger.debug("query_url called with input: %s", preview(natural_language_input))
+    if score_threshold is None:
+        score_threshold = URL_SCORE_THRESHOLD
     try:
-        result = await retrieve(natural_language_input, top_k=1, store="url")
-        logger.info(f"query_url via ragservice result: {result}")
-        return result
+        matcher = url_matcher
+        if matcher is not None:
+            with ws_metrics.span('exact_match'):
+                item, matches = matcher.resolve(natural_language_input)
+            if item is not None:
+                logger.debug("query_url exact hit: %s -> %s", [m.keyword for m in matches], item["uri"])
+                metadata = {"uri": item["uri"], "ap": item.get("ap", ""), "desc": item["desc"]}
+                return [{"content": item["desc"], "metadata": metadata, "score": 1.0, "route": "exact"}]
+            if matches:
+                logger.debug("query_url 命中多个页面，退回向量检索: %s", [m.keyword for m in matches])
+        with ws_metrics.span('vector_search'):
+            result = await retrieve(natural_language_input, top_k=1, store="url", score_threshold=score_threshold)
+        logger.debug("query_url via ragservice result: %s", preview(result))
+        # 本地模式下结果列表来自查询缓存，复制后再加字段
+        return [{**item, "route": "vector"} for item in result]
     except Exception as e:
         logger.error(f"query_url error: {e}")
         return [{"error": str(e)}]
@@ -39,17 +88,30 @@ async def query_url(natural_language_input: str) -> List[Dict]:
 async def term_match_tool(text: str, top_k: int = 3) -> List[Dict]:
     try:
         result = await rag_term_match_tool(text, top_k)
-        logger.info(f"term_match via ragservice result: {result}")
+        logger.debug("term_match via ragservice result: %s", preview(result))
         return result
     except Exception as e:
         logger.error(f"term_match_tool error: {e}")
         return [{"error": f"term_match_tool failed: {str(e)}"}]
 
+# url.json 更新后重新构建目录自动机（不影响向量 store，向量数据用 scripts/url_vectorizor.py 同步）
+@ws_tool('reload_url_catalogue')
+async def reload_url_catalogue() -> dict:
+    global url_matcher
+    matcher = load_url_matcher()
+    if matcher is None:
+        return {"error": "URL 目录未加载（URL_EXACT_MATCH=0 或文件读取失败）"}
+    url_matcher = matcher
+    return {"status": "reloaded", "pages": len(matcher.catalogue), "keywords": len(matcher.keywords)}
+
 @app.websocket("/ws")
 async def ws_main(ws: WebSocket):
     await ws_endpoint(ws, logger)
 
 if __name__ == "__main__":
+    args = rag_service.parse_args()
+    if args.no_model:
+        rag_service.use_remote_vector_service(args.vector_service)
     # 只启动服务，不运行测试，避免阻塞 WebSocket 服务
     logger.info("Starting URL Assistant WebSocket server on 127.0.0.1:9101")
-    uvicorn.run(app, host="0.0.0.0", port=9101)
+    uvicorn.run(app, host="0.0.0.0", port=9101, log_config=None)
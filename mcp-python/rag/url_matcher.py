@@ -0,0 +1,149 @@
+import json
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from query_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# 页面目录的精确意图匹配：把 url.json 中每个页面的描述、别名（可选 aliases 字段）和 ap 编码编进一个
+# Aho-Corasick 自动机，一次扫描输入即可找出其中出现的所有页面名称。输入基本就是一个页面的名称时直接返回，
+# 不经过 embedding 与向量检索；没有命中、指向多个页面或命中只占句子的一小部分时由调用方退回向量检索。
+
+# 页面描述去掉这些通用后缀后也作为关键词（"联系人列表页" -> "联系人"），最短保留 2 个字
+GENERIC_SUFFIXES = ('列表页', '列表', '页')
+MIN_KEYWORD_CHARS = 2
+# 命中的关键词至少覆盖输入（去掉操作性用语后）的这个比例才算精确命中：
+# "联系人列表页" 直接返回，"帮我总结一下今天的报表" 中的 "总结" 只是句中一个词，交给向量检索
+MIN_COVERAGE = 0.6
+# 输入中常见的操作性用语，不计入覆盖率的分母
+FILLER_WORDS = ('帮我', '请', '打开', '进入', '跳转到', '切换到', '我要', '我想', '查看', '看一下', '看看', '页面')
+
+
+class Match(NamedTuple):
+    start: int
+    end: int
+    keyword: str
+    # 该关键词指向的页面下标（同一关键词可能对应多个页面，如去掉后缀后的 "联系人"）
+    entries: Tuple[int, ...]
+
+
+class AhoCorasick:
+    """多模式串匹配自动机。构建后只读，可在多个协程间共享。"""
+
+    def __init__(self, keywords: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 每个状态上结束的关键词（含经失败链接可达的）
+        self._output: List[List[str]] = [[]]
+        for keyword in keywords:
+            self._insert(keyword)
+        self._link()
+
+    def _insert(self, keyword: str):
+        state = 0
+        for char in keyword:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = nxt
+        if keyword not in self._output[state]:
+            self._output[state].append(keyword)
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str]]:
+        """返回 text 中所有关键词出现的位置 (start, end, keyword)，可重叠。"""
+        matches = []
+        state = 0
+        goto, fail, output = self._goto, self._fail, self._output
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for keyword in output[state]:
+                matches.append((i + 1 - len(keyword), i + 1, keyword))
+        return matches
+
+    def __len__(self):
+        return len(self._goto)
+
+
+def _keywords(item: dict) -> List[str]:
+    desc = normalize_query(item.get("desc", ""))
+    keywords = [desc]
+    for suffix in GENERIC_SUFFIXES:
+        if desc.endswith(suffix):
+            keywords.append(desc[:-len(suffix)])
+            break
+    keywords.extend(normalize_query(alias) for alias in item.get("aliases", []))
+    if item.get("ap"):
+        keywords.append(normalize_query(item["ap"]))
+    return [keyword for keyword in dict.fromkeys(keywords) if len(keyword) >= MIN_KEYWORD_CHARS]
+
+
+class UrlMatcher:
+    def __init__(self, catalogue: List[dict]):
+        self.catalogue = catalogue
+        owners: Dict[str, List[int]] = {}
+        for i, item in enumerate(catalogue):
+            for keyword in _keywords(item):
+                owners.setdefault(keyword, []).append(i)
+        self.keywords: Dict[str, Tuple[int, ...]] = {keyword: tuple(entries) for keyword, entries in owners.items()}
+        self.automaton = AhoCorasick(self.keywords)
+
+    @classmethod
+    def from_file(cls, path: str) -> "UrlMatcher":
+        with open(path, 'r', encoding='utf-8') as f:
+            matcher = cls(json.load(f))
+        logger.info(f"URL 目录自动机构建完成: 页面 {len(matcher.catalogue)} 个, 关键词 {len(matcher.keywords)} 个, "
+                    f"状态 {len(matcher.automaton)} 个")
+        return matcher
+
+    def matches(self, text: str) -> List[Match]:
+        """输入中出现的关键词，去掉被更长命中完全覆盖的部分（"联系人详情页" 中的 "联系人"）。"""
+        found = [Match(start, end, keyword, self.keywords[keyword])
+                 for start, end, keyword in self.automaton.find_all(normalize_query(text))]
+        return [m for m in found
+                if not any(o.start <= m.start and m.end <= o.end and (o.end - o.start) > (m.end - m.start)
+                           for o in found)]
+
+    @staticmethod
+    def coverage(text: str, matches: List[Match]) -> float:
+        """命中的关键词覆盖输入的比例；未被命中覆盖的操作性用语不计入输入长度。"""
+        text = normalize_query(text)
+        covered = [False] * len(text)
+        for m in matches:
+            covered[m.start:m.end] = [True] * (m.end - m.start)
+        filler = [False] * len(text)
+        for word in FILLER_WORDS:
+            start = text.find(word)
+            while start != -1:
+                filler[start:start + len(word)] = [True] * len(word)
+                start = text.find(word, start + 1)
+        length = sum(1 for c, f, char in zip(covered, filler, text) if (c or not f) and not char.isspace())
+        return sum(covered) / length if length else 0.0
+
+    def resolve(self, text: str) -> Tuple[Optional[dict], List[Match]]:
+        """输入基本就是唯一一个页面的名称时返回该页面，否则返回 None（没有命中、有歧义或命中只是句中一部分），
+        同时返回命中的关键词。"""
+        matches = self.matches(text)
+        entries = {entry for m in matches for entry in m.entries}
+        if len(entries) == 1 and self.coverage(text, matches) >= MIN_COVERAGE:
+            return self.catalogue[entries.pop()], matches
+        return None, matches
@@ -0,0 +1,124 @@
+import os
+import json
+import base64
+import logging
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def encode_vectors(vectors) -> str:
+    # float32 小端序原始字节 + base64，比十进制字符串紧凑得多
+    arr = np.asarray(vectors, dtype='<f4')
+    return base64.b64encode(arr.tobytes()).decode('ascii')
+
+
+def decode_vectors(data: str, dim: int) -> np.ndarray:
+    arr = np.frombuffer(base64.b64decode(data), dtype='<f4')
+    return arr.reshape(-1, dim)
+
+
+class MutationJournal:
+    """向量存储的追加式变更日志（每行一条 JSON 记录）。
+
+    记录格式：
+        {"seq": 1, "op": "add", "ids": [...], "texts": [...], "metadatas": [...], "dim": 1024, "vectors": "<base64>"}
+        {"seq": 2, "op": "delete", "ids": [...]}
+
+    add 记录可带 "deleted": [...]，与新增在同一条记录里删除这些文档（增量同步一次提交）。
+    """
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self.last_seq = 0
+        self._fp = None
+
+    @property
+    def size_bytes(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def open(self, start_seq: int = 0):
+        self.last_seq = max(self.last_seq, start_seq)
+        self._fp = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        if self._fp:
+            self._fp.close()
+            self._fp = None
+
+    def append_add(self, ids: List[str], texts: List[str], metadatas: List[dict], vectors,
+                   deleted: Optional[List[str]] = None) -> int:
+        arr = np.asarray(vectors, dtype='<f4')
+        record = {
+            "op": "add",
+            "ids": ids,
+            "texts": texts,
+            "metadatas": metadatas,
+            "dim": int(arr.shape[1]),
+            "vectors": encode_vectors(arr),
+        }
+        if deleted:
+            record["deleted"] = deleted
+        return self._append(record)
+
+    def append_delete(self, ids: List[str]) -> int:
+        return self._append({"op": "delete", "ids": ids})
+
+    def _append(self, record: Dict) -> int:
+        if self._fp is None:
+            self.open()
+        self.last_seq += 1
+        record = {"seq": self.last_seq, **record}
+        self._fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._fp.flush()
+        if self.fsync:
+            os.fsync(self._fp.fileno())
+        return self.last_seq
+
+    def replay(self, after_seq: int = 0) -> Iterator[Dict]:
+        """按顺序读出 seq > after_seq 的记录；末尾写了一半的行（崩溃残留）会被跳过。"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for lineno, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"journal 第 {lineno} 行损坏，已跳过: {self.path}")
+                    continue
+                self.last_seq = max(self.last_seq, record.get("seq", 0))
+                if record.get("seq", 0) > after_seq:
+                    yield record
+
+    def reset(self):
+        """checkpoint 完成后清空日志（seq 继续递增）。"""
+        self.close()
+        with open(self.path, 'w', encoding='utf-8'):
+            pass
+        self.open()
+
+
+def read_checkpoint_seq(path: str) -> int:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return int(json.load(f).get("seq", 0))
+    except (OSError, ValueError):
+        return 0
+
+
+def write_checkpoint_seq(path: str, seq: int):
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({"seq": seq}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -1,112 +1,751 @@
 import json
+import hashlib
 import logging
+import collections
 import random
+import time
 from fastapi import FastAPI, WebSocket
 import uvicorn
-from typing import List, Dict
-from ws_tools import ws_tool, ws_endpoint
+from typing import List, Dict, Callable, Optional, Any, NamedTuple
+from ws_tools import add_metrics_route, ws_tool, ws_endpoint
+from ws_logging import preview, setup_logging
+import ws_metrics
+from admission import BusyError
 import os
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import embedding_model
+from embedding_model import (EMBED_BATCH_SIZE, EMBED_DIM, EMBED_MAX_BATCH, EMBED_TOKEN_BUDGET, get_embeddings,
+                             padding_efficiency, plan_batches)
+import numpy as np
 
-# 设置 huggingface 镜像环境变量
-os.environ["HF_ENDPOINT"] = "https://hf-mirror.com"
-
-# 日志系统配置
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s %(message)s',
-)
+# 日志系统配置：经队列由后台线程写出，级别 / 格式 / 抽样率见 ws_logging
+setup_logging()
 logger = logging.getLogger(__name__)
 
-# 导入向量数据库相关依赖
-from langchain_community.embeddings import HuggingFaceBgeEmbeddings
-embeddings = HuggingFaceBgeEmbeddings(
-    model_name="BAAI/bge-large-zh",  # 可根据需要修改模型名
-    model_kwargs={'device': "cpu"},
-    encode_kwargs={
-        "normalize_embeddings": True,
-        "trust_remote_code": True,
-        "batch_size": 32,
-        "device": "cpu"
-    }
-)
-# from langchain_modelscope import ModelScopeEmbeddings
-# embeddings = ModelScopeEmbeddings(
-#     model_id="BAAI/bge-m3"
-# )
+# 进程内共享的 embedding 模型，首次 embedding 时才加载（可通过 RAG_WARMUP 在服务启动时预热）
+embeddings = get_embeddings()
 
+import asyncio
+import contextlib
+from contextlib import asynccontextmanager
 import faiss
 from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 from uuid import uuid4
+from query_cache import LRUTTLCache, normalize_query
+from store_registry import ReadWriteLock, StoreRegistry, VectorStoreHandle, migrate_legacy_layout
+from full_vectors import rescore
+from index_factory import (DEFAULT_RESCORE_FACTOR, INDEX_KINDS, is_two_stage, recall_latency_report, search_params,
+                           to_similarity)
 
-VECTOR_STORE_DIR = os.path.join(os.path.dirname(__file__), 'vector-store')
+# 每个 store 一个独立的 FAISS 索引，数据在 vector-store/<store>/ 下
+VECTOR_STORE_DIR = os.environ.get("RAG_VECTOR_STORE_DIR", os.path.join(os.path.dirname(__file__), 'vector-store'))
+DEFAULT_STORE = 'url'
 
-# 初始化或加载向量存储
-os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
-if os.listdir(VECTOR_STORE_DIR):
-    try:
-        vector_store = FAISS.load_local(
-            folder_path=VECTOR_STORE_DIR,
-            embeddings=embeddings,
-            allow_dangerous_deserialization=True
-        )
-        logger.info(f"向量存储加载成功: {VECTOR_STORE_DIR}")
-    except Exception as e:
-        logger.error(f"向量存储加载失败: {e}")
-        vector_store = None
+# write-behind 持久化：变更只追加到 journal，后台在 journal 超过大小阈值或距上次 checkpoint 超过时间阈值时整体落盘
+JOURNAL_MAX_BYTES = int(os.environ.get("RAG_JOURNAL_MAX_BYTES", 64 * 1024 * 1024))
+CHECKPOINT_INTERVAL = float(os.environ.get("RAG_CHECKPOINT_INTERVAL", 300))
+JOURNAL_FSYNC = os.environ.get("RAG_JOURNAL_FSYNC", "1") != "0"
+
+# 新建 store 的索引类型：flat / ivf_flat / ivf_pq / hnsw / auto（按首批数据量选择）；已有 store 用 rag_rebuild_index 迁移
+INDEX_KIND = os.environ.get("RAG_INDEX_KIND", "auto")
+
+# 服务模式：readwrite（默认，单进程读写）或 mmap（只读，以 mmap 打开写进程导出的服务快照，可多 worker 共享 page cache）
+SERVING_MODE = os.environ.get("RAG_SERVING_MODE", "readwrite")
+READ_ONLY = SERVING_MODE == "mmap"
+# 写进程每次 checkpoint 时同时导出服务快照
+SERVING_EXPORT = os.environ.get("RAG_SERVING_EXPORT", "0") != "0"
+# uvicorn worker 进程数，仅 mmap 模式下可大于 1（多个写进程会各自写 journal 互相覆盖）
+WORKERS = int(os.environ.get("RAG_WORKERS", 1))
+
+if not READ_ONLY:
+    os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+    migrate_legacy_layout(VECTOR_STORE_DIR, DEFAULT_STORE)
+# store 首次使用时才加载
+registry = StoreRegistry(VECTOR_STORE_DIR, embeddings, journal_fsync=JOURNAL_FSYNC, index_kind=INDEX_KIND,
+                         read_only=READ_ONLY, export_serving=SERVING_EXPORT)
+
+# 执行器配置：模型推理与索引检索都放到池中执行，避免阻塞事件循环
+# RAG_EXECUTOR=thread 时推理和检索共用线程池；=process 时推理放到进程池（每个进程各加载一份模型），检索仍在线程池
+EXECUTOR_MODE = os.environ.get("RAG_EXECUTOR", "thread")
+EXECUTOR_WORKERS = int(os.environ.get("RAG_EXECUTOR_WORKERS", min(4, os.cpu_count() or 1)))
+# 已提交但未完成的任务上限，超过后直接拒绝而不是无限排队
+EXECUTOR_QUEUE_SIZE = int(os.environ.get("RAG_EXECUTOR_QUEUE_SIZE", 64))
+# 单个任务的等待超时（秒）；超时只释放调用方，已在执行的任务会跑完
+EXECUTOR_TIMEOUT = float(os.environ.get("RAG_EXECUTOR_TIMEOUT", 30))
+# 批量导入 / 批量向量化同时执行的请求数上限（准入控制），避免大批量写入挤占查询的推理资源
+RAG_INGEST_CONCURRENCY = int(os.environ.get("RAG_INGEST_CONCURRENCY", 2))
+
+_search_executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="rag-worker")
+if EXECUTOR_MODE == "process":
+    _embed_executor = ProcessPoolExecutor(max_workers=EXECUTOR_WORKERS, initializer=embedding_model.init_worker)
 else:
-    vector_store = None
+    _embed_executor = _search_executor
+_pending = 0
+
+class ExecutorBusyError(BusyError):
+    # 归入 BusyError，调用方收到 busy 应答后按 retry_after 退避重试
+    pass
+
+async def run_blocking(executor, fn: Callable, *args, read_lock: Optional[ReadWriteLock] = None) -> Any:
+    """在池中执行阻塞函数，带有界排队和超时。
+
+    传入 read_lock 时，读锁一直持有到池中任务真正结束（即使调用方已超时返回），
+    保证写操作不会与仍在运行的检索并发修改索引。
+    """
+    global _pending
+    if _pending >= EXECUTOR_QUEUE_SIZE:
+        raise ExecutorBusyError(f"执行队列已满 ({_pending}/{EXECUTOR_QUEUE_SIZE})，请稍后重试", 0.5)
+    _pending += 1
+    try:
+        if read_lock:
+            await read_lock.acquire_read()
+        try:
+            fut = asyncio.get_running_loop().run_in_executor(executor, functools.partial(fn, *args))
+        except BaseException:
+            if read_lock:
+                read_lock.release_read()
+            raise
+        if read_lock:
+            fut.add_done_callback(lambda _: read_lock.release_read())
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), EXECUTOR_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"执行超时 ({EXECUTOR_TIMEOUT}s)")
+    finally:
+        _pending -= 1
+
+async def embed_documents(texts: List[str]) -> List[List[float]]:
+    if EXECUTOR_MODE == "process":
+        return await run_blocking(_embed_executor, embedding_model.worker_embed_documents, texts)
+    return await run_blocking(_embed_executor, embeddings.embed_documents, texts)
+
+async def embed_queries(texts: List[str]) -> List[List[float]]:
+    if EXECUTOR_MODE == "process":
+        return await run_blocking(_embed_executor, embedding_model.worker_embed_queries, texts)
+    return await run_blocking(_embed_executor, embedding_model.embed_queries, embeddings, texts)
+
+async def embed_batch(texts: List[str]) -> List[List[float]]:
+    # texts 作为一个批次推理，不再按 EMBED_BATCH_SIZE 拆分
+    if EXECUTOR_MODE == "process":
+        return await run_blocking(_embed_executor, embedding_model.worker_embed_batch, texts)
+    return await run_blocking(_embed_executor, embedding_model.embed_batch, embeddings, texts)
+
+# 统计 token 数时每次提交给执行器的文本条数，避免超大导入单次占用执行器超过 EXECUTOR_TIMEOUT
+TOKENIZE_CHUNK = 4096
+
+async def token_lengths(texts: List[str]) -> List[int]:
+    lengths = []
+    for start in range(0, len(texts), TOKENIZE_CHUNK):
+        chunk = texts[start:start + TOKENIZE_CHUNK]
+        if EXECUTOR_MODE == "process":
+            lengths.extend(await run_blocking(_embed_executor, embedding_model.worker_token_lengths, chunk))
+        else:
+            lengths.extend(await run_blocking(_embed_executor, embedding_model.token_lengths, embeddings, chunk))
+    return lengths
+
+# 两级查询缓存：归一化查询文本 -> 向量；(查询, store, top_k, store 版本) -> 结果
+# 增删改会递增 store 版本号，旧结果不再命中，随 LRU/TTL 淘汰
+CACHE_TTL = float(os.environ.get("RAG_CACHE_TTL", 600))
+embedding_cache = LRUTTLCache(int(os.environ.get("RAG_CACHE_EMBEDDING_SIZE", 4096)), CACHE_TTL)
+result_cache = LRUTTLCache(int(os.environ.get("RAG_CACHE_RESULT_SIZE", 2048)), CACHE_TTL)
+
+async def checkpoint(store: Optional[str] = None) -> Dict[str, int]:
+    """把已加载的 store（或指定 store）整体落盘并清空 journal，返回各 store 的 checkpoint seq。"""
+    handles = registry.loaded()
+    if store is not None:
+        handles = [handle for handle in handles if handle.name == store]
+    return {handle.name: await handle.checkpoint() for handle in handles}
+
+async def _checkpoint_loop():
+    while True:
+        await asyncio.sleep(1)
+        for handle in registry.loaded():
+            if handle.read_only:
+                continue
+            size = handle.journal.size_bytes
+            if size and (size >= JOURNAL_MAX_BYTES or time.monotonic() - handle.last_checkpoint >= CHECKPOINT_INTERVAL):
+                try:
+                    await handle.checkpoint()
+                except Exception as e:
+                    logger.error(f"checkpoint 失败: store={handle.name}, {e}", exc_info=True)
+
+# 服务启动时预加载模型，避免首个请求承担加载耗时；导入本模块的脚本不经过 lifespan，不受影响
+WARMUP = os.environ.get("RAG_WARMUP", "1") != "0"
+
+async def warm_up():
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    if EXECUTOR_MODE == "process":
+        # 每个 worker 进程各自加载模型，提交与进程数相同的预热任务
+        await asyncio.gather(*(loop.run_in_executor(_embed_executor, embedding_model.worker_embed_documents, ["warm up"])
+                               for _ in range(EXECUTOR_WORKERS)))
+    else:
+        await asyncio.to_thread(embedding_model.warm_up)
+    logger.info(f"模型预热完成: 耗时={time.perf_counter() - start:.2f}s")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP:
+        await warm_up()
+    task = asyncio.create_task(_checkpoint_loop())
+    try:
+        yield
+    finally:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        # 退出前把 journal 合并进 checkpoint
+        await checkpoint()
+        _search_executor.shutdown(wait=False, cancel_futures=True)
+        if _embed_executor is not _search_executor:
+            _embed_executor.shutdown(wait=False, cancel_futures=True)
+
+app = FastAPI(lifespan=lifespan)
+# Prometheus 抓取入口：GET /metrics
+add_metrics_route(app)
+
+# 查询微批：窗口期（毫秒）内到达的查询合并成一次批量 embedding + 一次批量检索，批满立即执行
+QUERY_BATCH_WINDOW_MS = float(os.environ.get("RAG_QUERY_BATCH_WINDOW_MS", 5))
+QUERY_BATCH_MAX_SIZE = int(os.environ.get("RAG_QUERY_BATCH_MAX_SIZE", EMBED_BATCH_SIZE))
 
-app = FastAPI()
+# 两阶段索引（pca_rescore / trunc_rescore）第一轮取 top_k 的多少倍候选交给全精度向量重打分
+RESCORE_FACTOR = int(os.environ.get("RAG_RESCORE_FACTOR", DEFAULT_RESCORE_FACTOR))
 
+class SearchOptions(NamedTuple):
+    # ANN 索引的单次检索参数；None 表示使用索引默认值
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    rescore_factor: Optional[int] = None
+
+class _PendingQuery(NamedTuple):
+    handle: VectorStoreHandle
+    query: str
+    top_k: int
+    score_threshold: Optional[float]
+    options: SearchOptions
+    future: asyncio.Future
+    enqueued: float
+    # 批内各阶段耗时（batch_wait / embed / search），由等待的协程记到所属工具的指标下
+    timings: dict
+
+def _search_batch(handle: VectorStoreHandle, vectors, ks: List[int], thresholds: List[Optional[float]],
+                  options: SearchOptions) -> List[List[tuple]]:
+    """对查询矩阵做一次 FAISS 检索，再按各自的 top_k 和分数阈值拆分出 (docstore id, 相似度)。需在该 store 的读锁内调用。
+
+    结果按相似度降序排列，遇到第一个低于阈值的结果即停止；文档由调用方按需从 docstore 读取（见 _result_items）。
+    """
+    vector_store = handle.vector_store
+    matrix = np.asarray(vectors, dtype=np.float32)
+    max_k = max(ks)
+    # 墓碑仍占据检索结果位置，适当多取一些
+    fetch_k = min(max_k + min(handle.tombstones, max_k * 4), vector_store.index.ntotal)
+    params = search_params(vector_store.index, options.nprobe, options.ef_search)
+    full_vectors = getattr(vector_store, 'full_vectors', None)
+    if full_vectors is not None and is_two_stage(vector_store.index):
+        # 降维向量取候选，再用 mmap 中的全精度向量精确打分，分数即余弦相似度
+        factor = max(1, options.rescore_factor or RESCORE_FACTOR)
+        candidate_k = min(fetch_k * factor, vector_store.index.ntotal)
+        _, candidates = vector_store.index.search(matrix, max(candidate_k, 1), params=params)
+        scores, indices = rescore(full_vectors, matrix, candidates)
+    else:
+        distances, indices = vector_store.index.search(matrix, max(fetch_k, 1), params=params)
+        scores = to_similarity(vector_store.index, distances)
+    results = []
+    for row, row_scores, k, threshold in zip(indices, scores, ks, thresholds):
+        hits = []
+        for i, score in zip(row, row_scores):
+            if len(hits) >= k:
+                break
+            if i == -1:
+                continue
+            if threshold is not None and score < threshold:
+                break
+            doc_id = vector_store.index_to_docstore_id.get(int(i))
+            if doc_id is None:
+                continue
+            hits.append((doc_id, float(score)))
+        results.append(hits)
+    return results
+
+class QueryBatcher:
+    """把并发到达的 rag_query 合并批量执行，并把结果分发回各自的等待协程。
+
+    同一批内的查询共用一次 embedding，再按 (store, 检索参数) 分组各做一次批量检索。
+    """
+
+    def __init__(self, window_ms: float, max_batch: int):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending: List[_PendingQuery] = []
+        self._timer = None
+        self._tasks = set()
+
+    async def search(self, handle: VectorStoreHandle, query: str, top_k: int,
+                     score_threshold: Optional[float] = None, options: SearchOptions = SearchOptions()) -> List[tuple]:
+        fut = asyncio.get_running_loop().create_future()
+        timings = {}
+        self._pending.append(_PendingQuery(handle, query, top_k, score_threshold, options, fut,
+                                           time.perf_counter(), timings))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        try:
+            return await fut
+        finally:
+            ws_metrics.record_spans(timings)
+
+    def _flush(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[_PendingQuery]):
+        # 等待期间已被取消（如调用方超时）的请求不再计算
+        batch = [item for item in batch if not item.future.done()]
+        if not batch:
+            return
+        start = time.perf_counter()
+        for item in batch:
+            item.timings['batch_wait'] = start - item.enqueued
+        try:
+            keys = [normalize_query(item.query) for item in batch]
+            vectors = [embedding_cache.get(key) for key in keys]
+            missing = [i for i, vector in enumerate(vectors) if vector is None]
+            if missing:
+                computed = await embed_queries([batch[i].query for i in missing])
+                for i, vector in zip(missing, computed):
+                    vectors[i] = vector
+                    embedding_cache.put(keys[i], vector)
+                # 整批共用一次 embedding，批内每个查询都记同一耗时；全部命中缓存时不记
+                elapsed = time.perf_counter() - start
+                for item in batch:
+                    item.timings['embed'] = elapsed
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+        groups: Dict[tuple, list] = {}
+        for item, vector in zip(batch, vectors):
+            groups.setdefault((item.handle.name, item.options), []).append((item, vector))
+        await asyncio.gather(*(self._search_group(group) for group in groups.values()))
+
+    async def _search_group(self, group):
+        first = group[0][0]
+        try:
+            start = time.perf_counter()
+            results = await run_blocking(_search_executor, _search_batch, first.handle,
+                                         [vector for _, vector in group], [item.top_k for item, _ in group],
+                                         [item.score_threshold for item, _ in group], first.options,
+                                         read_lock=first.handle.lock)
+            elapsed = time.perf_counter() - start
+            for (item, _), hits in zip(group, results):
+                item.timings['search'] = elapsed
+                if not item.future.done():
+                    item.future.set_result(hits)
+        except Exception as e:
+            for item, _ in group:
+                if not item.future.done():
+                    item.future.set_exception(e)
+
+query_batcher = QueryBatcher(QUERY_BATCH_WINDOW_MS, QUERY_BATCH_MAX_SIZE)
+
+
+async def add_documents_batch(docs: List[dict], store: str = DEFAULT_STORE, batch_size: Optional[int] = None,
+                              progress: Optional[Callable[[int], None]] = None, vectors=None) -> List[str]:
+    """批量新增文档：分批 embedding（见 _embed_in_batches），一次性写入索引，并作为一条记录追加到 journal。
+
+    progress 为可选回调，每完成一批调用一次，参数为该批文档数。
+    vectors 为调用方已算好的向量（len(docs) x EMBED_DIM，需已归一化），传入时跳过 embedding。
+    """
+    handle = await registry.get(store)
+    texts = [doc.get("content", "") for doc in docs]
+    metadatas = [doc.get("metadata", {}) for doc in docs]
+    ids = [doc.get("id") or str(uuid4()) for doc in docs]
+    # apply_add 写入前也会检查，这里提前检查，避免 id 冲突时白做一遍 embedding
+    existing = [doc_id for doc_id in ids if handle.has_doc(doc_id)]
+    if existing:
+        raise ValueError(f"store {store} 中已存在 {len(existing)} 个相同 id 的文档: "
+                         f"{existing[:5]}{' ...' if len(existing) > 5 else ''}")
+    if vectors is not None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape != (len(docs), EMBED_DIM):
+            raise ValueError(f"vectors 形状应为 ({len(docs)}, {EMBED_DIM})，实际为 {vectors.shape}")
+        if progress:
+            progress(len(docs))
+    else:
+        with ws_metrics.span('embed'):
+            vectors = await _embed_in_batches(texts, batch_size, progress)
+    async with handle.lock.write():
+        # 写索引 + 追加 journal（含 fsync）
+        with ws_metrics.span('index_write'):
+            handle.apply_add(texts, vectors, metadatas, ids)
+            handle.journal.append_add(ids, texts, metadatas, vectors)
+        handle.bump_version()
+    return ids
+
+async def _embed_in_batches(texts: List[str], batch_size: Optional[int] = None,
+                            progress: Optional[Callable[[int], None]] = None):
+    """批量导入的 embedding，结果与 texts 顺序一致。
+
+    EMBED_TOKEN_BUDGET > 0 时按长度分桶、按 token 预算组批，batch_size 为每批条数上限（默认 EMBED_MAX_BATCH）；
+    否则按 batch_size 条固定分批（默认 EMBED_BATCH_SIZE）。
+    """
+    if batch_size is not None and batch_size <= 0:
+        raise ValueError(f"batch_size 应为正整数，实际为 {batch_size}")
+    if EMBED_TOKEN_BUDGET <= 0 or len(texts) <= 1:
+        batch_size = batch_size or EMBED_BATCH_SIZE
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            chunk = texts[start:start + batch_size]
+            vectors.extend(await embed_documents(chunk))
+            if progress:
+                progress(len(chunk))
+        return vectors
+    with ws_metrics.span('tokenize'):
+        lengths = await token_lengths(texts)
+    batches = plan_batches(lengths, EMBED_TOKEN_BUDGET, batch_size or EMBED_MAX_BATCH)
+    logger.debug("按 token 预算分批: 文本 %d 条, %d 批, padding 利用率 %.2f",
+                 len(texts), len(batches), padding_efficiency(lengths, batches))
+    vectors = [None] * len(texts)
+    for batch in batches:
+        for i, vector in zip(batch, await embed_batch([texts[i] for i in batch])):
+            vectors[i] = vector
+        if progress:
+            progress(len(batch))
+    return vectors
+
+async def _get_existing_store(store: str) -> Optional[VectorStoreHandle]:
+    handle = await registry.get(store, create=False)
+    if handle is None or handle.vector_store is None:
+        return None
+    return handle
 
 # 增加文档
 @ws_tool('rag_add')
-async def rag_add(doc: dict, store: str = 'url') -> dict:
-    logger.info(f"RAG 新增: store={store}, doc={doc}")
-    global vector_store
-    try:
-        document = Document(page_content=doc.get("content", ""), metadata=doc.get("metadata", {}))
-        if vector_store is None:
-            vector_store = FAISS.from_texts(
-                texts=[document.page_content],
-                embedding=embeddings,
-                metadatas=[document.metadata]
-            )
-        else:
-            vector_store.add_documents(documents=[document], ids=[str(uuid4())])
-        vector_store.save_local(VECTOR_STORE_DIR)
+async def rag_add(doc: dict, store: str = DEFAULT_STORE) -> dict:
+    logger.debug("RAG 新增: store=%s, doc=%s", store, preview(doc))
+    try:
+        await add_documents_batch([doc], store)
         return {"status": "added", "doc": doc, "store": store}
     except Exception as e:
         logger.error(f"新增失败: {e}")
         return {"error": str(e)}
 
+# 批量增加文档
+@ws_tool('rag_add_batch', max_concurrency=RAG_INGEST_CONCURRENCY)
+async def rag_add_batch(docs: List[dict], store: str = DEFAULT_STORE, batch_size: Optional[int] = None,
+                        vectors: Optional[Any] = None) -> dict:
+    # vectors 可选：客户端已算好的向量，msgpack 连接上以 float32 原始字节传输
+    logger.debug("RAG 批量新增: store=%s, count=%d, batch_size=%s", store, len(docs), batch_size)
+    if not docs:
+        return {"status": "added", "count": 0, "ids": [], "store": store}
+    try:
+        start = time.perf_counter()
+        ids = await add_documents_batch(docs, store, batch_size=batch_size, vectors=vectors)
+        elapsed = time.perf_counter() - start
+        docs_per_sec = len(docs) / elapsed if elapsed > 0 else 0.0
+        logger.info("RAG 批量新增完成: count=%d, 耗时=%.2fs, %.1f docs/s", len(docs), elapsed, docs_per_sec,
+                    extra={'store': store, 'count': len(docs), 'elapsed_ms': round(elapsed * 1000, 1)})
+        return {
+            "status": "added",
+            "count": len(ids),
+            "ids": ids,
+            "store": store,
+            "elapsed_sec": round(elapsed, 3),
+            "docs_per_sec": round(docs_per_sec, 1)
+        }
+    except Exception as e:
+        logger.error(f"批量新增失败: {e}")
+        return {"error": str(e)}
+
+# 增量同步写入 metadata 的字段：内容哈希（判断是否需要重新 embedding）与来源（只同步 / 删除本来源的文档）
+CONTENT_HASH_KEY = 'content_hash'
+SYNC_SOURCE_KEY = 'sync_source'
+SYNC_KEYS = (CONTENT_HASH_KEY, SYNC_SOURCE_KEY)
+
+
+def public_metadata(metadata: dict) -> dict:
+    """去掉增量同步的记账字段，检索结果只返回调用方写入的 metadata。"""
+    if not any(key in metadata for key in SYNC_KEYS):
+        return metadata
+    return {k: v for k, v in metadata.items() if k not in SYNC_KEYS}
+
+
+def content_hash(content: str, metadata: dict) -> str:
+    payload = {"content": content, "metadata": public_metadata(metadata)}
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+async def sync_documents(docs: List[dict], store: str = DEFAULT_STORE, source: str = 'default',
+                         batch_size: Optional[int] = None, prune_unmanaged: bool = False, dry_run: bool = False,
+                         progress: Optional[Callable[[int], None]] = None,
+                         legacy_keys: Optional[List[str]] = None) -> dict:
+    """把 store 中来源为 source 的文档同步为 docs：只 embedding 新增或内容变化的文档，删除源中已不存在的文档。
+
+    docs 必须带稳定的 id；内容哈希基于 content 与 metadata，存入 metadata[CONTENT_HASH_KEY]。
+    legacy_keys 给出时，不属于任何来源、且这些 metadata 字段与某篇新文档相同的旧文档（如旧版脚本以随机 id
+    导入的同一条数据）被新文档替换，避免首次同步后每条数据出现两次。
+    prune_unmanaged=True 时一并删除其余不属于任何来源的文档。
+    新增、修改与删除在写锁内一次应用，并作为一条 journal 记录落盘。
+    """
+    ids = [doc.get("id") for doc in docs]
+    if not all(ids):
+        raise ValueError("增量同步要求每篇文档都带 id")
+    duplicated = [doc_id for doc_id, n in collections.Counter(ids).items() if n > 1]
+    if duplicated:
+        raise ValueError(f"文档 id 重复: {duplicated[:10]}")
+    handle = await registry.get(store)
+    await handle.lock.acquire_read()
+    try:
+        manifest = handle.manifest()
+        # 比对期间的 metadata 可能被并发修改，只保留需要的字段
+        current = {doc_id: (meta.get(CONTENT_HASH_KEY), meta.get(SYNC_SOURCE_KEY)) for doc_id, meta in manifest.items()}
+        legacy = {}
+        if legacy_keys:
+            for doc_id, meta in manifest.items():
+                if meta.get(SYNC_SOURCE_KEY) is None:
+                    legacy.setdefault(tuple(meta.get(key) for key in legacy_keys), []).append(doc_id)
+    finally:
+        handle.lock.release_read()
+
+    added, updated, unchanged = [], [], 0
+    changed_docs = []
+    for doc in docs:
+        content = doc.get("content", "")
+        metadata = doc.get("metadata", {})
+        digest = content_hash(content, metadata)
+        state = current.get(doc["id"])
+        if state is not None and state == (digest, source):
+            unchanged += 1
+            continue
+        (added if state is None else updated).append(doc["id"])
+        changed_docs.append((doc["id"], content, {**metadata, CONTENT_HASH_KEY: digest, SYNC_SOURCE_KEY: source}))
+    wanted = set(ids)
+    migrated = []
+    if legacy:
+        for doc in docs:
+            key = tuple(doc.get("metadata", {}).get(k) for k in legacy_keys)
+            migrated.extend(doc_id for doc_id in legacy.pop(key, []) if doc_id not in wanted)
+    migrated_set = set(migrated)
+    deleted = [doc_id for doc_id, (_, doc_source) in current.items()
+               if doc_id not in wanted and doc_id not in migrated_set
+               and (doc_source == source or (prune_unmanaged and doc_source is None))]
+    result = {"store": store, "source": source, "added": len(added), "updated": len(updated),
+              "deleted": len(deleted), "migrated": len(migrated), "unchanged": unchanged}
+    if dry_run:
+        return {**result, "dry_run": True, "added_ids": added, "updated_ids": updated, "deleted_ids": deleted,
+                "migrated_ids": migrated}
+    deleted += migrated
+    if not changed_docs and not deleted:
+        return result
+
+    change_ids = [doc_id for doc_id, _, _ in changed_docs]
+    texts = [content for _, content, _ in changed_docs]
+    metadatas = [metadata for _, _, metadata in changed_docs]
+    with ws_metrics.span('embed'):
+        vectors = await _embed_in_batches(texts, batch_size, progress)
+    async with handle.lock.write():
+        with ws_metrics.span('index_write'):
+            # embedding 期间可能有并发变更，按当前状态重新确定要删除的文档
+            deleted = [doc_id for doc_id in deleted if handle.has_doc(doc_id)]
+            replaced = [doc_id for doc_id in change_ids if handle.has_doc(doc_id)]
+            if deleted or replaced:
+                handle.apply_delete(deleted + replaced)
+            if change_ids:
+                handle.apply_add(texts, vectors, metadatas, change_ids)
+                handle.journal.append_add(change_ids, texts, metadatas, vectors, deleted=deleted)
+            else:
+                handle.journal.append_delete(deleted)
+        handle.bump_version()
+    result["deleted"] = len([doc_id for doc_id in deleted if doc_id not in migrated_set])
+    return result
+
+# 增量同步：按 id 与内容哈希比对，只处理变化的文档；legacy_keys 用于把旧版随机 id 导入的同一条数据替换为新 id
+@ws_tool('rag_sync', max_concurrency=RAG_INGEST_CONCURRENCY)
+async def rag_sync(docs: List[dict], store: str = DEFAULT_STORE, source: str = 'default',
+                   batch_size: Optional[int] = None, prune_unmanaged: bool = False, dry_run: bool = False,
+                   legacy_keys: Optional[List[str]] = None) -> dict:
+    logger.debug("RAG 增量同步: store=%s, source=%s, count=%d", store, source, len(docs))
+    try:
+        start = time.perf_counter()
+        result = await sync_documents(docs, store, source, batch_size=batch_size,
+                                      prune_unmanaged=prune_unmanaged, dry_run=dry_run, legacy_keys=legacy_keys)
+        elapsed = time.perf_counter() - start
+        logger.info("RAG 增量同步完成: source=%s, 新增=%d, 更新=%d, 删除=%d, 迁移=%d, 未变=%d, 耗时=%.2fs", source,
+                    result["added"], result["updated"], result["deleted"], result["migrated"], result["unchanged"],
+                    elapsed,
+                    extra={'store': store, 'count': len(docs), 'elapsed_ms': round(elapsed * 1000, 1)})
+        return {"status": "synced", **result, "elapsed_sec": round(elapsed, 3)}
+    except Exception as e:
+        logger.error(f"增量同步失败: {e}")
+        return {"error": str(e)}
+
+# 检索方式：dense 向量检索（默认）；lexical 只用 BM25 倒排索引，不经过 embedding 模型；
+# hybrid 两路各取候选后按排名做 reciprocal-rank fusion（RRF），score 为融合得分
+RETRIEVAL_MODES = ('dense', 'lexical', 'hybrid')
+# RRF 常数：得分为各路 1 / (k + 排名) 之和，k 越大越弱化头部排名的优势
+RRF_K = int(os.environ.get("RAG_RRF_K", 60))
+# hybrid 每一路取的候选数（不少于 top_k）
+HYBRID_CANDIDATES = int(os.environ.get("RAG_HYBRID_CANDIDATES", 20))
+
+def _lexical_hits(handle: VectorStoreHandle, query: str, k: int) -> List[tuple]:
+    return handle.lexical_search(query, k)
+
+async def _search_lexical(handle: VectorStoreHandle, query: str, k: int) -> List[tuple]:
+    with ws_metrics.span('lexical'):
+        return await run_blocking(_search_executor, _lexical_hits, handle, query, k, read_lock=handle.lock)
+
+def rrf_fuse(rankings: List[List[tuple]], top_k: int, k: int = RRF_K) -> List[tuple]:
+    # 按 docstore id 合并两路结果：内容与 metadata 完全相同的不同文档也各自计分
+    scores: Dict[Any, float] = {}
+    for hits in rankings:
+        for rank, (doc_id, _) in enumerate(hits, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+async def _search_hits(handle: VectorStoreHandle, query: str, top_k: int, score_threshold: Optional[float],
+                       options: SearchOptions, mode: str) -> List[tuple]:
+    """按 mode 检索，返回排好序的 (docstore id, 得分)，不读取文档。
+
+    score_threshold 只作用于向量检索的余弦相似度：lexical 模式忽略，hybrid 模式用于过滤向量一路的候选。
+    """
+    if mode == 'dense':
+        return await query_batcher.search(handle, query, top_k, score_threshold, options)
+    if mode == 'lexical':
+        return await _search_lexical(handle, query, top_k)
+    candidates = max(top_k, HYBRID_CANDIDATES)
+    dense, lexical = await asyncio.gather(
+        query_batcher.search(handle, query, candidates, score_threshold, options),
+        _search_lexical(handle, query, candidates))
+    return rrf_fuse([dense, lexical], top_k)
+
+def _result_items(handle: VectorStoreHandle, hits: List[tuple], mode: str):
+    """逐条从 docstore 读取命中的文档并转成结果 dict，读一条产出一条。"""
+    docstore = handle.vector_store.docstore
+    # RRF 得分很小（约 1/60），多保留几位
+    digits = 6 if mode == 'hybrid' else 4
+    for doc_id, score in hits:
+        doc = docstore.search(doc_id)
+        # 检索之后、读取之前被删除的文档直接跳过
+        if isinstance(doc, Document):
+            yield {"content": doc.page_content, "metadata": public_metadata(doc.metadata), "score": round(score, digits)}
+
+def _check_mode(mode: str):
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"未知检索方式: {mode}，可选 {', '.join(RETRIEVAL_MODES)}")
+
+def _cache_key(handle: VectorStoreHandle, query: str, top_k: int, score_threshold: Optional[float],
+               options: SearchOptions, mode: str) -> tuple:
+    # 版本号在检索前取，检索期间发生变更时结果按旧版本缓存，不会被新版本命中
+    return normalize_query(query), handle.name, top_k, score_threshold, options, mode, handle.version
+
+async def _query_results(handle: VectorStoreHandle, query: str, top_k: int, score_threshold: Optional[float],
+                         options: SearchOptions, mode: str = 'dense') -> List[dict]:
+    _check_mode(mode)
+    cache_key = _cache_key(handle, query, top_k, score_threshold, options, mode)
+    results = result_cache.get(cache_key)
+    if results is None:
+        hits = await _search_hits(handle, query, top_k, score_threshold, options, mode)
+        results = list(_result_items(handle, hits, mode))
+        result_cache.put(cache_key, results)
+    return results
+
 # 查询文档
+# nprobe 仅对 IVF 索引生效，ef_search 仅对 HNSW 索引生效，rescore_factor 仅对两阶段索引生效，值越大召回越高、越慢
+# mode 见 RETRIEVAL_MODES
 @ws_tool('rag_query')
-async def rag_query(query: str, store: str = 'url', top_k: int = 5) -> dict:
-    logger.info(f"RAG 查询: store={store}, query={query}")
-    if vector_store is None:
-        return {"error": "向量存储未初始化"}
+async def rag_query(query: str, store: str = DEFAULT_STORE, top_k: int = 5, score_threshold: Optional[float] = None,
+                    nprobe: Optional[int] = None, ef_search: Optional[int] = None, mode: str = 'dense',
+                    rescore_factor: Optional[int] = None) -> dict:
+    # dense 模式下 score 为余弦相似度（归一化向量的内积），score_threshold 过滤掉低于阈值的结果，可能返回空列表；
+    # lexical 模式为 BM25 得分，hybrid 模式为 RRF 融合得分
+    logger.debug("RAG 查询: store=%s, mode=%s, query=%s", store, mode, preview(query))
     try:
-        results = vector_store.similarity_search(query, k=top_k)
-        return {"results": [{"content": doc.page_content, "metadata": doc.metadata} for doc in results]}
+        handle = await _get_existing_store(store)
+        if handle is None:
+            return {"error": "向量存储未初始化"}
+        results = await _query_results(handle, query, top_k, score_threshold, SearchOptions(nprobe, ef_search, rescore_factor), mode)
+        return {"results": results}
     except Exception as e:
         logger.error(f"查询失败: {e}")
         return {"error": str(e)}
 
-# 更新文档（简单实现：先删后增）
+# 流式查询：参数同 rag_query，每条结果单独作为一个 chunk 帧发送，适合 top_k 较大或文档较长的场景
+@ws_tool('rag_query_stream')
+async def rag_query_stream(query: str, store: str = DEFAULT_STORE, top_k: int = 5,
+                           score_threshold: Optional[float] = None,
+                           nprobe: Optional[int] = None, ef_search: Optional[int] = None, mode: str = 'dense',
+                           rescore_factor: Optional[int] = None):
+    logger.debug("RAG 流式查询: store=%s, mode=%s, query=%s", store, mode, preview(query))
+    handle = await _get_existing_store(store)
+    if handle is None:
+        raise ValueError("向量存储未初始化")
+    _check_mode(mode)
+    options = SearchOptions(nprobe, ef_search, rescore_factor)
+    cached = result_cache.get(_cache_key(handle, query, top_k, score_threshold, options, mode))
+    if cached is not None:
+        for item in cached:
+            yield item
+        return
+    # 检索只得到 id 与得分，文档逐条读取、转换后立即发送，不在服务端攒齐整个结果列表；
+    # 因此也不写入结果缓存（缓存需要完整列表）
+    hits = await _search_hits(handle, query, top_k, score_threshold, options, mode)
+    for item in _result_items(handle, hits, mode):
+        yield item
+
+# 计算文本向量；msgpack 连接上以 float32 原始字节返回，JSON 连接上为数组
+@ws_tool('rag_embed', max_concurrency=RAG_INGEST_CONCURRENCY)
+async def rag_embed(texts: List[str], query: bool = False) -> dict:
+    try:
+        with ws_metrics.span('embed'):
+            vectors = await (embed_queries(texts) if query else embed_documents(texts))
+        return {"dim": EMBED_DIM, "vectors": np.asarray(vectors, dtype=np.float32)}
+    except Exception as e:
+        logger.error(f"embedding 失败: {e}")
+        return {"error": str(e)}
+
+# 查询缓存命中统计
+@ws_tool('rag_cache_stats')
+async def rag_cache_stats(reset: bool = False) -> dict:
+    stats = {
+        "store_versions": {handle.name: handle.version for handle in registry.loaded()},
+        "embedding_cache": embedding_cache.stats(),
+        "result_cache": result_cache.stats(),
+    }
+    if reset:
+        embedding_cache.reset_stats()
+        result_cache.reset_stats()
+    return stats
+
+# 更新文档（先删后增，journal 中记为一条 add，回放时按 upsert 处理）
 @ws_tool('rag_update')
-async def rag_update(doc_id: str, doc: dict, store: str = 'url') -> dict:
-    logger.info(f"RAG 更新: store={store}, id={doc_id}, doc={doc}")
-    global vector_store
-    if vector_store is None:
-        return {"error": "向量存储未初始化"}
-    try:
-        vector_store.delete(ids=[doc_id])
-        document = Document(page_content=doc.get("content", ""), metadata=doc.get("metadata", {}))
-        vector_store.add_documents(documents=[document], ids=[doc_id])
-        vector_store.save_local(VECTOR_STORE_DIR)
+async def rag_update(doc_id: str, doc: dict, store: str = DEFAULT_STORE) -> dict:
+    logger.debug("RAG 更新: store=%s, id=%s, doc=%s", store, doc_id, preview(doc))
+    try:
+        handle = await _get_existing_store(store)
+        if handle is None:
+            return {"error": "向量存储未初始化"}
+        texts = [doc.get("content", "")]
+        metadatas = [doc.get("metadata", {})]
+        vectors = await embed_documents(texts)
+        async with handle.lock.write():
+            undo = handle.apply_update(doc_id, texts[0], vectors[0], metadatas[0])
+            try:
+                handle.journal.append_add([doc_id], texts, metadatas, vectors)
+            except Exception:
+                undo()
+                raise
+            handle.bump_version()
         return {"status": "updated", "id": doc_id, "doc": doc, "store": store}
     except Exception as e:
         logger.error(f"更新失败: {e}")
@@ -114,22 +753,128 @@ async def rag_update(doc_id: str, doc: dict, store: str = 'url') -> dict:
 
 # 删除文档
 @ws_tool('rag_delete')
-async def rag_delete(doc_id: str, store: str = 'url') -> dict:
-    logger.info(f"RAG 删除: store={store}, id={doc_id}")
-    global vector_store
-    if vector_store is None:
-        return {"error": "向量存储未初始化"}
-    try:
-        vector_store.delete(ids=[doc_id])
-        vector_store.save_local(VECTOR_STORE_DIR)
+async def rag_delete(doc_id: str, store: str = DEFAULT_STORE) -> dict:
+    logger.debug("RAG 删除: store=%s, id=%s", store, doc_id)
+    try:
+        handle = await _get_existing_store(store)
+        if handle is None:
+            return {"error": "向量存储未初始化"}
+        async with handle.lock.write():
+            handle.apply_delete([doc_id])
+            handle.journal.append_delete([doc_id])
+            handle.bump_version()
         return {"status": "deleted", "id": doc_id, "store": store}
     except Exception as e:
         logger.error(f"删除失败: {e}")
         return {"error": str(e)}
 
+# 手动触发 checkpoint（不传 store 时对所有已加载的 store 执行）
+@ws_tool('rag_checkpoint')
+async def rag_checkpoint(store: Optional[str] = None) -> dict:
+    try:
+        seqs = await checkpoint(store)
+        return {"status": "checkpointed", "seqs": seqs}
+    except Exception as e:
+        logger.error(f"checkpoint 失败: {e}")
+        return {"error": str(e)}
+
+# 导出只读服务快照（mmap 格式的索引 + 非 pickle docstore），供 RAG_SERVING_MODE=mmap 的 worker 加载
+@ws_tool('rag_export_serving', max_concurrency=1)
+async def rag_export_serving(store: str = DEFAULT_STORE) -> dict:
+    try:
+        handle = await _get_existing_store(store)
+        if handle is None:
+            return {"error": "向量存储未初始化"}
+        manifest = await handle.export_snapshot()
+        return {"status": "exported", "store": store, **manifest}
+    except Exception as e:
+        logger.error(f"导出服务快照失败: {e}")
+        return {"error": str(e)}
+
+# 以新的索引类型重建 store（flat / ivf_flat / ivf_pq / hnsw / pca_rescore / trunc_rescore / auto），IVF 类型会先用现有向量训练
+# 两阶段类型的索引只保存 reduced_dim 维的向量，全精度向量写入 store 目录下的 mmap 侧文件用于重打分
+@ws_tool('rag_rebuild_index', max_concurrency=1)
+async def rag_rebuild_index(store: str = DEFAULT_STORE, kind: str = 'auto',
+                            nlist: Optional[int] = None, pq_m: Optional[int] = None,
+                            reduced_dim: Optional[int] = None) -> dict:
+    logger.info(f"RAG 重建索引: store={store}, kind={kind}, nlist={nlist}, pq_m={pq_m}, reduced_dim={reduced_dim}")
+    try:
+        if kind != 'auto' and kind not in INDEX_KINDS:
+            return {"error": f"不支持的索引类型: {kind}，可选 {INDEX_KINDS} 或 auto"}
+        handle = await _get_existing_store(store)
+        if handle is None:
+            return {"error": "向量存储未初始化"}
+        info = await handle.rebuild(kind, _embed_in_batches, nlist=nlist, pq_m=pq_m, reduced_dim=reduced_dim)
+        return {"status": "rebuilt", "store": store, "index": info}
+    except Exception as e:
+        logger.error(f"重建索引失败: {e}")
+        return {"error": str(e)}
+
+def _synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    # 带聚类结构的归一化随机向量，比均匀随机更接近真实 embedding 分布
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 100), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+# 召回率/延迟对比报告：以 Flat 精确检索为基准，对比各索引类型及 nprobe/efSearch/rescore_factor 取值
+# synthetic>0 时用该数量的合成向量代替 store 数据，便于在导入大语料前评估
+@ws_tool('rag_index_report', max_concurrency=1)
+async def rag_index_report(store: str = DEFAULT_STORE, kinds: Optional[List[str]] = None, k: int = 10,
+                           queries: int = 100, synthetic: int = 0, reduced_dim: Optional[int] = None) -> dict:
+    logger.info(f"RAG 索引报告: store={store}, kinds={kinds}, k={k}, synthetic={synthetic}")
+    try:
+        if synthetic > 0:
+            vectors = _synthetic_vectors(synthetic, EMBED_DIM)
+        else:
+            handle = await _get_existing_store(store)
+            if handle is None:
+                return {"error": "向量存储未初始化"}
+            await handle.lock.acquire_read(background=True)
+            try:
+                _, texts, _, vectors = await asyncio.to_thread(handle.export_documents)
+            finally:
+                handle.lock.release_read(background=True)
+            if vectors is None:
+                # 分批 embedding：整个语料一次提交会超过 EXECUTOR_TIMEOUT
+                vectors = np.asarray(await _embed_in_batches(texts), dtype=np.float32)
+        rng = np.random.default_rng(1)
+        sample = vectors[rng.choice(len(vectors), min(queries, len(vectors)), replace=False)]
+        rows = await asyncio.to_thread(recall_latency_report, vectors, sample, k, kinds, registry.metric,
+                                       reduced_dim=reduced_dim)
+        return {"store": store if synthetic <= 0 else None, "vectors": len(vectors), "queries": len(sample), "k": k, "rows": rows}
+    except Exception as e:
+        logger.error(f"索引报告失败: {e}")
+        return {"error": str(e)}
+
+# 列出所有 store（已加载的带文档数与内存估算，未加载的只给磁盘占用）
+@ws_tool('rag_list_stores')
+async def rag_list_stores() -> dict:
+    try:
+        stores = registry.list_stores()
+        loaded_bytes = sum(info["memory"]["total_bytes"] for info in stores if info["loaded"])
+        return {"stores": stores, "loaded_bytes": loaded_bytes}
+    except Exception as e:
+        logger.error(f"列出 store 失败: {e}")
+        return {"error": str(e)}
+
+# 卸载 store 释放内存；delete_files=True 时同时删除磁盘数据
+@ws_tool('rag_drop_store')
+async def rag_drop_store(store: str, delete_files: bool = False) -> dict:
+    logger.info(f"RAG 卸载 store: store={store}, delete_files={delete_files}")
+    try:
+        existed = await registry.drop(store, delete_files=delete_files)
+        if not existed:
+            return {"error": f"store 不存在: {store}"}
+        return {"status": "deleted" if delete_files else "unloaded", "store": store}
+    except Exception as e:
+        logger.error(f"卸载 store 失败: {e}")
+        return {"error": str(e)}
+
 @ws_tool('retrieve_mock')
 async def retrieve_mock(question: str, top_k: int = 5, store: str = 'url') -> List[Dict]:
-    logger.info(f"VectorService 检索: store={store}, question={question}, top_k={top_k}")
+    logger.debug("VectorService 检索: store=%s, question=%s, top_k=%s", store, preview(question), top_k)
     # 如果是 url 查询，返回 url.json 随机 top_k 条
     if store == "url":
         try:
@@ -149,5 +894,11 @@ async def ws_main(ws: WebSocket):
     await ws_endpoint(ws, logger)
 
 if __name__ == "__main__":
-    logger.info("Starting VectorService WebSocket server on 127.0.0.1:9100")
-    uvicorn.run(app, host="0.0.0.0", port=9100)
+    logger.info(f"Starting VectorService WebSocket server on 127.0.0.1:9100, mode={SERVING_MODE}")
+    if WORKERS > 1 and READ_ONLY:
+        # 多 worker 需要以导入字符串启动；各进程 mmap 同一份快照文件
+        uvicorn.run("vector_service:app", host="0.0.0.0", port=9100, workers=WORKERS, log_config=None)
+    else:
+        if WORKERS > 1:
+            logger.warning("RAG_WORKERS > 1 仅在 RAG_SERVING_MODE=mmap 下生效，按单进程启动")
+        uvicorn.run(app, host="0.0.0.0", port=9100, log_config=None)
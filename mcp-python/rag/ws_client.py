@@ -0,0 +1,325 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import itertools
+import contextlib
+from typing import Dict, List, Optional
+
+import ws_metrics
+from admission import BusyError, DeadlineExceeded, deadline_scope, remaining_seconds
+from ws_codec import JsonCodec, SUBPROTOCOL_MSGPACK, codec_for, decode_frame
+
+logger = logging.getLogger(__name__)
+
+# 服务间调用的连接池配置
+WS_POOL_SIZE = int(os.environ.get("WS_POOL_SIZE", 2))
+# 健康检查间隔与单次 ping 超时（秒）
+WS_POOL_HEALTH_INTERVAL = float(os.environ.get("WS_POOL_HEALTH_INTERVAL", 10))
+WS_POOL_HEALTH_TIMEOUT = float(os.environ.get("WS_POOL_HEALTH_TIMEOUT", 2))
+# 重连退避：第 n 次连续失败后等待 [cap/2, cap]，cap = min(max, base * 2^(n-1))
+WS_POOL_BACKOFF_BASE = float(os.environ.get("WS_POOL_BACKOFF_BASE", 0.2))
+WS_POOL_BACKOFF_MAX = float(os.environ.get("WS_POOL_BACKOFF_MAX", 10))
+
+
+class WsToolClient:
+    """调用远端 ws_tool 服务的客户端：一条长连接上按请求 id 复用，多个调用可同时在途。
+
+    断线时在途调用全部失败，下次调用时自动重连。encoding='msgpack' 时向服务端协商二进制编码，
+    向量参数可直接传 numpy 数组；服务端不支持时退回 JSON。
+    """
+
+    def __init__(self, uri: str, timeout: float = 30, encoding: str = 'json'):
+        self.uri = uri
+        self.timeout = timeout
+        self.encoding = encoding
+        self.codec = JsonCodec
+        self._ws = None
+        self._reader = None
+        self._next_id = itertools.count(1)
+        # 每个在途请求一个队列，流式应答的多个 chunk 帧按序放入
+        self._pending: Dict[int, asyncio.Queue] = {}
+        self._connect_lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    async def connect(self):
+        import websockets
+        async with self._connect_lock:
+            if self._ws is None:
+                subprotocols = [SUBPROTOCOL_MSGPACK] if self.encoding == 'msgpack' else None
+                self._ws = await websockets.connect(self.uri, max_size=None, subprotocols=subprotocols)
+                self.codec = codec_for(self._ws.subprotocol)
+                self._reader = asyncio.create_task(self._read_loop(self._ws))
+            return self._ws
+
+    async def _read_loop(self, ws):
+        try:
+            async for message in ws:
+                resp = decode_frame(message)
+                queue = self._pending.get(resp.get('id'))
+                if queue is not None:
+                    queue.put_nowait(resp)
+        except Exception:
+            pass
+        finally:
+            if self._ws is ws:
+                self._ws = None
+            error = ConnectionError(f"连接已断开: {self.uri}")
+            for queue in self._pending.values():
+                queue.put_nowait(error)
+
+    async def _request(self, func: str, params: dict):
+        """发送请求并逐个产出应答帧，直到 result / end；busy 应答抛 BusyError，其它 error 帧抛 RuntimeError。"""
+        # 把剩余时间预算作为 deadline_ms 传给服务端：在服务端处理链路中调用时沿用上游请求的截止时间
+        budget = self.timeout
+        remaining = remaining_seconds()
+        if remaining is not None:
+            if remaining <= 0:
+                raise DeadlineExceeded(f"调用 {func} 前上游请求已超过截止时间")
+            budget = min(budget, remaining)
+        ws = await self.connect()
+        req_id = next(self._next_id)
+        queue = asyncio.Queue()
+        self._pending[req_id] = queue
+        start = time.perf_counter()
+        try:
+            # 不足 1ms 时按 1ms 发送，0 会被服务端当作预算已用完
+            await ws.send(self.codec.dumps({'id': req_id, 'func': func, 'params': params,
+                                            'deadline_ms': max(1, int(budget * 1000))}))
+            while True:
+                # 流式应答时 timeout 为相邻两帧的最大间隔
+                resp = await asyncio.wait_for(queue.get(), self.timeout)
+                if isinstance(resp, Exception):
+                    raise resp
+                if resp.get('busy'):
+                    raise BusyError(resp['error'], resp.get('retry_after', 0))
+                if 'error' in resp:
+                    raise RuntimeError(resp['error'])
+                yield resp
+                if 'chunk' not in resp:
+                    return
+        finally:
+            # 超时、取消或提前结束后迟到的应答直接丢弃
+            self._pending.pop(req_id, None)
+            # 在服务端工具中调用下游服务时，往返耗时记为当前工具的 remote:<func> 阶段
+            ws_metrics.record_span(f'remote:{func}', time.perf_counter() - start)
+
+    async def call(self, func: str, **params):
+        """调用工具并返回完整结果；流式工具的 chunk 收齐后以列表返回。"""
+        chunks = []
+        async with contextlib.aclosing(self._request(func, params)) as responses:
+            async for resp in responses:
+                if 'chunk' in resp:
+                    chunks.append(resp['chunk'])
+                elif 'end' in resp:
+                    return chunks
+                else:
+                    return resp.get('result')
+
+    async def stream(self, func: str, **params):
+        """逐个产出流式工具的 chunk；对非流式工具产出一次完整结果。"""
+        async with contextlib.aclosing(self._request(func, params)) as responses:
+            async for resp in responses:
+                if 'chunk' in resp:
+                    yield resp['chunk']
+                elif 'result' in resp:
+                    yield resp['result']
+
+    async def close(self):
+        ws, self._ws = self._ws, None
+        if ws is not None:
+            await ws.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+
+
+class _PooledConnection:
+    """连接池中的一个槽位：一条可复用的多路复用连接及其健康 / 退避状态。"""
+
+    def __init__(self, index: int, client: WsToolClient):
+        self.index = index
+        self.client = client
+        self.healthy = False
+        self.failures = 0
+        self.reconnects = 0
+        # 事件循环时间；在此之前不再尝试重连
+        self.retry_at = 0.0
+
+    @property
+    def usable(self) -> bool:
+        return self.client.connected and self.healthy
+
+    def backoff(self) -> float:
+        cap = min(WS_POOL_BACKOFF_MAX, WS_POOL_BACKOFF_BASE * 2 ** (self.failures - 1))
+        # equal jitter：避免多个进程在服务恢复时同时重连
+        return random.uniform(cap / 2, cap)
+
+    def mark_failed(self, error: BaseException):
+        self.healthy = False
+        self.failures += 1
+        delay = self.backoff()
+        self.retry_at = asyncio.get_running_loop().time() + delay
+        logger.warning(f"连接 {self.client.uri}#{self.index} 不可用（连续失败 {self.failures} 次），"
+                       f"{delay:.2f}s 后重连: {error}")
+
+    async def ensure(self):
+        if self.client.connected:
+            return
+        try:
+            await self.client.connect()
+        except Exception as e:
+            self.mark_failed(e)
+            raise ConnectionError(f"连接失败: {self.client.uri}: {e}") from e
+        if self.failures:
+            self.reconnects += 1
+        self.healthy = True
+        self.failures = 0
+
+    async def drop(self):
+        # 关闭后下次使用时重新连接
+        with contextlib.suppress(Exception):
+            await self.client.close()
+
+
+class WsToolPool:
+    """到一个 ws_tools 服务的持久连接池，供服务间调用。
+
+    - 每条连接按请求 id 多路复用，调用分配到在途请求最少的健康连接
+    - 后台定期 ping 各连接，失败的连接关闭后按带抖动的指数退避重连；断开的连接在退避期内不参与分配
+    - 每次调用有独立超时（默认 timeout），并作为 deadline_ms 传给服务端；在服务端处理链路中调用时不超过上游剩余时间
+    - 只在连接建立失败时换一条连接重试；请求已发出后断线直接失败，不自动重发（写操作不一定幂等）
+    """
+
+    def __init__(self, uri: str, size: int = WS_POOL_SIZE, timeout: float = 30, encoding: str = 'json',
+                 health_interval: float = WS_POOL_HEALTH_INTERVAL):
+        self.uri = uri
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self._slots: List[_PooledConnection] = [
+            _PooledConnection(i, WsToolClient(uri, timeout=timeout, encoding=encoding)) for i in range(max(1, size))
+        ]
+        self._health_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def start(self):
+        """预先建立连接并启动健康检查；服务暂时不可达时不报错，由健康检查在后台重连。"""
+        self._ensure_health_task()
+        await asyncio.gather(*(self._try_connect(slot) for slot in self._slots))
+
+    def _ensure_health_task(self):
+        if self._health_task is None and not self._closed:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _try_connect(self, slot: _PooledConnection):
+        with contextlib.suppress(ConnectionError):
+            await slot.ensure()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await asyncio.gather(*(self._check(slot) for slot in self._slots))
+
+    async def _check(self, slot: _PooledConnection):
+        loop = asyncio.get_running_loop()
+        if not slot.client.connected:
+            if loop.time() >= slot.retry_at:
+                await self._try_connect(slot)
+            return
+        try:
+            async with asyncio.timeout(WS_POOL_HEALTH_TIMEOUT):
+                await slot.client.call('ping')
+            slot.healthy = True
+        except BusyError:
+            # 服务在线但正在限流，连接本身可用
+            slot.healthy = True
+        except Exception as e:
+            slot.mark_failed(e)
+            await slot.drop()
+
+    async def _acquire(self) -> _PooledConnection:
+        """选出一条可用连接；全部不可用时尝试重连，都在退避期内则等待最早的一个。超时由调用方控制。"""
+        self._ensure_health_task()
+        loop = asyncio.get_running_loop()
+        while True:
+            usable = [slot for slot in self._slots if slot.usable]
+            if usable:
+                return min(usable, key=lambda slot: slot.client.in_flight)
+            due = sorted((slot for slot in self._slots if loop.time() >= slot.retry_at),
+                         key=lambda slot: slot.retry_at)
+            for slot in due:
+                try:
+                    await slot.ensure()
+                    return slot
+                except ConnectionError:
+                    continue
+            await asyncio.sleep(max(0.0, min(slot.retry_at for slot in self._slots) - loop.time()))
+
+    def _deadline(self, timeout: Optional[float]) -> float:
+        return asyncio.get_running_loop().time() + (self.timeout if timeout is None else timeout)
+
+    async def call(self, func: str, *, timeout: Optional[float] = None, **params):
+        """调用工具并返回完整结果。timeout 为本次调用的总超时（秒，含等待可用连接），工具参数不能同名。"""
+        deadline = self._deadline(timeout)
+        with deadline_scope(deadline):
+            async with asyncio.timeout_at(deadline):
+                slot = await self._acquire()
+                try:
+                    return await slot.client.call(func, **params)
+                except ConnectionError as e:
+                    slot.mark_failed(e)
+                    raise
+
+    async def stream(self, func: str, *, timeout: Optional[float] = None, **params):
+        """逐个产出流式工具的 chunk；timeout 为整个流的总超时。"""
+        deadline = self._deadline(timeout)
+        with deadline_scope(deadline):
+            async with asyncio.timeout_at(deadline):
+                slot = await self._acquire()
+        chunks = slot.client.stream(func, **params)
+        async with contextlib.aclosing(chunks):
+            while True:
+                # 每取一个 chunk 单独设置截止时间，不跨 yield 持有 contextvar
+                with deadline_scope(deadline):
+                    async with asyncio.timeout_at(deadline):
+                        try:
+                            item = await anext(chunks)
+                        except StopAsyncIteration:
+                            return
+                        except ConnectionError as e:
+                            slot.mark_failed(e)
+                            raise
+                yield item
+
+    def stats(self) -> dict:
+        return {
+            "uri": self.uri,
+            "size": len(self._slots),
+            "connections": [
+                {
+                    "connected": slot.client.connected,
+                    "healthy": slot.healthy,
+                    "in_flight": slot.client.in_flight,
+                    "failures": slot.failures,
+                    "reconnects": slot.reconnects,
+                }
+                for slot in self._slots
+            ],
+        }
+
+    async def close(self):
+        self._closed = True
+        if self._health_task is not None:
+            self._health_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._health_task
+            self._health_task = None
+        await asyncio.gather(*(slot.drop() for slot in self._slots))
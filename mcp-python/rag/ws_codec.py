@@ -0,0 +1,99 @@
+import json
+import struct
+from typing import Any, List, Optional
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # msgpack 为可选依赖，缺失时只支持 JSON
+    msgpack = None
+
+# WebSocket 子协议协商：客户端在握手时声明 rag.msgpack，服务端支持时以二进制帧收发 msgpack；
+# 未声明（如 Node 客户端）时保持 JSON 文本帧
+SUBPROTOCOL_MSGPACK = 'rag.msgpack'
+
+# msgpack 扩展类型：float32 数组以小端原始字节传输，头部为 ndim 和各维长度（uint32）
+EXT_NDARRAY_F32 = 1
+
+
+def _pack_ndarray(arr: np.ndarray) -> bytes:
+    arr = np.ascontiguousarray(arr, dtype='<f4')
+    header = struct.pack(f'<I{arr.ndim}I', arr.ndim, *arr.shape)
+    return header + arr.tobytes()
+
+
+def _unpack_ndarray(data: bytes) -> np.ndarray:
+    (ndim,) = struct.unpack_from('<I', data)
+    shape = struct.unpack_from(f'<{ndim}I', data, 4)
+    # 直接引用帧数据，不复制（结果只读）
+    return np.frombuffer(data, dtype='<f4', offset=4 + 4 * ndim).reshape(shape)
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, np.ndarray) and obj.dtype.kind == 'f':
+        return msgpack.ExtType(EXT_NDARRAY_F32, _pack_ndarray(obj))
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"无法编码的类型: {type(obj).__name__}")
+
+
+def _msgpack_ext_hook(code: int, data: bytes):
+    if code == EXT_NDARRAY_F32:
+        return _unpack_ndarray(data)
+    return msgpack.ExtType(code, data)
+
+
+def _json_default(obj):
+    # JSON 模式下向量退化为十进制数组
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class JsonCodec:
+    subprotocol = None
+    binary = False
+
+    @staticmethod
+    def dumps(message: Any) -> str:
+        return json.dumps(message, default=_json_default)
+
+    @staticmethod
+    def loads(data) -> Any:
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    subprotocol = SUBPROTOCOL_MSGPACK
+    binary = True
+
+    @staticmethod
+    def dumps(message: Any) -> bytes:
+        return msgpack.packb(message, default=_msgpack_default, use_bin_type=True)
+
+    @staticmethod
+    def loads(data: bytes) -> Any:
+        return msgpack.unpackb(data, ext_hook=_msgpack_ext_hook, raw=False)
+
+
+def negotiate(subprotocols: List[str]):
+    """按客户端声明的子协议选择编码；不支持或未声明时使用 JSON。"""
+    if msgpack is not None and SUBPROTOCOL_MSGPACK in (subprotocols or ()):
+        return MsgpackCodec
+    return JsonCodec
+
+
+def decode_frame(data) -> Any:
+    """文本帧按 JSON、二进制帧按 msgpack 解码，与连接协商的编码无关。"""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        if msgpack is None:
+            raise ValueError("未安装 msgpack，无法解析二进制帧")
+        return MsgpackCodec.loads(data)
+    return JsonCodec.loads(data)
+
+
+def codec_for(subprotocol: Optional[str]):
+    return MsgpackCodec if subprotocol == SUBPROTOCOL_MSGPACK and msgpack is not None else JsonCodec
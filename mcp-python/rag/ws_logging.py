@@ -0,0 +1,142 @@
+import os
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from typing import Optional
+
+# ws_tools 服务的日志配置：
+# - 根 logger 只挂一个 QueueHandler，格式化后的记录交给后台线程写 stderr，事件循环不在 I/O 上阻塞；
+#   队列满时丢弃新记录并计数，而不是等待
+# - 请求级日志（收到的帧、工具结果）按 WS_LOG_SAMPLE_RATE 抽样，请求失败等告警和错误始终记录
+# - 载荷用 preview() 包装并配合 %s 懒格式化：日志级别关闭或未被抽中时不做任何字符串拼接，
+#   需要输出时也只截取前 WS_LOG_PREVIEW_CHARS 个字符
+LOG_LEVEL = os.environ.get("WS_LOG_LEVEL", "INFO").upper()
+# text：与原来相同的单行文本；json：每行一个 JSON 对象，带 extra 中的结构化字段
+LOG_FORMAT = os.environ.get("WS_LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.environ.get("WS_LOG_QUEUE_SIZE", 10000))
+LOG_PREVIEW_CHARS = int(os.environ.get("WS_LOG_PREVIEW_CHARS", 200))
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+# JsonFormatter 会输出的结构化字段（通过 logger.info(..., extra={...}) 传入）
+STRUCTURED_FIELDS = ('tool', 'req_id', 'store', 'count', 'elapsed_ms', 'bytes')
+
+_sample_rate = float(os.environ.get("WS_LOG_SAMPLE_RATE", 1.0))
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional["_NonBlockingQueueHandler"] = None
+
+
+class preview:
+    """日志参数的懒截断包装：只有记录真正被格式化时才调用 str()，并截断到 limit 个字符。"""
+
+    __slots__ = ('obj', 'limit')
+
+    def __init__(self, obj, limit: Optional[int] = None):
+        self.obj = obj
+        self.limit = LOG_PREVIEW_CHARS if limit is None else limit
+
+    def __str__(self) -> str:
+        obj = self.obj
+        if isinstance(obj, (bytes, bytearray, memoryview)):
+            return f"<{len(obj)} bytes>"
+        text = obj if isinstance(obj, str) else str(obj)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}...(共 {len(text)} 字符)"
+
+    __repr__ = __str__
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue: queue.Queue, targets):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._pid = os.getpid()
+        self._targets = targets
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def handle(self, record):
+        # fork 出的子进程（如 embedding 进程池）里没有监听线程，直接同步写出
+        if os.getpid() != self._pid:
+            for target in self._targets:
+                target.handle(record)
+            return True
+        return super().handle(record)
+
+
+def _make_formatter() -> logging.Formatter:
+    return JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+
+
+def setup_logging(level: Optional[str] = None):
+    """配置根 logger（重复调用无副作用）。各服务在模块开头调用，替代 logging.basicConfig。"""
+    global _listener, _handler
+    root = logging.getLogger()
+    if _listener is None:
+        stream = logging.StreamHandler()
+        stream.setFormatter(_make_formatter())
+        _handler = _NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE), [stream])
+        for old in root.handlers[:]:
+            root.removeHandler(old)
+        root.addHandler(_handler)
+        _listener = logging.handlers.QueueListener(_handler.queue, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        root.setLevel(LOG_LEVEL)
+    if level:
+        root.setLevel(level.upper())
+
+
+def set_level(level: str, logger_name: Optional[str] = None, sample_rate: Optional[float] = None) -> dict:
+    """运行时调整日志级别（默认根 logger）和请求级日志抽样率。"""
+    global _sample_rate
+    level = level.upper()
+    if level not in logging.getLevelNamesMapping():
+        raise ValueError(f"未知日志级别: {level}")
+    logging.getLogger(logger_name).setLevel(level)
+    if sample_rate is not None:
+        _sample_rate = min(1.0, max(0.0, sample_rate))
+    return status(logger_name)
+
+
+def status(logger_name: Optional[str] = None) -> dict:
+    logger = logging.getLogger(logger_name)
+    return {
+        "logger": logger.name,
+        "level": logging.getLevelName(logger.getEffectiveLevel()),
+        "sample_rate": _sample_rate,
+        "format": LOG_FORMAT,
+        "queued": _handler.queue.qsize() if _handler else 0,
+        "dropped": _handler.dropped if _handler else 0,
+    }
+
+
+def sampled(logger: Optional[logging.Logger], level: int = logging.INFO) -> bool:
+    """请求级日志是否记录：级别开启且被抽中。每个请求判断一次，该请求的各条日志一起保留或一起跳过。"""
+    if logger is None or not logger.isEnabledFor(level):
+        return False
+    return _sample_rate >= 1.0 or random.random() < _sample_rate
@@ -0,0 +1,196 @@
+import time
+import bisect
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from admission import BusyError
+
+# ws_tool 调用指标：每个工具的调用数、错误数、被拒绝数、进行中请求数和耗时直方图，
+# 以及处理过程中各阶段（decode / queue / embed / search / serialize / remote:<tool> 等）的耗时直方图。
+# 只在事件循环线程中更新，不加锁。
+
+# 直方图桶上界（秒）；decode / serialize 等阶段通常在 1ms 以内，低端桶分得更细
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        # 最后一个桶为 +Inf
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶线性插值估算分位数（秒）；落在 +Inf 桶时返回最大的有限上界。"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(LATENCY_BUCKETS):
+                    return LATENCY_BUCKETS[-1]
+                lower = LATENCY_BUCKETS[i - 1] if i else 0.0
+                return lower + (LATENCY_BUCKETS[i] - lower) * (rank - seen) / n
+            seen += n
+        return LATENCY_BUCKETS[-1]
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total = 0
+        buckets = []
+        for bound, n in zip(LATENCY_BUCKETS + (float('inf'),), self.counts):
+            total += n
+            buckets.append(('+Inf' if bound == float('inf') else repr(bound), total))
+        return buckets
+
+    def summary(self) -> dict:
+        def ms(value):
+            return None if value is None else round(value * 1000, 3)
+        return {
+            "count": self.count,
+            "mean_ms": ms(self.sum / self.count) if self.count else None,
+            "p50_ms": ms(self.quantile(0.5)),
+            "p95_ms": ms(self.quantile(0.95)),
+            "p99_ms": ms(self.quantile(0.99)),
+        }
+
+
+class ToolMetrics:
+    __slots__ = ('name', 'calls', 'errors', 'rejected', 'in_flight', 'latency', 'spans')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.latency = Histogram()
+        self.spans: Dict[str, Histogram] = {}
+
+    def observe_span(self, span: str, seconds: float):
+        hist = self.spans.get(span)
+        if hist is None:
+            hist = self.spans[span] = Histogram()
+        hist.observe(seconds)
+
+
+_tools: Dict[str, ToolMetrics] = {}
+# 当前请求所属工具，处理函数里的 span() / record_span() 记到该工具名下
+_current: contextvars.ContextVar[Optional[ToolMetrics]] = contextvars.ContextVar('ws_tool_metrics', default=None)
+
+
+def register(tool: str) -> ToolMetrics:
+    metrics = _tools.get(tool)
+    if metrics is None:
+        metrics = _tools[tool] = ToolMetrics(tool)
+    return metrics
+
+
+@contextmanager
+def track(tool: str):
+    """记录一次工具调用：调用数、进行中数、总耗时，异常时计入错误数（BusyError 计入被拒绝数）。"""
+    metrics = register(tool)
+    metrics.calls += 1
+    metrics.in_flight += 1
+    token = _current.set(metrics)
+    start = time.perf_counter()
+    try:
+        yield metrics
+    except BusyError:
+        metrics.rejected += 1
+        raise
+    except BaseException:
+        metrics.errors += 1
+        raise
+    finally:
+        metrics.latency.observe(time.perf_counter() - start)
+        metrics.in_flight -= 1
+        _current.reset(token)
+
+
+def record_span(span: str, seconds: float, tool: Optional[str] = None):
+    """记录一个阶段耗时；tool 为空时记到当前请求所属工具，不在请求上下文中时忽略。"""
+    metrics = _tools.get(tool) if tool else _current.get()
+    if metrics is not None:
+        metrics.observe_span(span, seconds)
+
+
+def record_spans(timings: Dict[str, float]):
+    for span, seconds in timings.items():
+        record_span(span, seconds)
+
+
+@contextmanager
+def span(name: str):
+    """with span('embed'): ...  统计代码块耗时，记到当前请求所属工具。"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+def snapshot() -> dict:
+    """有调用记录的工具的计数与耗时摘要（毫秒）。"""
+    return {
+        name: {
+            "calls": m.calls,
+            "errors": m.errors,
+            "rejected": m.rejected,
+            "in_flight": m.in_flight,
+            "latency": m.latency.summary(),
+            "spans": {span: hist.summary() for span, hist in sorted(m.spans.items())},
+        }
+        for name, m in sorted(_tools.items())
+        if m.calls
+    }
+
+
+def _label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(metric: str, labels: str, hist: Histogram) -> List[str]:
+    lines = [f'{metric}_bucket{{{labels},le="{le}"}} {n}' for le, n in hist.cumulative()]
+    lines.append(f'{metric}_sum{{{labels}}} {hist.sum}')
+    lines.append(f'{metric}_count{{{labels}}} {hist.count}')
+    return lines
+
+
+def render_prometheus(gauges: Optional[Dict[str, float]] = None) -> str:
+    """Prometheus 文本格式（0.0.4）。gauges 为附加的无标签指标，如连接数、排队数。"""
+    lines = []
+    counters = (
+        ('ws_tool_calls_total', 'counter', 'ws_tool 调用次数', 'calls'),
+        ('ws_tool_errors_total', 'counter', 'ws_tool 调用失败次数', 'errors'),
+        ('ws_tool_rejected_total', 'counter', 'ws_tool 因排队已满被拒绝的次数', 'rejected'),
+        ('ws_tool_in_flight', 'gauge', '正在执行的 ws_tool 调用数', 'in_flight'),
+    )
+    tools = sorted(_tools.items())
+    for metric, kind, help_text, attr in counters:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        lines.extend(f'{metric}{{tool="{_label(name)}"}} {getattr(m, attr)}' for name, m in tools)
+    lines.append('# HELP ws_tool_latency_seconds ws_tool 调用耗时')
+    lines.append('# TYPE ws_tool_latency_seconds histogram')
+    for name, m in tools:
+        lines.extend(_histogram_lines('ws_tool_latency_seconds', f'tool="{_label(name)}"', m.latency))
+    lines.append('# HELP ws_tool_span_seconds ws_tool 调用内各阶段耗时')
+    lines.append('# TYPE ws_tool_span_seconds histogram')
+    for name, m in tools:
+        for span_name, hist in sorted(m.spans.items()):
+            labels = f'tool="{_label(name)}",span="{_label(span_name)}"'
+            lines.extend(_histogram_lines('ws_tool_span_seconds', labels, hist))
+    for metric, value in (gauges or {}).items():
+        lines.append(f'# TYPE {metric} gauge')
+        lines.append(f'{metric} {value}')
+    return '\n'.join(lines) + '\n'
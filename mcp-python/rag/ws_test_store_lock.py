@@ -0,0 +1,92 @@
+import time
+import asyncio
+import tempfile
+
+import numpy as np
+
+from store_registry import VectorStoreHandle
+
+# checkpoint 持读锁落盘期间来了一个变更请求：查询不应排在等待中的写者后面，一直等到落盘结束
+CHECKPOINT_SEC = 1.0
+DIM = 8
+
+
+def make_handle(path: str) -> VectorStoreHandle:
+    handle = VectorStoreHandle('lock-test', path, None, journal_fsync=False, index_kind='flat')
+    handle.load()
+    vectors = np.eye(DIM, dtype=np.float32)
+    ids = [f"doc-{i}" for i in range(DIM)]
+    texts = [f"文档 {i}" for i in range(DIM)]
+    metadatas = [{} for _ in range(DIM)]
+    handle.apply_add(texts, vectors, metadatas, ids)
+    handle.journal.append_add(ids, texts, metadatas, vectors)
+
+    # 放慢落盘，模拟大索引的 save_local
+    write_checkpoint = handle._write_checkpoint
+
+    def slow_write_checkpoint(seq):
+        time.sleep(CHECKPOINT_SEC)
+        write_checkpoint(seq)
+
+    handle._write_checkpoint = slow_write_checkpoint
+    return handle
+
+
+async def test_query_during_checkpoint_with_pending_write():
+    with tempfile.TemporaryDirectory() as path:
+        handle = make_handle(path)
+        start = time.perf_counter()
+        checkpoint = asyncio.create_task(handle.checkpoint())
+        await asyncio.sleep(0.1)
+
+        async def write():
+            async with handle.lock.write():
+                handle.apply_delete(["doc-0"])
+            return time.perf_counter() - start
+
+        writer = asyncio.create_task(write())
+        await asyncio.sleep(0.1)
+        assert handle.lock._writers_waiting == 1, "写请求应在等待 checkpoint 释放读锁"
+
+        # 查询：应在 checkpoint 结束前拿到读锁并完成检索
+        await asyncio.wait_for(handle.lock.acquire_read(), CHECKPOINT_SEC / 2)
+        try:
+            _, indices = handle.vector_store.index.search(np.eye(DIM, dtype=np.float32)[:1], 1)
+        finally:
+            handle.lock.release_read()
+        query_sec = time.perf_counter() - start
+        assert indices[0][0] == 0
+        assert not checkpoint.done(), "查询应在 checkpoint 落盘期间完成"
+
+        await checkpoint
+        write_sec = await writer
+        # 写者不会被饿死：checkpoint 结束后即可进入
+        assert write_sec >= CHECKPOINT_SEC and not handle.has_doc("doc-0")
+        print(f"[checkpoint + pending write] query {query_sec * 1000:.0f}ms, write {write_sec * 1000:.0f}ms: OK")
+
+
+async def test_query_waits_for_pending_write():
+    # 没有 checkpoint 时仍是写优先：读者排在等待中的写者之后
+    with tempfile.TemporaryDirectory() as path:
+        handle = make_handle(path)
+        await handle.lock.acquire_read()
+        writer = asyncio.create_task(handle.lock.acquire_write())
+        await asyncio.sleep(0)
+        reader = asyncio.create_task(handle.lock.acquire_read())
+        await asyncio.sleep(0.05)
+        assert not reader.done(), "读者应排在等待中的写者之后"
+        handle.lock.release_read()
+        await writer
+        handle.lock.release_write()
+        await reader
+        handle.lock.release_read()
+        print("[pending write] writer preferred: OK")
+
+
+async def main():
+    await test_query_during_checkpoint_with_pending_write()
+    await test_query_waits_for_pending_write()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
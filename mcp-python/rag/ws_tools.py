@@ -1,50 +1,299 @@
+import os
+import time
 import logging
-from fastapi import WebSocket
+import asyncio
+import typing
+from typing import Any, Dict, NotRequired, Optional, Required, TypedDict
+from fastapi import FastAPI, WebSocket
+from fastapi.responses import PlainTextResponse
 import inspect
-import json
+from pydantic import ConfigDict, TypeAdapter, ValidationError
+from ws_codec import decode_frame, negotiate
+from admission import AdmissionController, BusyError
+import ws_logging
+import ws_metrics
+from ws_logging import preview
 from starlette.websockets import WebSocketDisconnect
 
-WS_TOOL_REGISTRY = {}
 
-def ws_tool(name):
+class ToolArgumentError(ValueError):
+    pass
+
+
+def _type_name(tp) -> str:
+    return tp.__name__ if isinstance(tp, type) else str(tp).replace('typing.', '')
+
+
+class ToolSpec:
+    """注册时预编译的工具调用信息：参数名、默认值和 pydantic 校验器，请求路径上不再做反射。"""
+
+    __slots__ = ('name', 'func', 'streaming', 'max_concurrency', 'names', 'required', 'defaults', 'hints',
+                 'validator', 'description')
+
+    def __init__(self, name: str, func, max_concurrency: Optional[int] = None):
+        self.name = name
+        self.func = func
+        # 该工具同时执行的上限（跨所有连接），None 表示只受全局上限约束
+        self.max_concurrency = max_concurrency
+        # async generator 工具：每个 yield 作为一个 chunk 帧发送，结束时发送 end 帧
+        self.streaming = inspect.isasyncgenfunction(func)
+        hints = typing.get_type_hints(func)
+        params = [p for p in inspect.signature(func).parameters.values()
+                  if p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD)]
+        self.names = tuple(p.name for p in params)
+        self.required = tuple(p.name for p in params if p.default is p.empty)
+        self.defaults = {p.name: p.default for p in params if p.default is not p.empty}
+        self.hints = {p.name: hints.get(p.name, Any) for p in params}
+        fields = {n: (Required if n in self.required else NotRequired)[t] for n, t in self.hints.items()}
+        # 只校验请求中实际出现的参数，缺省值仍由函数自身提供
+        args_type = TypedDict(f"{name}_args", fields)
+        args_type.__pydantic_config__ = ConfigDict(arbitrary_types_allowed=True)
+        self.validator = TypeAdapter(args_type)
+        self.description = inspect.getdoc(func) or ''
+
+    def bind(self, source: dict) -> dict:
+        """从请求中取出本工具的参数并一次性完成类型转换（如 "101010100" -> int），不合法时抛 ToolArgumentError。"""
+        kwargs = {k: source[k] for k in self.names if k in source}
+        try:
+            return self.validator.validate_python(kwargs)
+        except ValidationError as e:
+            details = '; '.join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            raise ToolArgumentError(f"{self.name} 参数错误: {details}") from None
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "description": self.description,
+            "streaming": self.streaming,
+            "max_concurrency": self.max_concurrency,
+            "params": [
+                {
+                    "name": n,
+                    "type": _type_name(self.hints[n]),
+                    "required": n in self.required,
+                    **({"default": self.defaults[n]} if n in self.defaults else {}),
+                }
+                for n in self.names
+            ],
+            "input_schema": self.validator.json_schema(),
+        }
+
+
+WS_TOOL_REGISTRY: Dict[str, ToolSpec] = {}
+
+def ws_tool(name, max_concurrency: Optional[int] = None):
     def decorator(func):
-        WS_TOOL_REGISTRY[name] = func
+        WS_TOOL_REGISTRY[name] = ToolSpec(name, func, max_concurrency)
+        ws_metrics.register(name)
         return func
     return decorator
 
-async def ws_endpoint(ws: WebSocket, logger=None):
-    await ws.accept()
-    if logger:
-        logger.info("WebSocket connection accepted")
-    while True:
-        try:
-            data = await ws.receive_text()
-            if logger:
-                logger.info(f"Received data: {data}")
-            req = json.loads(data)
-            func = req.get('func')
-            handler = WS_TOOL_REGISTRY.get(func)
-            if handler:
-                sig = inspect.signature(handler)
-                # 优先从 params 字段取参数，否则用顶层参数
-                params_source = req.get('params', req)
-                params = {k: params_source[k] for k in sig.parameters if k in params_source}
-                result = await handler(**params)
+@ws_tool('list_tools')
+async def list_tools() -> list:
+    """列出当前服务注册的全部工具及其参数。"""
+    return [spec.describe() for spec in WS_TOOL_REGISTRY.values()]
+
+# 单个连接上同时执行的请求数上限，达到上限后暂停读取新消息
+WS_MAX_CONCURRENCY = int(os.environ.get("WS_MAX_CONCURRENCY", 16))
+# 准入控制（进程内所有连接共享）：同时执行的请求上限、等待队列长度、同时在线的连接数上限
+WS_GLOBAL_CONCURRENCY = int(os.environ.get("WS_GLOBAL_CONCURRENCY", 64))
+WS_QUEUE_SIZE = int(os.environ.get("WS_QUEUE_SIZE", 256))
+WS_MAX_CONNECTIONS = int(os.environ.get("WS_MAX_CONNECTIONS", 256))
+# 请求未携带 deadline_ms 时使用的默认截止时间（毫秒），0 表示不限
+WS_DEFAULT_DEADLINE_MS = float(os.environ.get("WS_DEFAULT_DEADLINE_MS", 0))
+
+admission = AdmissionController(WS_GLOBAL_CONCURRENCY, WS_QUEUE_SIZE)
+_connections = 0
+
+@ws_tool('ping')
+async def ping() -> dict:
+    """健康检查：服务存活且事件循环可以处理请求。"""
+    return {"ok": True}
+
+@ws_tool('admission_stats')
+async def admission_stats() -> dict:
+    """当前连接数、排队数、拒绝数及各工具的并发上限与平均耗时。"""
+    return {"connections": _connections, "max_connections": WS_MAX_CONNECTIONS, **admission.stats()}
+
+@ws_tool('set_log_level')
+async def set_log_level(level: str, logger: Optional[str] = None, sample_rate: Optional[float] = None) -> dict:
+    """运行时调整日志级别（logger 为空时调整根 logger）及请求级日志抽样率（0~1）。"""
+    return ws_logging.set_level(level, logger, sample_rate)
+
+@ws_tool('log_status')
+async def log_status(logger: Optional[str] = None) -> dict:
+    """当前日志级别、抽样率及日志队列积压 / 丢弃数。"""
+    return ws_logging.status(logger)
+
+@ws_tool('metrics')
+async def metrics() -> dict:
+    """各工具的调用数、错误数、被拒绝数、进行中数，以及总耗时和各阶段耗时的 p50/p95/p99（毫秒）。"""
+    return {"connections": _connections, "tools": ws_metrics.snapshot()}
+
+def add_metrics_route(app: FastAPI, path: str = "/metrics"):
+    """在服务的 FastAPI 应用上挂载 Prometheus 文本格式的指标路由。"""
+    @app.get(path, include_in_schema=False)
+    async def prometheus_metrics():
+        gauges = {
+            "ws_connections": _connections,
+            "ws_admission_waiting": admission.waiting,
+            "ws_log_queued": ws_logging.status()["queued"],
+        }
+        return PlainTextResponse(ws_metrics.render_prometheus(gauges), media_type="text/plain; version=0.0.4")
+
+def _request_deadline(req: dict) -> Optional[float]:
+    # deadline_ms 为客户端剩余的时间预算，换算成本进程事件循环时间上的截止点；
+    # 显式的 0 表示预算已用完，只有未带该字段时才用默认值（默认值 0 表示不限时）
+    budget_ms = req.get('deadline_ms')
+    if budget_ms is None:
+        budget_ms = WS_DEFAULT_DEADLINE_MS
+        if not budget_ms:
+            return None
+    return asyncio.get_running_loop().time() + float(budget_ms) / 1000
+
+def _error_response(e: Exception) -> dict:
+    if isinstance(e, BusyError):
+        return {'error': str(e), 'busy': True, 'retry_after': e.retry_after}
+    return {'error': str(e)}
+
+async def _call_tool(req: dict, logger=None, emit=None):
+    """执行一次工具调用并返回应答。流式工具传入 emit 时每个 chunk 调用一次 emit，最后返回 end 应答。
+
+    logger 为 None 表示该请求未被日志抽中，不记录请求级日志。
+    """
+    func = req.get('func')
+    spec = WS_TOOL_REGISTRY.get(func)
+    if not spec:
+        if logger:
+            logger.warning("Unknown function: %s", preview(func))
+        return {'error': 'Unknown function'}
+    # 优先从 params 字段取参数，否则用顶层参数；参数不合法的请求不进入排队
+    params = spec.bind(req.get('params', req))
+    with ws_metrics.track(spec.name) as tool_metrics:
+        queued_at = time.perf_counter()
+        async with admission.admit(spec.name, spec.max_concurrency, _request_deadline(req)):
+            ws_metrics.record_span('queue', time.perf_counter() - queued_at)
+            if spec.streaming and emit is not None:
+                count = 0
+                async for item in spec.func(**params):
+                    await emit(item)
+                    count += 1
                 if logger:
-                    logger.info(f"{func} result: {result}")
-                await ws.send_text(json.dumps({'result': result}))
+                    logger.info("%s streamed %d chunks", func, count,
+                                extra={'tool': func, 'req_id': req.get('id'), 'count': count})
+                return {'end': True, 'count': count}
+            if spec.streaming:
+                # 不带 id 的旧协议无法区分分块应答，收齐后一次返回
+                result = [item async for item in spec.func(**params)]
             else:
-                if logger:
-                    logger.warning(f"Unknown function: {func}")
-                await ws.send_text(json.dumps({'error': 'Unknown function'}))
-        except WebSocketDisconnect:
-            if logger:
-                logger.info("WebSocket disconnected")
-            break
+                result = await spec.func(**params)
+        # 工具按约定以 {"error": ...} 返回的失败同样计入错误数
+        if isinstance(result, dict) and 'error' in result:
+            tool_metrics.errors += 1
+    if logger:
+        logger.info("%s result: %s", func, preview(result), extra={'tool': func, 'req_id': req.get('id')})
+    return {'result': result}
+
+async def ws_endpoint(ws: WebSocket, logger=None, max_concurrency: int = WS_MAX_CONCURRENCY):
+    """WebSocket 工具调用入口。
+
+    请求带 id 时作为独立任务并发执行，应答带回同一个 id，可乱序返回；
+    不带 id 的请求保持旧行为，按到达顺序逐条执行并应答。
+    流式工具（async generator）对带 id 的请求逐条发送 {id, chunk} 帧，最后发送 {id, end: true, count}；
+    中途出错时以 {id, error} 结束。
+    握手时声明 rag.msgpack 子协议的连接以 msgpack 二进制帧应答，否则使用 JSON 文本帧。
+    所有请求经过准入控制：排队已满时立即应答 {error, busy: true, retry_after}；
+    请求可带 deadline_ms，超过截止时间仍在排队或执行的请求会被放弃。
+    """
+    global _connections
+    if _connections >= WS_MAX_CONNECTIONS:
+        # 1013: Try Again Later
+        await ws.close(code=1013)
+        if logger:
+            logger.warning("连接数已达上限 %d，拒绝新连接", WS_MAX_CONNECTIONS)
+        return
+    _connections += 1
+    try:
+        await _serve_connection(ws, logger, max_concurrency)
+    finally:
+        _connections -= 1
+
+async def _serve_connection(ws: WebSocket, logger, max_concurrency: int):
+    codec = negotiate(ws.scope.get('subprotocols', []))
+    await ws.accept(subprotocol=codec.subprotocol)
+    if logger:
+        logger.info("WebSocket connection accepted, encoding=%s", 'msgpack' if codec.binary else 'json')
+    send_lock = asyncio.Lock()
+    slots = asyncio.Semaphore(max_concurrency)
+    tasks = set()
+
+    async def reply(message: dict, tool: Optional[str] = None):
+        # 编码耗时记为 serialize 阶段；流式 chunk 在工具执行上下文中发送，tool 为空时记到当前工具
+        start = time.perf_counter()
+        data = codec.dumps(message)
+        ws_metrics.record_span('serialize', time.perf_counter() - start, tool)
+        async with send_lock:
+            if codec.binary:
+                await ws.send_bytes(data)
+            else:
+                await ws.send_text(data)
+
+    async def run(req: dict, req_logger):
+        req_id = req['id']
+
+        async def emit(item):
+            await reply({'id': req_id, 'chunk': item})
+
+        try:
+            response = await _call_tool(req, req_logger, emit)
         except Exception as e:
             if logger:
-                logger.error(f"Error handling request: {e}", exc_info=True)
+                if isinstance(e, BusyError):
+                    logger.warning("Request %s rejected: %s", req_id, e, extra={'req_id': req_id})
+                else:
+                    logger.error("Error handling request %s: %s", req_id, e, exc_info=True, extra={'req_id': req_id})
+            response = _error_response(e)
+        finally:
+            slots.release()
+        try:
+            await reply({'id': req_id, **response}, req.get('func'))
+        except Exception:
+            pass
+
+    try:
+        while True:
             try:
-                await ws.send_text(json.dumps({'error': str(e)}))
-            except Exception:
-                pass
+                message = await ws.receive()
+                if message['type'] == 'websocket.disconnect':
+                    raise WebSocketDisconnect(message.get('code', 1000))
+                data = message.get('bytes') if message.get('text') is None else message['text']
+                # 每个请求抽样一次，被抽中的请求记录收到的帧和结果（均截断）
+                req_logger = logger if ws_logging.sampled(logger) else None
+                if req_logger:
+                    req_logger.info("Received data: %s", preview(data))
+                start = time.perf_counter()
+                req = decode_frame(data)
+                ws_metrics.record_span('decode', time.perf_counter() - start, req.get('func'))
+                if req.get('id') is None:
+                    await reply(await _call_tool(req, req_logger), req.get('func'))
+                    continue
+                await slots.acquire()
+                task = asyncio.create_task(run(req, req_logger))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            except WebSocketDisconnect:
+                if logger:
+                    logger.info("WebSocket disconnected")
+                break
+            except Exception as e:
+                if logger:
+                    logger.error("Error handling request: %s", e, exc_info=True)
+                try:
+                    await reply(_error_response(e))
+                except Exception:
+                    pass
+    finally:
+        # 连接断开后不再需要进行中的请求结果
+        for task in tasks:
+            task.cancel()
+